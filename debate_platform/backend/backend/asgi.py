@@ -8,20 +8,22 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
-# Assume you will create debates/routing.py next
-import debates.routing 
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
+# Set Django up before importing anything that loads models
+django_asgi_app = get_asgi_application()
+
+import debates.routing  # noqa: E402
+from zag_debate_platform.middleware import TokenAuthMiddlewareStack  # noqa: E402
+
 # The main router for the project
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(), # Standard HTTP handling (for DRF)
-    # WebSocket handling
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app, # Standard HTTP handling (for DRF)
+    # WebSocket handling: the JWT in ?token= (resolved through the auth caches) sets scope['user']
+    "websocket": TokenAuthMiddlewareStack(
         # The URLRouter will look for definitions in debates/routing.py
         URLRouter(
             debates.routing.websocket_urlpatterns 
@@ -0,0 +1,305 @@
+"""
+Partition-aware channel layer: each debate has an owner worker, chosen by a
+consistent hash ring over the configured shards, and messages between members
+of the same worker never leave the process.
+
+ShardedChannelLayer wraps a network layer (the Redis layer in production):
+
+* Channels are created in-process (``<prefix>.<worker>!<id>``); a send to a
+  local channel is a queue put, a send to another worker's channel is one
+  network message to that worker's inbox.
+* Group membership is kept per worker. A worker that is not a group's owner
+  registers with the owner the first time it gets a local member, and renews
+  that registration every refresh_seconds (so it survives an owner restart).
+  group_discard of another worker's channel (e.g. from the stale connection
+  reaper, which runs in its own process) is forwarded to that worker.
+* group_send delivers to the local members, then: on the owner, one network
+  message per registered remote worker; elsewhere, one message to the owner,
+  which fans it out further. When clients are routed to their debate's owner
+  (see the debate shard endpoint), a room's traffic stays inside one process.
+* Like the network layers, local messages expire after ``expiry`` seconds
+  unread. A channel nobody has read for that long is dropped together with
+  its group memberships, and so is the channel of a cancelled receive.
+"""
+import asyncio
+import bisect
+import hashlib
+import os
+import random
+import re
+import socket
+import string
+import time
+from collections import Counter, defaultdict
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, get_channel_layer
+from django.utils.module_loading import import_string
+
+DEBATE_GROUP = re.compile(r'^debate_(\d+)')
+
+
+class HashRing:
+    """Consistent hashing with virtual nodes: adding a shard moves only ~1/N of the keys."""
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = sorted(set(nodes))
+        self._ring = sorted(
+            (self._hash(f'{node}#{replica}'), node) for node in self.nodes for replica in range(replicas)
+        )
+        self._keys = [point for point, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def owner(self, key):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def shard_key(group):
+    """Every group of a debate (chat, stage, ...) maps to the debate's id, so they share an owner."""
+    match = DEBATE_GROUP.match(group)
+    return match.group(1) if match else group
+
+
+class ShardedChannelLayer(BaseChannelLayer):
+    extensions = ['groups', 'flush']
+
+    def __init__(self, inner, shards=(), worker_id=None, refresh_seconds=30, capacity=100, expiry=60, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        # A CHANNEL_LAYERS-style entry, or a layer instance (workers simulated in one process share it)
+        if isinstance(inner, dict):
+            inner = import_string(inner['BACKEND'])(**inner.get('CONFIG', {}))
+        self.inner = inner
+        self.worker_id = re.sub(r'[^a-zA-Z0-9\-_]', '-', worker_id or f'{socket.gethostname()}-{os.getpid()}')
+        self.ring = HashRing(shards or [self.worker_id])
+        self.refresh_seconds = refresh_seconds
+        self.inbox = self.inbox_for(self.worker_id)
+        # channel -> queue of (time sent, message)
+        self.queues = {}
+        # channel -> when its last receive ended, for channels not being read right now
+        self.idle_since = {}
+        # group -> local channel names
+        self.local_groups = defaultdict(set)
+        # group -> {worker: registration time}, kept by the group's owner
+        self.remote_workers = defaultdict(dict)
+        self.stats = Counter()
+        self._pump = None
+        self._refresher = None
+
+    @staticmethod
+    def inbox_for(worker_id):
+        return f'shard.inbox.{worker_id}'
+
+    def owner_of(self, group):
+        return self.ring.owner(shard_key(group))
+
+    def _start(self):
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._pump_inbox())
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_registrations())
+
+    # --- Channels ---
+
+    async def new_channel(self, prefix='specific'):
+        self._start()
+        suffix = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
+        channel = f'{prefix}.{self.worker_id}!{suffix}'
+        self.queues[channel] = asyncio.Queue()
+        self.idle_since[channel] = time.monotonic()
+        return channel
+
+    def _worker_of(self, channel):
+        # '<prefix>.<worker>!<id>': the worker is the last dotted part before the '!'
+        if '!' not in channel:
+            return None
+        return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+    async def send(self, channel, message):
+        assert self.valid_channel_name(channel)
+        if channel in self.queues:
+            self._put_local(channel, message, strict=True)
+            return
+        worker = self._worker_of(channel)
+        if worker is None or worker == self.worker_id:
+            # A channel of this worker that already went away, or not one of ours at all
+            if worker is None:
+                await self.inner.send(channel, message)
+            return
+        self.stats['network_sends'] += 1
+        await self.inner.send(self.inbox_for(worker), {'type': 'shard.deliver', 'channel': channel, 'message': message})
+
+    def _put_local(self, channel, message, strict=False):
+        queue = self.queues.get(channel)
+        if queue is None:
+            return
+        if queue.qsize() >= self.capacity:
+            if strict:
+                raise ChannelFull(channel)
+            self.stats['dropped'] += 1
+            return
+        queue.put_nowait((time.monotonic(), message))
+        self.stats['local_deliveries'] += 1
+
+    async def receive(self, channel):
+        queue = self.queues.get(channel)
+        if queue is None:
+            if self._worker_of(channel) is None:
+                return await self.inner.receive(channel)
+            queue = self.queues[channel] = asyncio.Queue()
+        self.idle_since.pop(channel, None)
+        try:
+            while True:
+                sent_at, message = await queue.get()
+                if time.monotonic() - sent_at <= self.expiry:
+                    return message
+                self.stats['expired'] += 1
+        except asyncio.CancelledError:
+            # The consumer went away and nobody reads this channel again
+            self._drop_channel(channel)
+            raise
+        finally:
+            if channel in self.queues:
+                self.idle_since[channel] = time.monotonic()
+
+    def _drop_channel(self, channel):
+        self.queues.pop(channel, None)
+        self.idle_since.pop(channel, None)
+
+    async def _expire_channels(self):
+        """Drops the channels of this worker that nobody has read for ``expiry`` seconds."""
+        cutoff = time.monotonic() - self.expiry
+        expired = {channel for channel, since in self.idle_since.items() if since < cutoff}
+        for channel in expired:
+            self._drop_channel(channel)
+            self.stats['expired_channels'] += 1
+        for group, members in list(self.local_groups.items()):
+            for channel in members & expired:
+                await self.group_discard(group, channel)
+
+    # --- Groups ---
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group)
+        members = self.local_groups[group]
+        first = not members
+        members.add(channel)
+        owner = self.owner_of(group)
+        if first and owner != self.worker_id:
+            await self._register(group, owner, True)
+
+    async def group_discard(self, group, channel):
+        worker = self._worker_of(channel)
+        if worker is not None and worker != self.worker_id:
+            # Membership lives in the channel's own worker
+            self.stats['network_sends'] += 1
+            try:
+                await self.inner.send(self.inbox_for(worker), {'type': 'shard.discard', 'group': group, 'channel': channel})
+            except ChannelFull:
+                # A worker that stopped draining its inbox is gone, and its groups with it
+                self.stats['dropped'] += 1
+            return
+        members = self.local_groups.get(group)
+        if not members or channel not in members:
+            return
+        members.discard(channel)
+        if not members:
+            del self.local_groups[group]
+            owner = self.owner_of(group)
+            if owner != self.worker_id:
+                await self._register(group, owner, False)
+
+    async def _register(self, group, owner, subscribe):
+        self.stats['registrations'] += 1
+        await self.inner.send(self.inbox_for(owner), {
+            'type': 'shard.subscribe' if subscribe else 'shard.unsubscribe',
+            'group': group,
+            'worker': self.worker_id,
+        })
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group)
+        self._deliver_to_group(group, message)
+        owner = self.owner_of(group)
+        if owner == self.worker_id:
+            await self._fan_out(group, message, origin=self.worker_id)
+        else:
+            self.stats['network_sends'] += 1
+            await self.inner.send(self.inbox_for(owner), {
+                'type': 'shard.group', 'group': group, 'message': message, 'origin': self.worker_id,
+            })
+
+    def _deliver_to_group(self, group, message):
+        for channel in self.local_groups.get(group, ()):
+            self._put_local(channel, message)
+
+    async def _fan_out(self, group, message, origin):
+        """Owner side: one network message per other worker with members of the group."""
+        cutoff = time.monotonic() - 3 * self.refresh_seconds
+        workers = self.remote_workers.get(group, {})
+        for worker, registered_at in list(workers.items()):
+            if registered_at < cutoff:
+                del workers[worker]
+            elif worker != origin:
+                self.stats['network_sends'] += 1
+                await self.inner.send(self.inbox_for(worker), {
+                    'type': 'shard.group', 'group': group, 'message': message, 'origin': self.worker_id,
+                })
+
+    # --- Worker inbox ---
+
+    async def _pump_inbox(self):
+        while True:
+            envelope = await self.inner.receive(self.inbox)
+            kind = envelope['type']
+            if kind == 'shard.deliver':
+                self._put_local(envelope['channel'], envelope['message'])
+            elif kind == 'shard.group':
+                self._deliver_to_group(envelope['group'], envelope['message'])
+                if self.owner_of(envelope['group']) == self.worker_id:
+                    await self._fan_out(envelope['group'], envelope['message'], origin=envelope['origin'])
+            elif kind == 'shard.subscribe':
+                self.remote_workers[envelope['group']][envelope['worker']] = time.monotonic()
+            elif kind == 'shard.unsubscribe':
+                self.remote_workers[envelope['group']].pop(envelope['worker'], None)
+            elif kind == 'shard.discard':
+                await self.group_discard(envelope['group'], envelope['channel'])
+
+    async def _refresh_registrations(self):
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            await self._expire_channels()
+            for group in list(self.local_groups):
+                owner = self.owner_of(group)
+                if owner != self.worker_id:
+                    await self._register(group, owner, True)
+
+    # --- Housekeeping ---
+
+    async def flush(self):
+        self.queues.clear()
+        self.idle_since.clear()
+        self.local_groups.clear()
+        self.remote_workers.clear()
+        if hasattr(self.inner, 'flush'):
+            await self.inner.flush()
+
+    async def close(self):
+        for task in (self._pump, self._refresher):
+            if task is not None:
+                task.cancel()
+        if hasattr(self.inner, 'close'):
+            await self.inner.close()
+
+
+def debate_shard(debate_id):
+    """The worker that owns ``debate_id``, or None when the channel layer isn't sharded."""
+    layer = get_channel_layer()
+    if isinstance(layer, ShardedChannelLayer):
+        return layer.ring.owner(str(debate_id))
+    return None
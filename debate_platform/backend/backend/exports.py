@@ -0,0 +1,197 @@
+"""
+Streaming CSV / JSONL exports of large tables (the ledger, chat logs).
+
+iter_rows() walks a queryset in primary-key order one keyset page at a time
+(``WHERE id > last ORDER BY id LIMIT page``) and reads each page with
+``.iterator(chunk_size=...)`` as plain tuples, so at most a page is held on
+either side of the connection and no transaction stays open across the whole
+export. Rows are encoded as they are produced, which keeps memory flat for a
+ledger of any size whether the output goes to a StreamingHttpResponse or a file.
+
+Under ASGI a StreamingHttpResponse drains a sync iterator into a list before
+sending anything, so there export_response() streams from aencode_pages()
+instead: an async generator that reads each page in a worker thread and yields
+it encoded as one chunk.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+OUTPUT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+PAGE_SIZE = 10000
+CHUNK_SIZE = 2000
+
+
+def parse_bound(value, end=False):
+    """
+    An aware datetime from an ISO date or datetime. A bare date means the
+    start of that day, or with ``end`` the start of the next one (exclusive).
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value!r}")
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_export(queryset, since=None, until=None, debate=None, types=None, type_field=None):
+    """Applies the export filters shared by the API and export_records; raises ValueError on bad input."""
+    if since:
+        queryset = queryset.filter(timestamp__gte=parse_bound(since))
+    if until:
+        queryset = queryset.filter(timestamp__lt=parse_bound(until, end=True))
+    if debate:
+        try:
+            queryset = queryset.filter(debate_id=int(debate))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid debate id: {debate!r}")
+    if types and type_field:
+        queryset = queryset.filter(**{f'{type_field}__in': [t.strip().upper() for t in types.split(',')]})
+    return queryset
+
+
+def _page(queryset, fields, last_pk, page_size):
+    """(pk, *fields) tuples of the ``page_size`` rows after ``last_pk``."""
+    page = queryset.order_by('pk')
+    if last_pk is not None:
+        page = page.filter(pk__gt=last_pk)
+    return page.values_list('pk', *fields)[:page_size]
+
+
+def iter_rows(queryset, fields, page_size=PAGE_SIZE, chunk_size=CHUNK_SIZE):
+    """Yields ``fields`` tuples of every row of ``queryset`` in primary-key order."""
+    last_pk = None
+    while True:
+        count = 0
+        for row in _page(queryset, fields, last_pk, page_size).iterator(chunk_size=chunk_size):
+            count += 1
+            last_pk = row[0]
+            yield row[1:]
+        if count < page_size:
+            return
+
+
+class _Echo:
+    """csv.writer target that hands each encoded line back instead of buffering it."""
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+# Leading characters that make spreadsheet apps evaluate a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    # Only text can carry user input (chat, usernames, references); numbers keep their sign
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _plain(value)
+
+
+def _encoder(fields, output):
+    """The header line of ``output`` ('' for none) and its function encoding one row tuple."""
+    if output == 'csv':
+        writer = csv.writer(_Echo())
+        return writer.writerow(fields), lambda row: writer.writerow([_csv_cell(value) for value in row])
+    return '', lambda row: json.dumps(dict(zip(fields, map(_plain, row))), separators=(',', ':')) + '\n'
+
+
+def encode_rows(rows, fields, output):
+    """
+    Encodes row tuples as CSV (with a header line) or JSON Lines, one string per
+    row. CSV text cells that a spreadsheet would run as a formula are prefixed
+    with a quote.
+    """
+    header, encode = _encoder(fields, output)
+    if header:
+        yield header
+    for row in rows:
+        yield encode(row)
+
+
+async def aencode_pages(queryset, columns, output, page_size=PAGE_SIZE):
+    """Async counterpart of encode_rows(iter_rows(...)): one encoded chunk per keyset page."""
+    header, encode = _encoder(list(columns), output)
+    if header:
+        yield header
+    fields = list(columns.values())
+    read_page = sync_to_async(lambda last_pk: list(_page(queryset, fields, last_pk, page_size)))
+    last_pk = None
+    while True:
+        rows = await read_page(last_pk)
+        if rows:
+            last_pk = rows[-1][0]
+            yield ''.join(encode(row[1:]) for row in rows)
+        if len(rows) < page_size:
+            return
+
+
+def export_response(queryset, columns, output, filename, asynchronous=False, page_size=PAGE_SIZE):
+    """
+    StreamingHttpResponse that downloads ``queryset`` as ``<filename>.<output>``;
+    ``columns`` maps header to field. Pass ``asynchronous`` when serving under ASGI.
+    """
+    if asynchronous:
+        content = aencode_pages(queryset, columns, output, page_size=page_size)
+    else:
+        content = encode_rows(iter_rows(queryset, list(columns.values()), page_size=page_size), list(columns), output)
+    response = StreamingHttpResponse(content, content_type=OUTPUT_TYPES[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
+
+
+class StreamingExportView(APIView):
+    """
+    Staff-only streaming download of a table. Query parameters: output=csv|jsonl
+    (``format`` is taken by DRF), since/until (ISO date or datetime, until is
+    inclusive for dates), debate=<id>, and type=<code>[,<code>] where the
+    table has a type column.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    queryset = None
+    columns = {}
+    filename = 'export'
+    type_field = None
+
+    def get(self, request):
+        params = request.query_params
+        output = params.get('output', 'csv')
+        if output not in OUTPUT_TYPES:
+            return Response({"detail": f"output must be one of: {', '.join(OUTPUT_TYPES)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = filter_export(
+                self.queryset.all(), since=params.get('since'), until=params.get('until'),
+                debate=params.get('debate'), types=params.get('type'), type_field=self.type_field,
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(
+            queryset, self.columns, output, self.filename,
+            asynchronous=isinstance(request._request, ASGIRequest),
+        )
@@ -0,0 +1,126 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first keyset pagination on a (timestamp, id) pair.
+
+    The cursor carries the last row's timestamp and id, and the next page is
+    fetched with ``WHERE (ts, id) < (cursor_ts, cursor_id)``. Backed by a
+    composite index on the same columns, every page costs the same as the
+    first one instead of growing with an OFFSET scan.
+
+    Setting ``reverse_cursor_query_param`` also allows paging towards newer
+    rows (``WHERE (ts, id) > cursor``) and adds a ``previous`` link.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    reverse_cursor_query_param = None
+    # Subclasses set the timestamp column; 'id' is the tie-breaker
+    timestamp_field = 'created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        reverse_encoded = None
+        if self.reverse_cursor_query_param:
+            reverse_encoded = request.query_params.get(self.reverse_cursor_query_param)
+        if reverse_encoded:
+            return self._paginate_newer(queryset, reverse_encoded)
+
+        queryset = queryset.order_by(f'-{self.timestamp_field}', '-id')
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            timestamp, pk = self.decode_cursor(encoded)
+            queryset = queryset.filter(
+                Q(**{f'{self.timestamp_field}__lt': timestamp})
+                | Q(**{self.timestamp_field: timestamp, 'id__lt': pk})
+            )
+
+        # Fetch one extra row to find out whether a next page exists
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.has_previous = bool(encoded) and self.reverse_cursor_query_param is not None
+        self.page = results[:self.page_size]
+        return self.page
+
+    def _paginate_newer(self, queryset, encoded):
+        """Rows directly after the cursor, still returned newest-first."""
+        timestamp, pk = self.decode_cursor(encoded)
+        queryset = queryset.order_by(self.timestamp_field, 'id').filter(
+            Q(**{f'{self.timestamp_field}__gt': timestamp})
+            | Q(**{self.timestamp_field: timestamp, 'id__gt': pk})
+        )
+        results = list(queryset[:self.page_size + 1])
+        self.has_previous = len(results) > self.page_size
+        # The cursor row itself is older than this page
+        self.has_next = True
+        self.page = results[:self.page_size][::-1]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        timestamp = getattr(obj, self.timestamp_field)
+        raw = json.dumps([timestamp.isoformat(), obj.pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        try:
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                raise ValueError(encoded)
+            return timestamp, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.reverse_cursor_query_param:
+            url = remove_query_param(url, self.reverse_cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return replace_query_param(url, self.reverse_cursor_query_param, self.encode_cursor(self.page[0]))
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link()}
+        if self.reverse_cursor_query_param:
+            response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        link = {'type': 'string', 'nullable': True, 'format': 'uri'}
+        properties = {'next': link}
+        if self.reverse_cursor_query_param:
+            properties['previous'] = link
+        properties['results'] = schema
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': properties,
+        }
@@ -127,6 +127,99 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Partition-aware mode (backend/channel_layers.py): list every ASGI worker in CHANNEL_SHARDS
+# and give each its own CHANNEL_SHARD_ID. Each debate then has an owner worker, members on
+# the same worker are served in-process, and Redis only carries cross-worker traffic.
+if os.environ.get('CHANNEL_SHARDS'):
+    CHANNEL_LAYERS['default'] = {
+        'BACKEND': 'backend.channel_layers.ShardedChannelLayer',
+        'CONFIG': {
+            'inner': CHANNEL_LAYERS['default'],
+            'shards': os.environ['CHANNEL_SHARDS'].split(','),
+            'worker_id': os.environ.get('CHANNEL_SHARD_ID'),
+        },
+    }
+
+# Write-behind persistence of chat messages (debates/chat_buffer.py)
+CHAT_WRITE_BUFFER = {
+    'FLUSH_INTERVAL_MS': 250, # Flush at least this often while messages are pending
+    'MAX_BATCH': 200,         # ...or as soon as this many are waiting (also the bulk_create batch size)
+    'MAX_PENDING': 5000,      # Per-worker memory bound
+    'MAX_RETRY_INTERVAL_MS': 10000, # Failed flushes are retried with backoff up to this interval
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Per-room chat sequence numbers and the replay store. Process-local unless REDIS_URL is set,
+    # which is only correct for a single ASGI worker (development, tests).
+    'realtime': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'realtime',
+    },
+}
+# Deployments with several ASGI workers must share it
+if os.environ.get('REDIS_URL'):
+    CACHES['realtime'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Session resume (debates/replay.py): chat frames kept for clients reconnecting with resume_from=<seq>
+ROOM_REPLAY = {
+    'SIZE': 500,         # Most recent sequence numbers per room that can be replayed
+    'TTL_SECONDS': 600,  # How long a frame stays replayable
+    'CACHE_ALIAS': 'realtime',
+}
+
+# Per-worker ring buffer of recent chat pushed to clients on connect (debates/room_history.py)
+ROOM_HISTORY = {
+    'SIZE': 50,  # Chat events kept per room; a room is dropped when its last local member leaves
+}
+
+# Chat batching for debates with chat_batching enabled (debates/chat_batcher.py)
+CHAT_BATCHING = {
+    'MIN_INTERVAL_MS': 10,       # Shortest hold once a room is busy
+    'MAX_INTERVAL_MS': 50,       # Upper bound on the latency batching adds
+    'TARGET_BATCH': 8,           # Messages per frame the interval aims for
+    'MAX_BATCH': 100,            # A batch this large is sent without waiting
+    'IMMEDIATE_BELOW_RATE': 5,   # Messages/s under which lines are sent one by one
+    'RATE_WINDOW_S': 1.0,        # Time constant of the room's decayed message rate
+}
+
+# Coalesced room presence (debates/presence.py): roster diffs are written and broadcast at most once per interval
+PRESENCE = {
+    'FLUSH_INTERVAL_MS': 300,
+    'TOUCH_INTERVAL_S': 60, # Workers refresh last_seen of their live connections this often
+    'STALE_AFTER_S': 180,   # `manage.py reap_connections` drops rows not refreshed for this long
+}
+
+# Process-local caches for WebSocket auth (zag_debate_platform/middleware.py, debates/caches.py).
+# Saves and deletes invalidate them in-process; the TTLs bound staleness for changes made by
+# other processes and for QuerySet.update()/bulk_update(), which send no signals.
+WS_AUTH_CACHE = {
+    'TOKEN_TTL': 300,     # Decoded JWTs (never beyond the token's own expiry)
+    'USER_TTL': 60,       # User rows
+    'DEBATE_TTL': 30,     # Debate open/closed status
+    'MAX_ENTRIES': 10000, # Per cache, least recently used evicted first
+}
+
+# Per-connection flow control for DebateConsumer (debates/throttling.py)
+WS_RATE_LIMITS = {
+    # command: (tokens per second, burst)
+    'send_chat': (5, 10),
+    'video_signal': (50, 200),
+    'subscribe': (2, 20), # Shared with 'unsubscribe'
+}
+WS_FLOOD_LIMIT = (1, 20) # Throttled commands tolerated before closing with 4008
+WS_OUTBOX_SIZE = 256     # Queued outbound frames per connection before chat is dropped
+WS_MAX_SUBSCRIPTIONS = 20 # Debates one multiplexed connection (ws/debates/) may follow
+WS_HEARTBEAT = {
+    'INTERVAL': 20, # Seconds between server pings
+    'TIMEOUT': 60,  # Seconds without any client frame before the connection is closed and leaves its groups
+}
+
 # --- Simple JWT Configuration ---
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), # Access tokens valid for 1 hour
@@ -148,4 +241,13 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
-}
\ No newline at end of file
+}
+# --- Stripe ---
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+# Webhook events are stored by the view and applied by process_stripe_events (payments/stripe_events.py)
+STRIPE_EVENTS = {
+    'BATCH_SIZE': 100,        # Events leased per claim
+    'LEASE_SECONDS': 300,     # A claimed batch returns to the queue if its worker dies
+    'MAX_ATTEMPTS': 8,        # Failures before an event is marked FAILED
+    'RETRY_BASE_SECONDS': 30, # Backoff after the first failure, doubled on each retry
+}
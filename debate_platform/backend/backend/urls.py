@@ -25,6 +25,8 @@ urlpatterns = [
     path('api/accounts/', include('accounts.urls')),
     path('api/debates/', include('debates.urls')),
     path('api/payments/', include('payments.urls')),
+    # Payment provider callbacks (no JWT; verified by signature)
+    path('webhooks/', include('payments.webhook_urls')),
 ]
 
 # Only for development: Serve media files like profile pictures
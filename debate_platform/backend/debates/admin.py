@@ -1,16 +1,17 @@
 from django.contrib import admin
-from .models import Debate, Message
+from .models import Debate, Message, Presence
 
 @admin.register(Debate)
 class DebateAdmin(admin.ModelAdmin):
     list_display = ('title', 'creator', 'subscription_fee', 'participant_count', 'commission_due', 'created_at')
     list_filter = ('created_at', 'subscription_fee')
     search_fields = ('title', 'creator__username')
-    readonly_fields = ('commission_due',)
-    
-    def participant_count(self, obj):
-        return obj.participants.count()
-    participant_count.short_description = 'Participants'
+    # participants change only through the join/leave paths, which keep participant_count in step
+    readonly_fields = ('commission_due', 'participant_count', 'participants')
+
+    def get_queryset(self, request):
+        # The joined revenue rollup feeds commission_due without per-row queries
+        return super().get_queryset(request).with_stats()
     
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
@@ -20,4 +21,11 @@ class MessageAdmin(admin.ModelAdmin):
     
     def content_snippet(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
-    content_snippet.short_description = 'Content'
\ No newline at end of file
+    content_snippet.short_description = 'Content'
+
+@admin.register(Presence)
+class PresenceAdmin(admin.ModelAdmin):
+    list_display = ('debate', 'user', 'channel_name', 'connected_at')
+    list_filter = ('debate',)
+    search_fields = ('user__username', 'channel_name')
+    list_select_related = ('debate', 'user')
@@ -0,0 +1,57 @@
+"""
+Seat admission for debates.
+
+Seats are taken with a single conditional UPDATE on Debate.participant_count
+(``... WHERE participant_count + seats <= max_participants``), run in its own
+short transaction. Joiners of a popular debate therefore only contend for the
+duration of that one statement instead of queueing behind each other's
+payment transactions, and the database guarantees the debate is never
+oversold. A reserved seat that doesn't end up being used must be handed back
+with release_seat().
+"""
+import time
+
+from django.db import OperationalError, transaction
+from django.db.models import F
+
+from .models import Debate
+
+# Bounded retry for lock timeouts (e.g. SQLite's "database is locked")
+RESERVE_ATTEMPTS = 3
+RESERVE_BACKOFF_SECONDS = 0.05
+
+
+def _run_with_retry(update):
+    for attempt in range(RESERVE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return update()
+        except OperationalError:
+            if attempt == RESERVE_ATTEMPTS - 1:
+                raise
+            time.sleep(RESERVE_BACKOFF_SECONDS * 2 ** attempt)
+
+
+def has_free_seat(debate):
+    """Cheap pre-check on an already loaded debate; no query, no lock."""
+    return debate.participant_count < debate.max_participants
+
+
+def reserve_seat(debate_id, seats=1):
+    """
+    Atomically takes ``seats`` seats in the debate.
+    Returns False, without waiting on anything else, if the debate is full.
+    """
+    updated = _run_with_retry(lambda: Debate.objects.filter(
+        pk=debate_id,
+        participant_count__lte=F('max_participants') - seats,
+    ).update(participant_count=F('participant_count') + seats))
+    return updated == 1
+
+
+def release_seat(debate_id, seats=1):
+    """Gives back seats taken by reserve_seat() that were not used."""
+    _run_with_retry(lambda: Debate.objects.filter(
+        pk=debate_id,
+        participant_count__gte=seats,
+    ).update(participant_count=F('participant_count') - seats))
@@ -0,0 +1,40 @@
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from backend.cache import TTLCache
+from .models import Debate
+
+_cache_settings = getattr(settings, 'WS_AUTH_CACHE', {})
+# debate id (as routed, a string) -> {'status', 'room_mode', 'chat_batching', 'creator_id'}, or None if the debate doesn't exist
+debate_state_cache = TTLCache(
+    maxsize=_cache_settings.get('MAX_ENTRIES', 10000), ttl=_cache_settings.get('DEBATE_TTL', 30)
+)
+
+
+# Only instance saves and deletes send these signals. QuerySet.update() and bulk_update()
+# don't, so a status, room_mode, chat_batching or creator change written that way is seen
+# after at most DEBATE_TTL seconds (as are changes made by other processes). Write those
+# fields with save(), or call debate_state_cache.invalidate(str(pk)) after the update.
+@receiver([post_save, post_delete], sender=Debate)
+def invalidate_debate_state(sender, instance, **kwargs):
+    debate_state_cache.invalidate(str(instance.pk))
+
+
+@database_sync_to_async
+def _load_debate_state(debate_id):
+    return Debate.objects.filter(pk=debate_id).values('status', 'room_mode', 'chat_batching', 'creator_id').first()
+
+
+async def get_debate_state(debate_id):
+    """
+    Returns the debate's status, room mode, chat batching flag and creator id
+    (None if it doesn't exist), hitting the database only on a cache miss.
+    """
+    key = str(debate_id)
+    state = debate_state_cache.get(key)
+    if state is TTLCache.MISSING:
+        state = await _load_debate_state(key) if key.isdigit() else None
+        debate_state_cache.set(key, state)
+    return state
@@ -0,0 +1,129 @@
+"""
+Adaptive batching of chat broadcasts for rooms with Debate.chat_batching set.
+
+Instead of one group_send (and one WebSocket frame per client) per chat line,
+the sending worker collects a room's chat events and broadcasts them as a
+single 'chat_batch' array frame. The wait adapts to the room's message rate:
+
+* below IMMEDIATE_BELOW_RATE messages/s, or when a second message isn't
+  expected within MAX_INTERVAL_MS, every line goes out at once, so quiet
+  rooms see no added latency;
+* above it the interval aims for TARGET_BATCH messages per frame, clamped to
+  [MIN_INTERVAL_MS, MAX_INTERVAL_MS], which also bounds the added latency;
+* a batch reaching MAX_BATCH is sent without waiting for the timer.
+
+The rate is an exponentially decayed event count (time constant RATE_WINDOW_S),
+kept per room and per worker.
+"""
+import asyncio
+import math
+import time
+
+from django.conf import settings
+
+from .wire import encode_frame_list
+
+DEFAULTS = {
+    'MIN_INTERVAL_MS': 10,
+    'MAX_INTERVAL_MS': 50,
+    'TARGET_BATCH': 8,
+    'MAX_BATCH': 100,
+    'IMMEDIATE_BELOW_RATE': 5,
+    'RATE_WINDOW_S': 1.0,
+}
+
+
+class RoomBatch:
+    def __init__(self):
+        self.pending = []  # (event id, encoded chat frame)
+        self.rate = 0.0
+        self.updated = time.monotonic()
+        self.timer = None
+
+
+class ChatBatcher:
+    def __init__(self, min_interval_ms, max_interval_ms, target_batch, max_batch, immediate_below_rate, rate_window_s):
+        self.min_interval = min_interval_ms / 1000
+        self.max_interval = max_interval_ms / 1000
+        self.target_batch = target_batch
+        self.max_batch = max_batch
+        self.immediate_below_rate = immediate_below_rate
+        self.rate_window = rate_window_s
+        self.rooms = {}
+        self.stats = {'messages': 0, 'immediate': 0, 'batches': 0, 'batched_messages': 0}
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'CHAT_BATCHING', {})}
+        return cls(
+            config['MIN_INTERVAL_MS'], config['MAX_INTERVAL_MS'], config['TARGET_BATCH'],
+            config['MAX_BATCH'], config['IMMEDIATE_BELOW_RATE'], config['RATE_WINDOW_S'],
+        )
+
+    def interval_for(self, rate):
+        """Seconds to hold a room's chat at ``rate`` messages/s (0 means send at once)."""
+        if rate < self.immediate_below_rate or rate * self.max_interval < 2:
+            return 0
+        return min(self.max_interval, max(self.min_interval, self.target_batch / rate))
+
+    async def add(self, channel_layer, group_name, debate_id, event_id, text):
+        """Queues one encoded chat frame for the room's group."""
+        room = self.rooms.get(debate_id)
+        if room is None:
+            room = self.rooms[debate_id] = RoomBatch()
+        now = time.monotonic()
+        room.rate = room.rate * math.exp(-(now - room.updated) / self.rate_window) + 1 / self.rate_window
+        room.updated = now
+        self.stats['messages'] += 1
+        if self.stats['messages'] % 1000 == 0:
+            self._prune(now)
+
+        interval = self.interval_for(room.rate)
+        if interval == 0 and not room.pending:
+            self.stats['immediate'] += 1
+            await channel_layer.group_send(group_name, {
+                'type': 'debate.message',
+                'debate_id': debate_id,
+                'id': event_id,
+                'text': text,
+            })
+            return
+
+        room.pending.append((event_id, text))
+        if len(room.pending) >= self.max_batch:
+            await self.flush(channel_layer, group_name, debate_id)
+        elif room.timer is None:
+            room.timer = asyncio.get_running_loop().call_later(
+                interval, lambda: asyncio.ensure_future(self.flush(channel_layer, group_name, debate_id))
+            )
+
+    async def flush(self, channel_layer, group_name, debate_id):
+        room = self.rooms.get(debate_id)
+        if room is None:
+            return
+        if room.timer is not None:
+            room.timer.cancel()
+            room.timer = None
+        items, room.pending = room.pending, []
+        if items:
+            self.stats['batches'] += 1
+            self.stats['batched_messages'] += len(items)
+            await channel_layer.group_send(group_name, {
+                'type': 'debate.messages',
+                'debate_id': debate_id,
+                # [event id, encoded frame] pairs for the recipients' room_history
+                'items': [list(item) for item in items],
+                'text': encode_frame_list('chat_batch', 'messages', [text for _, text in items]),
+            })
+
+    def _prune(self, now):
+        # Rooms silent for several rate windows have decayed to ~0 and hold nothing
+        stale = [
+            debate_id for debate_id, room in self.rooms.items()
+            if not room.pending and now - room.updated > 10 * self.rate_window
+        ]
+        for debate_id in stale:
+            del self.rooms[debate_id]
+
+
+chat_batcher = ChatBatcher.from_settings()
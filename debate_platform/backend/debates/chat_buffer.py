@@ -0,0 +1,182 @@
+"""
+Write-behind persistence for chat messages.
+
+DebateConsumer hands every chat line to the worker's MessageWriteBuffer instead
+of writing a Message row itself. The buffer flushes with one bulk_create every
+FLUSH_INTERVAL_MS or as soon as MAX_BATCH messages are waiting, so the event
+loop never waits on a per-message database round trip.
+
+If a flush fails because the database is unavailable, the unsaved rows go back
+to the front of the queue and the flush is retried on its own timer, backing
+off from FLUSH_INTERVAL_MS up to MAX_RETRY_INTERVAL_MS, so they are written as
+soon as the database is back even if the room has gone quiet.
+
+Memory is bounded by MAX_PENDING: a sender that finds the buffer full waits for
+a flush, and if the database is down the oldest unsaved messages (those that
+already failed to write) are dropped and counted rather than growing the queue
+without limit. A message the
+database rejects outright (a deleted debate or user, bad content) is logged and
+dropped on its own, so it can't hold back the rest of its batch.
+"""
+import asyncio
+import atexit
+import logging
+import time
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FLUSH_INTERVAL_MS': 250,
+    'MAX_BATCH': 200,
+    'MAX_PENDING': 5000,
+    'MAX_RETRY_INTERVAL_MS': 10000,
+}
+
+# Errors caused by the row itself rather than the database being unavailable;
+# psycopg raises ValueError for strings with NUL characters
+ROW_ERRORS = (DataError, IntegrityError, ValueError)
+
+
+class MessageWriteBuffer:
+    def __init__(self, flush_interval_ms, max_batch, max_pending, max_retry_interval_ms=DEFAULTS['MAX_RETRY_INTERVAL_MS']):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retry_interval = max_retry_interval_ms / 1000
+        # Flushes failed in a row, for the retry backoff
+        self.failures = 0
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.stats = {
+            'buffered': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'rejected': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'last_flush_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+        self._flush_lock = asyncio.Lock()
+        self._timer = None
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'CHAT_WRITE_BUFFER', {})}
+        return cls(
+            config['FLUSH_INTERVAL_MS'], config['MAX_BATCH'], config['MAX_PENDING'], config['MAX_RETRY_INTERVAL_MS'],
+        )
+
+    async def add(self, debate_id, user_id, content):
+        """Queues one chat message for persistence."""
+        if len(self.pending) >= self.max_pending:
+            # Backpressure: make the sender wait for the database instead of growing the queue
+            await self.flush()
+            if len(self.pending) >= self.max_pending:
+                self.pending.popleft()
+                self.stats['dropped'] += 1
+
+        self.pending.append(Message(debate_id=debate_id, user_id=user_id, content=content))
+        self.stats['buffered'] += 1
+
+        if len(self.pending) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_soon)
+
+    def _flush_soon(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Writes everything pending, MAX_BATCH rows per INSERT."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._flush_lock:
+            while self.pending:
+                batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+                started = time.perf_counter()
+                saved, unsaved = await database_sync_to_async(self.write)(batch)
+                if unsaved:
+                    self.stats['failed_flushes'] += 1
+                    # Keep the unsaved rows (oldest first) for the retry; past the bound, the oldest go first
+                    self.pending.extendleft(reversed(unsaved))
+                    while len(self.pending) > self.max_pending:
+                        self.pending.popleft()
+                        self.stats['dropped'] += 1
+                    self._schedule_retry()
+                    return
+                self.failures = 0
+                self._record_flush(saved, started)
+
+    def _schedule_retry(self):
+        self.failures += 1
+        delay = min(self.flush_interval * 2 ** self.failures, self.max_retry_interval)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._flush_soon)
+
+    def flush_sync(self):
+        """Synchronous flush for interpreter shutdown, when no event loop is running."""
+        while self.pending:
+            batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+            started = time.perf_counter()
+            saved, unsaved = self.write(batch)
+            if unsaved:
+                logger.error("Lost %d chat messages at shutdown", len(unsaved) + len(self.pending))
+                return
+            self._record_flush(saved, started)
+
+    def write(self, batch):
+        """
+        Saves one batch. Returns how many rows were saved and the rows left
+        unsaved because the database failed (empty on success). If the batch
+        INSERT trips over a bad row, the rows are retried one at a time and
+        those the database rejects are dropped.
+        """
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+            return len(batch), []
+        except ROW_ERRORS:
+            logger.warning("Chat message flush of %d rows hit a bad row; saving them one by one", len(batch))
+        except Exception:
+            logger.exception("Chat message flush of %d rows failed", len(batch))
+            return 0, batch
+
+        saved = 0
+        for index, message in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    Message.objects.bulk_create([message])
+                saved += 1
+            except ROW_ERRORS:
+                logger.exception(
+                    "Dropping chat message from user %s in debate %s", message.user_id, message.debate_id,
+                )
+                self.stats['rejected'] += 1
+            except Exception:
+                logger.exception("Chat message flush failed after %d of %d rows", index, len(batch))
+                return saved, batch[index:]
+        return saved, []
+
+    def _record_flush(self, size, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats['flushes'] += 1
+        self.stats['flushed'] += size
+        self.stats['last_flush_size'] = size
+        self.stats['last_flush_ms'] = elapsed_ms
+        self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+        logger.debug("Flushed %d chat messages in %.1fms", size, elapsed_ms)
+
+
+message_buffer = MessageWriteBuffer.from_settings()
+atexit.register(message_buffer.flush_sync)
@@ -1,144 +1,593 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
-import json
+import asyncio
+import logging
+import time
+import uuid
+from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.utils import timezone
 from debates.models import Debate
+from debates.chat_buffer import message_buffer
+from debates.chat_batcher import chat_batcher
+from debates.room_history import room_history
+from debates.replay import room_replay
+from debates.caches import get_debate_state
+from debates.presence import presence_tracker, reap_stats, roster
+from debates.wire import (
+    SUBPROTOCOL_MSGPACK, choose_subprotocol, decode_frame, encode_frame, encode_frame_list, tag_frame, to_msgpack,
+)
+from debates.throttling import (
+    CLOSE_FLOODING, CLOSE_HEARTBEAT_TIMEOUT, CLOSE_TOO_SLOW, Outbox, RateLimiter, stats as throttle_stats,
+)
 from accounts.models import User
 
-class DebateConsumer(AsyncWebsocketConsumer):
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SUBSCRIPTIONS = 20 # Debates one multiplexed connection may follow at once
+DEFAULT_HEARTBEAT = {
+    'INTERVAL': 20, # Seconds between server pings
+    'TIMEOUT': 60,  # Seconds without any client frame before the connection is reaped
+}
+
+
+def parse_seq(value):
+    """A client-supplied chat sequence number, or None if absent or malformed."""
+    try:
+        seq = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq >= 0 else None
+
+
+class DebateRoom:
     """
-    Handles real-time communication for a specific debate room, including chat 
-    and signals for video/voice/group calls.
+    One debate room as seen by one WebSocket connection: its groups, signaling
+    registry and stage tier. DebateConsumer holds a single room for its URL;
+    MultiplexDebateConsumer holds one per subscribed debate.
+
+    Every group event and direct signal carries ``debate_id`` so the
+    connection can route it to the right room.
     """
-    
-    async def connect(self):
-        # The user is attached to scope['user'] by TokenAuthMiddleware
-        self.user = self.scope['user'] 
-        self.debate_id = self.scope['url_route']['kwargs']['debate_id']
+
+    def __init__(self, consumer, debate_id):
+        self.consumer = consumer
+        self.channel_layer = consumer.channel_layer
+        self.channel_name = consumer.channel_name
+        self.user = consumer.user
+        self.debate_id = str(debate_id)
         self.debate_group_name = f'debate_{self.debate_id}'
-        
-        # 1. CRITICAL: Check Authentication and Debate Existence
-        if not await self.is_user_authorized():
-            await self.close(code=4001) # 4001 = Auth Failure
-            return
+        # STAGE rooms: only speakers join this sub-group and exchange signaling
+        self.stage_group_name = f'{self.debate_group_name}_stage'
+        self.in_group = False
+        self.in_room_history = False
+        self.in_presence = False
+        self.on_stage = False
+        # Signaling registry of the room as seen by this connection: user id -> channel name
+        self.peers = {}
 
-        # 2. Join the group (Channel Layer)
+    async def send(self, text, droppable=False):
+        await self.consumer.send_room_frame(self.debate_id, text, droppable=droppable)
+
+    async def send_error(self, detail):
+        await self.send(encode_frame({'type': 'error', 'detail': detail}))
+
+    async def open(self, resume_from=None):
+        """
+        Joins the room; call once the connection is accepted and the room is
+        registered. With ``resume_from`` (the last chat seq the client holds)
+        only the missed chat is replayed when the replay store still has it.
+        """
+        # 1. Join the group (Channel Layer)
         await self.channel_layer.group_add(
             self.debate_group_name,
             self.channel_name
         )
-        
-        # 3. Accept the connection
-        await self.accept()
+        self.in_group = True
 
-        # Optional: Announce that a user has joined the room
-        await self.channel_layer.group_send(
-            self.debate_group_name,
-            {
-                'type': 'debate.message',
-                'message': f'{self.user.username} has joined the debate.',
-                'sender': 'System',
-                'timestamp': str(timezone.now()), # Note: requires timezone import
-            }
-        )
+        # 2. Push the chat the client missed (resume), or else the room's recent chat,
+        # so the client doesn't need a separate history request
+        backlog = await room_history.join(self.debate_id)
+        self.in_room_history = True
+        missed = None if resume_from is None else await room_replay.since(self.debate_id, resume_from)
+        if missed is not None:
+            await self.send(encode_frame_list('replay', 'messages', missed, resume_from=resume_from))
+        else:
+            if resume_from is not None:
+                await self.send(encode_frame({'type': 'resync', 'reason': 'too_old'}))
+            await self.send(encode_frame_list(
+                'history', 'messages', backlog, seq=await room_replay.current(self.debate_id)
+            ))
 
-    async def disconnect(self, close_code):
-        # Announce the user is leaving
-        if self.user and self.user.is_authenticated:
-            await self.channel_layer.group_send(
+        # 3. Send the current roster, then report ourselves to the worker's presence batch.
+        # Later changes, including our own arrival, reach every member as coalesced 'presence' diffs.
+        users = await database_sync_to_async(roster)(self.debate_id)
+        snapshot = {
+            'type': 'presence_snapshot',
+            'mode': self.room_mode,
+            'users': [{'user_id': user['user_id'], 'username': user['username']} for user in users],
+        }
+        if self.room_mode == 'STAGE':
+            speaker_ids = await self.get_speaker_ids()
+            snapshot['speakers'] = sorted(speaker_ids)
+        else:
+            for user in users:
+                if user['user_id'] != self.user.id:
+                    self.peers[user['user_id']] = user['channel_name']
+        await self.send(encode_frame(snapshot))
+        presence_tracker.mark_joined(self.debate_id, self.user.id, self.channel_name)
+        self.in_presence = True
+
+        # 4. Speakers of a STAGE room join the signaling sub-group
+        if self.room_mode == 'STAGE' and self.user.id in speaker_ids:
+            await self.join_stage()
+
+    async def close(self):
+        if self.on_stage:
+            await self.leave_stage()
+
+        if self.in_presence:
+            presence_tracker.mark_left(self.debate_id, self.user.id, self.channel_name)
+
+        if self.in_room_history:
+            room_history.leave(self.debate_id)
+
+        # Leave the group
+        if self.in_group:
+            await self.channel_layer.group_discard(
                 self.debate_group_name,
-                {
-                    'type': 'debate.message',
-                    'message': f'{self.user.username} has left the debate.',
-                    'sender': 'System',
-                    'timestamp': str(timezone.now()),
-                }
+                self.channel_name
             )
-        
-        # Leave the group
-        await self.channel_layer.group_discard(
-            self.debate_group_name,
-            self.channel_name
-        )
-
-    async def receive(self, text_data):
-        """Receives messages from the WebSocket and routes them."""
-        data = json.loads(text_data)
-        command = data.get('command')
 
-        if command == 'send_chat':
-            await self.send_chat_message(data)
-        elif command == 'video_signal':
-            await self.send_video_signal(data)
-        # Add other commands like 'start_call', 'end_call', etc.
+    # --- Commands ---
 
     async def send_chat_message(self, data):
         """Sends a standard chat message to the group."""
         message = data.get('message')
-        
+        if not isinstance(message, str) or not message.strip():
+            return
+
         # Send message to room group
-        await self.channel_layer.group_send(
-            self.debate_group_name,
-            {
-                'type': 'debate.message', # Handler method name below
-                'message': message,
-                'sender': self.user.username,
-                'timestamp': str(timezone.now()),
-            }
-        )
+        await self.broadcast_chat(message, self.user.username, event_id=uuid.uuid4().hex)
+
+        # Persist it via the worker's write-behind buffer (batched bulk_create)
+        await message_buffer.add(self.debate_id, self.user.id, message)
+
+    async def broadcast_chat(self, message, sender, event_id=None):
+        """
+        Encodes the chat frame once and broadcasts the final text; recipients
+        forward it as-is. Chat lines carry an ``event_id`` (system notices
+        don't), which lets every worker's room_history dedupe them, and the
+        room's next ``seq``, stored for replay before it is sent.
+        """
+        frame = {
+            'type': 'chat_message',
+            'message': message,
+            'sender': sender,
+            'timestamp': str(timezone.now()),
+        }
+        seq = await room_replay.next_seq(self.debate_id) if event_id is not None else None
+        if seq is not None:
+            frame['seq'] = seq
+        event = {
+            'type': 'debate.message', # Handler method name on the consumer
+            'debate_id': self.debate_id,
+            'text': encode_frame(frame),
+        }
+        if seq is not None:
+            await room_replay.remember(self.debate_id, seq, event['text'])
+        if event_id is not None:
+            event['id'] = event_id
+            if self.chat_batching:
+                # Opted-in rooms: the worker's batcher decides between now and a 'chat_batch' frame
+                await chat_batcher.add(self.channel_layer, self.debate_group_name, self.debate_id, event_id, event['text'])
+                return
+        await self.channel_layer.group_send(self.debate_group_name, event)
 
     async def send_video_signal(self, data):
-        """Relays WebRTC signaling data for peer-to-peer connection."""
+        """
+        Relays WebRTC signaling data to a single peer (``target_id``) with a
+        direct channel send, so a negotiation round costs one delivery per
+        peer pair instead of a broadcast to the whole room.
+        """
         # This is essential for voice/video calls
-        await self.channel_layer.group_send(
-            self.debate_group_name,
+        if self.room_mode == 'STAGE' and not self.on_stage:
+            await self.send_error('Only speakers can send signaling in this debate.')
+            return
+        try:
+            target_channel = self.peers.get(int(data.get('target_id')))
+        except (TypeError, ValueError):
+            target_channel = None
+        if target_channel is None:
+            await self.send_error('Unknown or missing signaling target_id.')
+            return
+
+        await self.channel_layer.send(
+            target_channel,
             {
                 'type': 'debate.signal',
-                'signal_type': data.get('signal_type'), # e.g., 'offer', 'answer', 'ice'
-                'signal_data': data.get('signal_data'),
+                'debate_id': self.debate_id,
                 'sender_channel_name': self.channel_name,
-                'sender_id': self.user.id
+                'text': encode_frame({
+                    'type': 'video_signal',
+                    'signal_type': data.get('signal_type'), # e.g., 'offer', 'answer', 'ice'
+                    'signal_data': data.get('signal_data'),
+                    'sender_id': self.user.id,
+                }),
             }
         )
 
-    # --- Handlers (Received from Channel Layer) ---
+    # --- Speaker/audience tiers (STAGE rooms) ---
+
+    async def change_speaker(self, data, promote):
+        """Creator-only 'promote'/'demote' command; the change is announced to the whole room."""
+        if self.room_mode != 'STAGE':
+            detail = 'Speakers can only be changed in stage mode.'
+        elif self.user.id != self.creator_id and not self.user.is_staff:
+            detail = 'Only the debate creator can change speakers.'
+        else:
+            try:
+                user_id = int(data.get('user_id'))
+            except (TypeError, ValueError):
+                user_id = None
+            if user_id is None or user_id == self.creator_id:
+                detail = 'A valid user_id other than the creator is required.'
+            elif not await self.set_speaker(user_id, promote):
+                detail = 'Unknown user_id.'
+            else:
+                role = 'speaker' if promote else 'audience'
+                await self.channel_layer.group_send(self.debate_group_name, {
+                    'type': 'debate.stage',
+                    'debate_id': self.debate_id,
+                    'user_id': user_id,
+                    'role': role,
+                    'text': encode_frame({'type': 'stage', 'user_id': user_id, 'role': role}),
+                })
+                return
+        await self.send_error(detail)
+
+    async def join_stage(self):
+        await self.channel_layer.group_add(self.stage_group_name, self.channel_name)
+        self.on_stage = True
+        await self.announce_speaker('joined')
+
+    async def leave_stage(self):
+        await self.announce_speaker('left')
+        await self.channel_layer.group_discard(self.stage_group_name, self.channel_name)
+        self.on_stage = False
+        self.peers.clear()
+
+    async def announce_speaker(self, status):
+        """Stage-only broadcast that keeps the speakers' signaling registries current."""
+        await self.channel_layer.group_send(self.stage_group_name, {
+            'type': 'debate.speaker',
+            'debate_id': self.debate_id,
+            'status': status, # 'joined' or 'left'
+            'user_id': self.user.id,
+            'channel_name': self.channel_name,
+        })
+
+    # --- Handlers (Received from Channel Layer via the consumer) ---
 
     async def debate_message(self, event):
-        """Handler for 'debate.message' type sent by the group."""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'sender': event['sender'],
-            'timestamp': event['timestamp'],
-        }))
+        """Handler for 'debate.message' type sent by the group; forwards the pre-encoded frame."""
+        if 'id' in event:
+            # Chat lines (not system notices) feed the room's recent-message ring buffer
+            room_history.record(self.debate_id, event['id'], event['text'])
+        # Chat may be dropped for a slow client; it can still catch up from history
+        await self.send(event['text'], droppable=True)
+
+    async def debate_messages(self, event):
+        """Handler for 'debate.messages': a batch of chat lines from debates.chat_batcher, sent as one frame."""
+        for event_id, text in event['items']:
+            room_history.record(self.debate_id, event_id, text)
+        await self.send(event['text'], droppable=True)
+
+    async def debate_presence(self, event):
+        """Handler for the coalesced 'debate.presence' roster diffs sent by debates.presence."""
+        # In STAGE rooms the registry is fed by the stage sub-group instead
+        if self.room_mode == 'OPEN':
+            for user_id, channel_name in event['channels']:
+                if user_id != self.user.id:
+                    self.peers[user_id] = channel_name
+            for user_id in event['left_ids']:
+                self.peers.pop(user_id, None)
+        if 'text' in event:
+            await self.send(event['text'])
+
+    async def debate_stage(self, event):
+        """Handler for 'debate.stage' role changes; the affected user's connections move tiers."""
+        if event['user_id'] == self.user.id:
+            if event['role'] == 'speaker' and not self.on_stage:
+                await self.join_stage()
+            elif event['role'] == 'audience' and self.on_stage:
+                await self.leave_stage()
+        await self.send(event['text'])
+
+    async def debate_speaker(self, event):
+        """Handler for 'debate.speaker' events of the stage sub-group (signaling registry only)."""
+        if event['channel_name'] == self.channel_name or not self.on_stage:
+            return
+        if event['status'] == 'left':
+            if self.peers.get(event['user_id']) == event['channel_name']:
+                del self.peers[event['user_id']]
+            return
+        # 'joined' (broadcast by a new speaker) or 'present' (a direct reply to our own 'joined')
+        self.peers[event['user_id']] = event['channel_name']
+        if event['status'] == 'joined':
+            await self.channel_layer.send(event['channel_name'], {
+                'type': 'debate.speaker',
+                'debate_id': self.debate_id,
+                'status': 'present',
+                'user_id': self.user.id,
+                'channel_name': self.channel_name,
+            })
 
     async def debate_signal(self, event):
-        """Handler for 'debate.signal' type (WebRTC)."""
-        # Only send the signal to other users, not back to the sender
+        """Handler for 'debate.signal' type (WebRTC), addressed to this channel only."""
         if event['sender_channel_name'] != self.channel_name:
-            await self.send(text_data=json.dumps({
-                'type': 'video_signal',
-                'signal_type': event['signal_type'],
-                'signal_data': event['signal_data'],
-                'sender_id': event['sender_id']
-            }))
-    
+            await self.send(event['text'])
+
     # --- Database/Auth Checks (Helper methods) ---
-    
-    @database_sync_to_async
-    def is_user_authorized(self):
-        """Checks if the user is authenticated and the debate exists."""
-        from django.utils import timezone # Import here to avoid circular dependency issues
 
+    async def is_user_authorized(self):
+        """Checks if the user is authenticated and the debate exists and is open."""
         if not self.user.is_authenticated:
             return False
-            
-        try:
-            debate = Debate.objects.get(pk=self.debate_id, status__in=['OPEN', 'ACTIVE'])
-            # You might add checks here: 
-            # 1. Has the user paid the fee? (Handled in DebateJoinView, but a good place for a final check)
-            # 2. Is the debate full?
+
+        # Served from a short-lived process-local cache, invalidated when the debate is saved (see debates/caches.py)
+        # You might add checks here:
+        # 1. Has the user paid the fee? (Handled in DebateJoinView, but a good place for a final check)
+        # 2. Is the debate full?
+        state = await get_debate_state(self.debate_id)
+        if state is not None and state['status'] in ('OPEN', 'ACTIVE'):
+            self.room_mode = state['room_mode']
+            self.chat_batching = state['chat_batching']
+            self.creator_id = state['creator_id']
             return True
-        except Debate.DoesNotExist:
-            print(f"Debate {self.debate_id} not found or not open.")
-            return False
\ No newline at end of file
+        logger.info("Debate %s not found or not open; connection refused.", self.debate_id)
+        return False
+
+    @database_sync_to_async
+    def get_speaker_ids(self):
+        """The creator plus the debate's designated speakers."""
+        speakers = Debate.speakers.through.objects.filter(debate_id=self.debate_id)
+        return set(speakers.values_list('user_id', flat=True)) | {self.creator_id}
+
+    @database_sync_to_async
+    def set_speaker(self, user_id, promote):
+        if not User.objects.filter(pk=user_id).exists():
+            return False
+        debate = Debate(pk=self.debate_id)
+        if promote:
+            debate.speakers.add(user_id)
+        else:
+            debate.speakers.remove(user_id)
+        return True
+
+
+class DebateSocketConsumer(AsyncWebsocketConsumer):
+    """
+    Connection-level plumbing shared by the debate consumers: per-command rate
+    limits, the bounded outbox, the heartbeat, and routing of channel layer
+    events to the DebateRoom they belong to.
+
+    The heartbeat sends {'type': 'ping'} every WS_HEARTBEAT['INTERVAL'] seconds;
+    clients answer {'command': 'pong'} (any frame counts). A connection silent
+    for WS_HEARTBEAT['TIMEOUT'] seconds leaves its groups right away and is
+    closed with CLOSE_HEARTBEAT_TIMEOUT, without waiting for a disconnect
+    event that a vanished client may never produce.
+    """
+    # Commands handled by a DebateRoom: command -> (method name, extra kwargs)
+    ROOM_COMMANDS = {
+        'send_chat': ('send_chat_message', {}),
+        'video_signal': ('send_video_signal', {}),
+        'promote': ('change_speaker', {'promote': True}),
+        'demote': ('change_speaker', {'promote': False}),
+    }
+
+    def setup_connection(self):
+        # The user is attached to scope['user'] by TokenAuthMiddleware
+        self.user = self.scope['user']
+        # debate id (string) -> DebateRoom
+        self.rooms = {}
+        self.limiter = RateLimiter()
+        self.outbox = None
+        self.binary = False
+        self.heartbeat = None
+        self.last_seen = time.monotonic()
+
+    async def accept_connection(self):
+        # Wire format from Sec-WebSocket-Protocol: 'debate.msgpack' for binary frames, JSON otherwise
+        subprotocol = choose_subprotocol(self.scope.get('subprotocols', []))
+        self.binary = subprotocol == SUBPROTOCOL_MSGPACK
+        await self.accept(subprotocol=subprotocol)
+        # From here on frames go through the bounded outbox
+        self.outbox = Outbox(self.write_frame)
+        self.heartbeat = asyncio.ensure_future(self.run_heartbeat())
+
+    async def run_heartbeat(self):
+        config = {**DEFAULT_HEARTBEAT, **getattr(settings, 'WS_HEARTBEAT', {})}
+        while True:
+            await asyncio.sleep(config['INTERVAL'])
+            if time.monotonic() - self.last_seen > config['TIMEOUT']:
+                reap_stats['heartbeat_timeout'] += 1
+                logger.info("Reaping silent connection %s (%d rooms)", self.channel_name, len(self.rooms))
+                await self.leave_rooms()
+                await self.close(code=CLOSE_HEARTBEAT_TIMEOUT)
+                return
+            await self.send(text_data=encode_frame({'type': 'ping'}))
+
+    async def leave_rooms(self):
+        for room in list(getattr(self, 'rooms', {}).values()):
+            await room.close()
+        self.rooms = {}
+
+    async def disconnect(self, close_code):
+        heartbeat = getattr(self, 'heartbeat', None)
+        if heartbeat is not None and heartbeat is not asyncio.current_task():
+            heartbeat.cancel()
+        await self.leave_rooms()
+
+        if getattr(self, 'outbox', None) is not None:
+            self.outbox.close()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Receives messages from the WebSocket and routes them."""
+        self.last_seen = time.monotonic()
+        data = decode_frame(text_data, bytes_data)
+        if data is None:
+            return
+        command = data.get('command')
+        if command == 'pong':
+            return
+
+        if not self.limiter.allow(command):
+            if self.limiter.is_flooding():
+                throttle_stats['closed.flooding'] += 1
+                await self.close(code=CLOSE_FLOODING)
+                return
+            await self.send(text_data=encode_frame({'type': 'error', 'detail': 'rate_limited', 'command': command}))
+            return
+
+        await self.handle_command(command, data)
+
+    async def handle_command(self, command, data):
+        """
+        Routes one client command that passed the rate limits. Subclasses
+        override this to route to their rooms (see dispatch_room_command);
+        the default answers that the command is unknown.
+        """
+        await self.send(text_data=encode_frame({'type': 'error', 'detail': 'unknown_command', 'command': command}))
+
+    async def dispatch_room_command(self, room, command, data):
+        if command in self.ROOM_COMMANDS:
+            method, kwargs = self.ROOM_COMMANDS[command]
+            await getattr(room, method)(data, **kwargs)
+        else:
+            # Add other commands like 'start_call', 'end_call', etc. to ROOM_COMMANDS
+            await self.send_room_frame(
+                room.debate_id, encode_frame({'type': 'error', 'detail': 'unknown_command', 'command': command}),
+            )
+
+    # --- Outbound flow control ---
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Routes frames through the bounded outbox once the connection is accepted."""
+        if close or getattr(self, 'outbox', None) is None:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            return
+        await self.queue_frame(text_data)
+
+    async def send_room_frame(self, debate_id, text, droppable=False):
+        await self.queue_frame(text, droppable=droppable)
+
+    async def queue_frame(self, frame, droppable=False):
+        if not self.outbox.put(frame, droppable=droppable):
+            throttle_stats['closed.too_slow'] += 1
+            await self.close(code=CLOSE_TOO_SLOW)
+
+    async def write_frame(self, frame):
+        # Frames are queued as JSON text; binary clients get them transcoded on the way out
+        if self.binary:
+            await super().send(bytes_data=to_msgpack(frame))
+        else:
+            await super().send(text_data=frame)
+
+    # --- Handlers (Received from Channel Layer) ---
+
+    async def route_to_room(self, event):
+        # Events for a room this connection already left are dropped
+        room = self.rooms.get(event.get('debate_id'))
+        if room is not None:
+            await getattr(room, event['type'].replace('.', '_'))(event)
+
+    debate_message = route_to_room
+    debate_messages = route_to_room
+    debate_presence = route_to_room
+    debate_stage = route_to_room
+    debate_speaker = route_to_room
+    debate_signal = route_to_room
+
+
+class DebateConsumer(DebateSocketConsumer):
+    """
+    Handles real-time communication for a specific debate room, including chat
+    and signals for video/voice/group calls.
+    """
+
+    async def connect(self):
+        self.setup_connection()
+        room = DebateRoom(self, self.scope['url_route']['kwargs']['debate_id'])
+
+        # 1. CRITICAL: Check Authentication and Debate Existence
+        if not await room.is_user_authorized():
+            await self.close(code=4001) # 4001 = Auth Failure
+            return
+
+        # 2. Accept the connection, then join the room (ws/debate/<id>/?resume_from=<seq> after a reconnect)
+        await self.accept_connection()
+        self.rooms[room.debate_id] = room
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        await room.open(resume_from=parse_seq(query.get('resume_from', [None])[0]))
+
+    async def handle_command(self, command, data):
+        for room in self.rooms.values():
+            await self.dispatch_room_command(room, command, data)
+
+
+class MultiplexDebateConsumer(DebateSocketConsumer):
+    """
+    One authenticated connection following any number of debates (up to
+    WS_MAX_SUBSCRIPTIONS). Clients send {'command': 'subscribe' | 'unsubscribe',
+    'debate_id': ...}; room commands carry 'debate_id' too, and every frame
+    sent back is tagged with the debate_id it belongs to. 'subscribe' accepts
+    'resume_from' to replay only the chat missed since that seq.
+    """
+
+    async def connect(self):
+        self.setup_connection()
+        if not self.user.is_authenticated:
+            await self.close(code=4001) # 4001 = Auth Failure
+            return
+        self.max_subscriptions = getattr(settings, 'WS_MAX_SUBSCRIPTIONS', DEFAULT_MAX_SUBSCRIPTIONS)
+        await self.accept_connection()
+
+    async def handle_command(self, command, data):
+        debate_id = str(data.get('debate_id', ''))
+        if not debate_id.isdigit():
+            await self.send_room_frame(None, encode_frame({'type': 'error', 'detail': 'A numeric debate_id is required.'}))
+        elif command == 'subscribe':
+            await self.subscribe(debate_id, parse_seq(data.get('resume_from')))
+        elif command == 'unsubscribe':
+            await self.unsubscribe(debate_id)
+        elif debate_id not in self.rooms:
+            await self.send_room_frame(debate_id, encode_frame({'type': 'error', 'detail': 'Not subscribed to this debate.'}))
+        else:
+            await self.dispatch_room_command(self.rooms[debate_id], command, data)
+
+    async def subscribe(self, debate_id, resume_from=None):
+        if debate_id in self.rooms:
+            return
+        if len(self.rooms) >= self.max_subscriptions:
+            await self.send_room_frame(debate_id, encode_frame({'type': 'error', 'detail': 'Too many subscriptions.'}))
+            return
+        room = DebateRoom(self, debate_id)
+        if not await room.is_user_authorized():
+            await self.send_room_frame(debate_id, encode_frame({'type': 'error', 'detail': 'Debate not found or not open.'}))
+            return
+        self.rooms[debate_id] = room
+        await room.open(resume_from=resume_from)
+        await self.send_room_frame(debate_id, encode_frame({'type': 'subscribed'}))
+
+    async def unsubscribe(self, debate_id):
+        room = self.rooms.pop(debate_id, None)
+        if room is not None:
+            await room.close()
+            await self.send_room_frame(debate_id, encode_frame({'type': 'unsubscribed'}))
+
+    async def send_room_frame(self, debate_id, text, droppable=False):
+        if debate_id is not None:
+            text = tag_frame(text, int(debate_id))
+        await self.queue_frame(text, droppable=droppable)
@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import User
+from payments.models import UserCredit, EarningBalance, Transaction
+from .models import Debate
+
+DEBATE_FEE = 10 # Cost to join a debate in credits
+CREATOR_COMMISSION_RATE = 0.75 # 75% commission rate
+
+# Per-user outcomes reported by enroll_users()
+JOINED = 'joined'
+ALREADY_JOINED = 'already_joined'
+UNKNOWN_USER = 'unknown_user'
+NO_CREDIT_ACCOUNT = 'no_credit_account'
+INSUFFICIENT_CREDITS = 'insufficient_credits'
+DEBATE_FULL = 'debate_full'
+
+
+def enroll_users(debate, user_ids):
+    """
+    Joins many users to ``debate`` in one transaction with a fixed number of
+    queries, charging DEBATE_FEE to everyone except the creator exactly like
+    DebateJoinView does for a single user.
+
+    Credit rows are locked in user id order, so two overlapping bulk
+    enrollments can't deadlock each other. Returns {user_id: outcome}.
+
+    Existing membership is read only once the credit rows and the debate row
+    are locked: a concurrent single join adds its participant row while
+    holding the joiner's credit lock (or, for the creator, the debate lock),
+    so by then it has either committed and is seen here, or waits for us.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    results = {}
+    Participant = Debate.participants.through
+
+    with transaction.atomic():
+        known = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        credits = {
+            credit.user_id: credit
+            for credit in UserCredit.objects.select_for_update()
+            .filter(user_id__in=known).order_by('user_id')
+        }
+        # One lock on the debate row decides how many of the eligible users fit
+        seats_taken, max_participants = Debate.objects.select_for_update().values_list(
+            'participant_count', 'max_participants'
+        ).get(pk=debate.pk)
+        already = set(Participant.objects.filter(
+            debate=debate, user_id__in=known
+        ).values_list('user_id', flat=True))
+
+        eligible = []
+        for user_id in user_ids:
+            if user_id not in known:
+                results[user_id] = UNKNOWN_USER
+            elif user_id in already:
+                results[user_id] = ALREADY_JOINED
+            elif user_id == debate.creator_id:
+                eligible.append(user_id)
+            elif user_id not in credits:
+                results[user_id] = NO_CREDIT_ACCOUNT
+            elif credits[user_id].balance < DEBATE_FEE:
+                results[user_id] = INSUFFICIENT_CREDITS
+            else:
+                eligible.append(user_id)
+
+        free_seats = max(max_participants - seats_taken, 0)
+        admitted, turned_away = eligible[:free_seats], eligible[free_seats:]
+        for user_id in turned_away:
+            results[user_id] = DEBATE_FULL
+
+        paying = [user_id for user_id in admitted if user_id != debate.creator_id]
+        creator_earning = Decimal(str(DEBATE_FEE * CREATOR_COMMISSION_RATE))
+
+        for user_id in paying:
+            credits[user_id].balance -= DEBATE_FEE
+        UserCredit.objects.bulk_update([credits[user_id] for user_id in paying], ['balance'], batch_size=500)
+
+        ledger = []
+        for user_id in paying:
+            ledger.append(Transaction(user_id=user_id, transaction_type='DEB', amount=-DEBATE_FEE, debate_id=debate.id))
+            ledger.append(Transaction(user_id=debate.creator_id, transaction_type='EAR', amount=creator_earning, debate_id=debate.id))
+        Transaction.objects.bulk_create(ledger, batch_size=500)
+
+        if paying:
+            EarningBalance.objects.get_or_create(user_id=debate.creator_id)
+            EarningBalance.objects.filter(user_id=debate.creator_id).update(
+                balance=F('balance') + creator_earning * len(paying)
+            )
+
+        if admitted:
+            Participant.objects.bulk_create(
+                [Participant(debate_id=debate.id, user_id=user_id) for user_id in admitted], batch_size=500
+            )
+            Debate.objects.filter(pk=debate.pk).update(participant_count=F('participant_count') + len(admitted))
+
+        for user_id in admitted:
+            results[user_id] = JOINED
+
+    return results
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from debates.consumers import DebateRoom
+from debates.wire import encode_frame
+
+
+class LegacyRecipient:
+    """The pre encode-once handler: every recipient rebuilds and serializes the frame."""
+    async def send(self, text_data):
+        pass
+
+    async def debate_message(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'chat_message',
+            'message': event['message'],
+            'sender': event['sender'],
+            'timestamp': event['timestamp'],
+        }))
+
+
+class BenchConnection:
+    """Stands in for the consumer a DebateRoom writes its frames to."""
+    channel_layer = None
+    channel_name = 'bench'
+    user = None
+
+    async def send_room_frame(self, debate_id, text, droppable=False):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Measures CPU time per chat broadcast for per-recipient encoding vs encode-once fan-out."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--broadcasts', type=int, default=200)
+        parser.add_argument('--message-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        message = 'x' * options['message_size']
+        self.stdout.write(f"{'subscribers':>12} {'legacy us':>12} {'encode-once us':>15} {'speedup':>8}")
+        for subscribers in options['subscribers']:
+            legacy, encoded = asyncio.run(self.measure(subscribers, options['broadcasts'], message))
+            self.stdout.write(f"{subscribers:>12} {legacy:>12.1f} {encoded:>15.1f} {legacy / encoded:>7.1f}x")
+
+    async def measure(self, subscribers, broadcasts, message):
+        legacy_recipients = [LegacyRecipient() for _ in range(subscribers)]
+        recipients = [DebateRoom(BenchConnection(), 'bench') for _ in range(subscribers)]
+
+        def legacy_event():
+            return {'type': 'debate.message', 'message': message, 'sender': 'bench', 'timestamp': str(timezone.now())}
+
+        def encoded_event():
+            # Sender side of DebateRoom.broadcast_chat
+            return {'type': 'debate.message', 'debate_id': 'bench', 'text': encode_frame({
+                'type': 'chat_message', 'message': message, 'sender': 'bench', 'timestamp': str(timezone.now()),
+            })}
+
+        async def run(recipients, make_event):
+            started = time.process_time()
+            for _ in range(broadcasts):
+                event = make_event()
+                for recipient in recipients:
+                    await recipient.debate_message(event)
+            return (time.process_time() - started) / broadcasts * 1e6
+
+        return await run(legacy_recipients, legacy_event), await run(recipients, encoded_event)
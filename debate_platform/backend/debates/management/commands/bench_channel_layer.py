@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from backend.channel_layers import ShardedChannelLayer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares room broadcast throughput of the plain channel layer and the sharded layer, "
+        "with several workers simulated in this process. Uses an in-memory stand-in for the "
+        "network unless --redis is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--rooms', type=int, default=8)
+        parser.add_argument('--members', type=int, default=50, help="Members per room.")
+        parser.add_argument('--messages', type=int, default=200, help="Messages per room.")
+        parser.add_argument(
+            '--remote', type=float, nargs='+', default=[0.0, 0.1, 0.5],
+            help="Fractions of each room's members connected to a worker other than the room's owner.",
+        )
+        parser.add_argument('--redis', help="Redis URL for the network layer instead of the in-memory stand-in.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'layer':>8} {'remote':>7} {'deliveries':>11} {'seconds':>8} {'deliveries/s':>13} {'network msgs':>13}")
+        for remote in options['remote']:
+            for name in ('plain', 'sharded'):
+                deliveries, elapsed, network = asyncio.run(self.run(name, remote, options))
+                self.stdout.write(
+                    f"{name:>8} {remote:>7.0%} {deliveries:>11} {elapsed:>8.3f} "
+                    f"{deliveries / elapsed:>13.0f} {network if network is not None else '-':>13}"
+                )
+
+    def network_layer(self, options):
+        if options['redis']:
+            from channels_redis.pubsub import RedisPubSubChannelLayer
+            return RedisPubSubChannelLayer(hosts=[options['redis']])
+        return InMemoryChannelLayer(capacity=100_000)
+
+    async def run(self, name, remote, options):
+        worker_ids = [f'w{index}' for index in range(options['workers'])]
+        shared = None if options['redis'] else self.network_layer(options)
+        if name == 'plain':
+            # Every worker talks to the network layer directly, as the current setup does
+            layers = {worker: shared or self.network_layer(options) for worker in worker_ids}
+        else:
+            layers = {
+                worker: ShardedChannelLayer(
+                    inner=shared or self.network_layer(options), shards=worker_ids, worker_id=worker, capacity=100_000,
+                )
+                for worker in worker_ids
+            }
+        ring = ShardedChannelLayer(inner=InMemoryChannelLayer(), shards=worker_ids).ring
+
+        members = []  # (layer, channel)
+        senders = []  # (layer, group)
+        for room in range(1, options['rooms'] + 1):
+            group = f'debate_{room}'
+            owner = ring.owner(str(room))
+            others = [worker for worker in worker_ids if worker != owner] or [owner]
+            remote_count = round(options['members'] * remote)
+            for index in range(options['members']):
+                worker = others[index % len(others)] if index < remote_count else owner
+                layer = layers[worker]
+                channel = await layer.new_channel()
+                await layer.group_add(group, channel)
+                members.append((layer, channel))
+            senders.append((layers[owner], group))
+        # Let owners pick up the registrations of remote workers
+        await asyncio.sleep(0.05)
+
+        expected = options['messages']
+        started = time.perf_counter()
+        receivers = [asyncio.ensure_future(self.drain(layer, channel, expected)) for layer, channel in members]
+        for number in range(expected):
+            for layer, group in senders:
+                await layer.group_send(group, {'type': 'debate.message', 'text': str(number)})
+        await asyncio.gather(*receivers)
+        elapsed = time.perf_counter() - started
+
+        network = None
+        if name == 'sharded':
+            network = sum(layer.stats['network_sends'] for layer in layers.values())
+        for layer in set(layers.values()):
+            if hasattr(layer, 'close'):
+                await layer.close()
+        return len(members) * expected, elapsed, network
+
+    async def drain(self, layer, channel, count):
+        for _ in range(count):
+            await layer.receive(channel)
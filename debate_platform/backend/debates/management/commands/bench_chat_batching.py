@@ -0,0 +1,69 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from debates.chat_batcher import ChatBatcher
+from debates.wire import encode_frame
+
+
+class CountingLayer:
+    """Stands in for the channel layer: counts the frames a room's clients would receive."""
+    def __init__(self, recipients):
+        self.recipients = recipients
+        self.frames = 0
+        self.latencies = []
+        self.sent_at = {}
+
+    async def group_send(self, group, event):
+        now = time.monotonic()
+        event_ids = [event['id']] if event['type'] == 'debate.message' else [item[0] for item in event['items']]
+        self.frames += self.recipients
+        for event_id in event_ids:
+            self.latencies.append(now - self.sent_at.pop(event_id))
+
+
+class Command(BaseCommand):
+    help = "Measures frames per client and added latency of adaptive chat batching at several room message rates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rates', type=int, nargs='+', default=[2, 20, 100, 500, 2000])
+        parser.add_argument('--recipients', type=int, default=100)
+        parser.add_argument('--seconds', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'msgs/s':>7} {'messages':>9} {'frames/client':>14} {'msgs/frame':>11} "
+            f"{'mean ms':>8} {'p99 ms':>7} {'max ms':>7} {'socket writes saved':>20}"
+        )
+        for rate in options['rates']:
+            messages, layer = asyncio.run(self.run(rate, options['recipients'], options['seconds']))
+            frames = layer.frames // options['recipients']
+            latencies = sorted(latency * 1000 for latency in layer.latencies)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"{rate:>7} {messages:>9} {frames:>14} {messages / frames:>11.1f} "
+                f"{statistics.mean(latencies):>8.2f} {p99:>7.2f} {latencies[-1]:>7.2f} "
+                f"{(messages - frames) * options['recipients']:>20}"
+            )
+
+    async def run(self, rate, recipients, seconds):
+        batcher = ChatBatcher.from_settings()
+        layer = CountingLayer(recipients)
+        tick = 0.005
+        started = time.monotonic()
+        owed = 0.0
+        messages = 0
+        while time.monotonic() - started < seconds:
+            owed += rate * tick
+            while owed >= 1:
+                owed -= 1
+                event_id = str(messages)
+                layer.sent_at[event_id] = time.monotonic()
+                text = encode_frame({'type': 'chat_message', 'message': 'x' * 120, 'sender': 'bench'})
+                await batcher.add(layer, 'bench', 'bench', event_id, text)
+                messages += 1
+            await asyncio.sleep(tick)
+        await batcher.flush(layer, 'bench', 'bench')
+        return messages, layer
@@ -0,0 +1,95 @@
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+from debates.wire import encode_frame, encode_frame_list, to_msgpack
+
+
+def _sdp_offer():
+    """A browser-like audio+video offer: the bulk of signaling traffic."""
+    lines = [
+        'v=0', 'o=- 4611731400430051336 2 IN IP4 127.0.0.1', 's=-', 't=0 0',
+        'a=group:BUNDLE 0 1', 'a=extmap-allow-mixed', 'a=msid-semantic: WMS stream',
+    ]
+    for mid, (kind, payloads) in enumerate([('audio', range(111, 127)), ('video', range(96, 128))]):
+        lines += [
+            f'm={kind} 9 UDP/TLS/RTP/SAVPF ' + ' '.join(str(p) for p in payloads),
+            'c=IN IP4 0.0.0.0', 'a=rtcp:9 IN IP4 0.0.0.0',
+            'a=ice-ufrag:Vh2q', 'a=ice-pwd:z4Hf0vDJxjWbqG3u7nRcYp1K', 'a=ice-options:trickle',
+            'a=fingerprint:sha-256 ' + ':'.join(['7B'] * 32),
+            'a=setup:actpass', f'a=mid:{mid}', 'a=sendrecv', 'a=rtcp-mux',
+        ]
+        for payload in payloads:
+            lines += [
+                f'a=rtpmap:{payload} {"opus/48000/2" if kind == "audio" else "VP8/90000"}',
+                f'a=rtcp-fb:{payload} transport-cc',
+                f'a=fmtp:{payload} minptime=10;useinbandfec=1',
+            ]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def _chat(i, size=120):
+    return {
+        'type': 'chat_message', 'message': ('argument %d ' % i).ljust(size, 'x'),
+        'sender': f'user{i}', 'timestamp': '2025-01-01 12:00:00.000000+00:00',
+    }
+
+
+def sample_frames():
+    return {
+        'chat_message': _chat(1),
+        'video_signal offer': {
+            'type': 'video_signal', 'signal_type': 'offer', 'sender_id': 42,
+            'signal_data': {'type': 'offer', 'sdp': _sdp_offer()},
+        },
+        'video_signal ice': {
+            'type': 'video_signal', 'signal_type': 'ice', 'sender_id': 42,
+            'signal_data': {
+                'candidate': 'candidate:842163049 1 udp 1677729535 203.0.113.5 54321 typ srflx '
+                             'raddr 10.0.0.5 rport 54321 generation 0 ufrag Vh2q network-cost 999',
+                'sdpMid': '0', 'sdpMLineIndex': 0,
+            },
+        },
+        'presence (20 joins)': {
+            'type': 'presence', 'left': [],
+            'joined': [{'user_id': 1000 + i, 'username': f'user{i}'} for i in range(20)],
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Compares JSON and MessagePack frame sizes and encode/decode cost for representative frames."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        frames = {name: (payload, encode_frame(payload)) for name, payload in sample_frames().items()}
+        history = encode_frame_list('history', 'messages', [encode_frame(_chat(i)) for i in range(50)])
+        frames['history (50 chats)'] = (json.loads(history), history)
+
+        self.stdout.write(
+            f"{'frame':<22} {'json B':>8} {'msgpack B':>10} {'saved':>6} "
+            f"{'json enc us':>12} {'mp enc us':>10} {'json dec us':>12} {'mp dec us':>10} {'transcode us':>13}"
+        )
+        for name, (payload, text) in frames.items():
+            packed = to_msgpack.__wrapped__(text)
+            size_json = len(text.encode())
+            self.stdout.write(
+                f"{name:<22} {size_json:>8} {len(packed):>10} {1 - len(packed) / size_json:>6.0%} "
+                f"{self.time_us(encode_frame, payload, iterations):>12.2f} "
+                f"{self.time_us(lambda p: msgpack.packb(p, use_bin_type=True), payload, iterations):>10.2f} "
+                f"{self.time_us(json.loads, text, iterations):>12.2f} "
+                f"{self.time_us(lambda b: msgpack.unpackb(b, raw=False), packed, iterations):>10.2f} "
+                f"{self.time_us(to_msgpack.__wrapped__, text, iterations):>13.2f}"
+            )
+
+    @staticmethod
+    def time_us(func, arg, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func(arg)
+        return (time.perf_counter() - started) / iterations * 1e6
@@ -0,0 +1,38 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from debates.enrollment import enroll_users
+from debates.models import Debate
+
+
+class Command(BaseCommand):
+    help = "Enrolls many users in a debate in one transaction, charging the regular join fee."
+
+    def add_arguments(self, parser):
+        parser.add_argument('debate_id', type=int)
+        parser.add_argument('usernames', nargs='*', help="Usernames to enroll.")
+        parser.add_argument('--file', help="Read usernames from this file, one per line.")
+
+    def handle(self, *args, **options):
+        try:
+            debate = Debate.objects.get(id=options['debate_id'])
+        except Debate.DoesNotExist:
+            raise CommandError(f"Debate {options['debate_id']} does not exist.")
+
+        usernames = list(options['usernames'])
+        if options['file']:
+            with open(options['file']) as handle:
+                usernames += [line.strip() for line in handle if line.strip()]
+        if not usernames:
+            raise CommandError("Give usernames on the command line or with --file.")
+
+        ids_by_username = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        missing = sorted(set(usernames) - set(ids_by_username))
+        for username in missing:
+            self.stderr.write(f"Unknown user: {username}")
+
+        results = enroll_users(debate, [ids_by_username[name] for name in usernames if name in ids_by_username])
+        for outcome, count in sorted(Counter(results.values()).items()):
+            self.stdout.write(f"{outcome}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(results)} user(s) for '{debate.title}'."))
@@ -0,0 +1,132 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIClient
+from accounts.models import User
+from debates.admission import reserve_seat
+from debates.enrollment import DEBATE_FEE
+from debates.models import Debate
+from payments.models import Transaction, UserCredit
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent seat reservations at a throwaway debate and checks it is never oversold. "
+        "With --full-join every joiner is a throwaway user posting twice to the join endpoint, "
+        "which also checks nobody is charged or seated twice. "
+        "Run it against a staging database, not production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--joiners', type=int, default=500)
+        parser.add_argument('--seats', type=int, default=100)
+        parser.add_argument('--full-join', action='store_true',
+                            help="Go through DebateJoinView (payment, ledger, double submits) instead of reserve_seat only.")
+
+    def handle(self, *args, **options):
+        if options['full_join']:
+            return self.full_join(options['joiners'], options['seats'])
+        joiners, seats = options['joiners'], options['seats']
+        creator = User.objects.order_by('id').first()
+        if creator is None:
+            raise CommandError("Needs at least one user to own the throwaway debate.")
+
+        debate = Debate.objects.create(
+            title='Admission load test', description='Temporary', creator=creator, max_participants=seats,
+        )
+        barrier = threading.Barrier(joiners)
+        results, latencies = [], []
+        lock = threading.Lock()
+
+        def join():
+            barrier.wait()
+            started = time.perf_counter()
+            try:
+                admitted = reserve_seat(debate.id)
+            except Exception as exc:
+                admitted = exc
+            finally:
+                connection.close()
+            with lock:
+                results.append(admitted)
+                latencies.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=join) for _ in range(joiners)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            debate.refresh_from_db()
+            admitted = results.count(True)
+            rejected = results.count(False)
+            errors = len(results) - admitted - rejected
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+            self.stdout.write(
+                f"joiners={joiners} seats={seats} admitted={admitted} rejected={rejected} errors={errors} "
+                f"counter={debate.participant_count} p50={p50:.1f}ms p99={p99:.1f}ms"
+            )
+            if admitted > seats or debate.participant_count != admitted:
+                raise CommandError("Debate was oversold.")
+            self.stdout.write(self.style.SUCCESS("No overselling."))
+        finally:
+            debate.delete()
+
+    def full_join(self, joiners, seats):
+        prefix = f'loadtest-{uuid.uuid4().hex[:8]}'
+        creator = User.objects.create_user(username=f'{prefix}-creator', password=None)
+        users = User.objects.bulk_create([User(username=f'{prefix}-{index}') for index in range(joiners)])
+        users = list(User.objects.filter(username__startswith=f'{prefix}-').exclude(id=creator.id))
+        UserCredit.objects.bulk_create([UserCredit(user=user, balance=DEBATE_FEE) for user in users])
+        debate = Debate.objects.create(
+            title='Admission load test', description='Temporary', creator=creator, max_participants=seats,
+        )
+        barrier = threading.Barrier(joiners)
+        statuses = []
+        lock = threading.Lock()
+
+        def join(user):
+            # Errors come back as 500 responses; re-raising would also pick up other threads' failures,
+            # since the test client learns about them through a process-wide signal
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                # A double submit: at most one of the two may go through
+                codes = [client.post(f'/api/debates/{debate.id}/join/').status_code for _ in range(2)]
+            finally:
+                connection.close()
+            with lock:
+                statuses.append(codes)
+
+        threads = [threading.Thread(target=join, args=(user,)) for user in users]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            debate.refresh_from_db()
+            members = debate.participants.count()
+            charged = Transaction.objects.filter(debate_id=debate.id, transaction_type='DEB').count()
+            joined = sum(codes.count(200) for codes in statuses)
+            twice = sum(1 for codes in statuses if codes.count(200) > 1)
+            errors = sum(1 for codes in statuses for code in codes if code >= 500)
+            self.stdout.write(
+                f"joiners={joiners} seats={seats} joined={joined} members={members} "
+                f"counter={debate.participant_count} charged={charged} double_joins={twice} errors={errors}"
+            )
+            if members > seats or debate.participant_count != members or charged != members or twice:
+                raise CommandError("Seats, participants and charges disagree.")
+            self.stdout.write(self.style.SUCCESS("No overselling, no double joins or charges."))
+        finally:
+            Transaction.objects.filter(debate_id=debate.id).delete()
+            debate.delete()
+            User.objects.filter(username__startswith=f'{prefix}-').delete()
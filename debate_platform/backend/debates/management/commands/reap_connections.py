@@ -0,0 +1,30 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from debates.presence import presence_tracker, reap_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes WebSocket connections whose worker stopped refreshing them (crashed or killed) "
+        "from the debate channel layer groups and the presence roster."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help="Seconds without a last_seen refresh before a connection counts as dead "
+                                 "(default: PRESENCE['STALE_AFTER_S']).")
+        parser.add_argument('--every', type=int, default=0,
+                            help="Keep running and sweep every N seconds instead of once.")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.sweep(options['stale_after'], options['every']))
+
+    async def sweep(self, stale_after, every):
+        while True:
+            reaped = await presence_tracker.reap_stale(stale_after)
+            self.stdout.write(f"Reaped {reaped} stale connections ({reap_stats['stale_presence']} since start).")
+            if not every:
+                return
+            await asyncio.sleep(every)
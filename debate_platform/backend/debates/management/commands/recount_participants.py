@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from debates.models import Debate
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized Debate.participant_count column from the participants table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('debate_ids', nargs='*', type=int, help="Limit the repair to these debates.")
+
+    def handle(self, *args, **options):
+        debates = Debate.objects.all()
+        if options['debate_ids']:
+            debates = debates.filter(id__in=options['debate_ids'])
+
+        repaired = debates.recount_participants()
+        self.stdout.write(self.style.SUCCESS(f"Repaired participant_count on {repaired} debate(s)."))
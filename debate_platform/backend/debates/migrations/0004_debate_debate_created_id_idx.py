@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0003_alter_message_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='debate',
+            index=models.Index(fields=['-created_at', '-id'], name='debate_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_participant_count(apps, schema_editor):
+    Debate = apps.get_model('debates', 'Debate')
+    Participant = Debate.participants.through
+    Debate.objects.update(participant_count=Coalesce(Subquery(
+        Participant.objects.filter(debate=OuterRef('pk'))
+        .values('debate').annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0004_debate_debate_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_participant_count, migrations.RunPython.noop),
+    ]
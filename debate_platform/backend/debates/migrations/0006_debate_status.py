@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0005_debate_participant_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='status',
+            field=models.CharField(choices=[('OPEN', 'Open'), ('ACTIVE', 'Active'), ('CLOSED', 'Closed')], default='OPEN', max_length=6),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0006_debate_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['debate', '-timestamp', '-id'], name='message_debate_ts_id_idx'),
+        ),
+    ]
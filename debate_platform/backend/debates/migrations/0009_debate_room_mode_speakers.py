@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0008_presence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='room_mode',
+            field=models.CharField(choices=[('OPEN', 'Open (every participant can call)'), ('STAGE', 'Stage (speakers call, audience listens)')], default='OPEN', max_length=5),
+        ),
+        migrations.AddField(
+            model_name='debate',
+            name='speakers',
+            field=models.ManyToManyField(blank=True, related_name='speaking_debates', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0010_presence_debate_channel_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debate',
+            name='chat_batching',
+            field=models.BooleanField(default=False),
+        ),
+    ]
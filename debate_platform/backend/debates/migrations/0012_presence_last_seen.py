@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0011_debate_chat_batching'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='presence',
+            name='last_seen',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
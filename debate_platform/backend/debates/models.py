@@ -1,12 +1,61 @@
+from decimal import Decimal
 from django.db import models
+from django.utils import timezone
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from accounts.models import User
 
+
+class DebateQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Loads everything DebateSerializer and DebateAdmin read in a single query
+        (plus one prefetch each for participant and speaker ids), so a page costs the same
+        regardless of how many debates or participants it shows. Revenue comes
+        from the DebateRevenue rollup joined into the same query.
+        """
+        return self.select_related('creator', 'revenue').prefetch_related(
+            Prefetch('participants', queryset=User.objects.only('id')),
+            Prefetch('speakers', queryset=User.objects.only('id')),
+        )
+
+    def recount_participants(self):
+        """
+        Repairs the denormalized participant_count column from the M2M table in
+        bulk. Returns the number of debates whose counter had drifted.
+        """
+        actual = Coalesce(Subquery(
+            Debate.participants.through.objects.filter(debate=OuterRef('pk'))
+            .values('debate').annotate(total=Count('pk')).values('total')
+        ), 0)
+        drifted = self.annotate(actual=actual).exclude(participant_count=F('actual'))
+        return self.filter(pk__in=drifted.values('pk')).update(participant_count=actual)
+
+
 class Debate(models.Model):
+    STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('ACTIVE', 'Active'),
+        ('CLOSED', 'Closed'),
+    ]
+    ROOM_MODE_CHOICES = [
+        ('OPEN', 'Open (every participant can call)'),
+        ('STAGE', 'Stage (speakers call, audience listens)'),
+    ]
     title = models.CharField(max_length=255)
     description = models.TextField()
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_debates')
     participants = models.ManyToManyField(User, related_name='debates')
+    # Denormalized participants.count(); seats are taken via debates.admission
+    participant_count = models.PositiveIntegerField(default=0)
     max_participants = models.IntegerField(default=100)
+    status = models.CharField(max_length=6, choices=STATUS_CHOICES, default='OPEN')
+    # In STAGE rooms only the creator and the speakers below exchange WebRTC signaling
+    room_mode = models.CharField(max_length=5, choices=ROOM_MODE_CHOICES, default='OPEN')
+    speakers = models.ManyToManyField(User, related_name='speaking_debates', blank=True)
+    # Busy rooms can opt in to chat delivered as batched array frames (debates.chat_batcher)
+    chat_batching = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     # The fee charged to join the debate (in credits/currency)
     subscription_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -16,36 +65,71 @@ class Debate(models.Model):
     PLATFORM_COMMISSION_RATE = 0.25 # 25% of the fee goes to the platform
     CREATOR_EARNING_RATE = 1 - PLATFORM_COMMISSION_RATE # 75% goes to the creator
 
+    objects = DebateQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the debate list on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='debate_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
     @property
     def platform_commission_per_participant(self):
         """Calculates the platform's 25% share per participant fee."""
-        return self.subscription_fee * self.PLATFORM_COMMISSION_RATE
+        return self.subscription_fee * Decimal(str(self.PLATFORM_COMMISSION_RATE))
 
     @property
     def creator_earning_per_participant(self):
         """Calculates the creator's 75% share per participant fee."""
-        return self.subscription_fee * self.CREATOR_EARNING_RATE
+        return self.subscription_fee * Decimal(str(self.CREATOR_EARNING_RATE))
+
+    def remove_participant(self, user):
+        """
+        Removes ``user`` and gives their seat back by decrementing
+        participant_count. Returns False if they weren't a participant.
+        Call inside transaction.atomic(): the debate row stays locked until
+        commit, so concurrent leaves of the same user decrement it only once.
+        """
+        Debate.objects.select_for_update().filter(pk=self.pk).values_list('pk', flat=True).get()
+        if not self.participants.filter(id=user.id).exists():
+            return False
+        self.participants.remove(user)
+        Debate.objects.filter(pk=self.pk, participant_count__gt=0).update(
+            participant_count=F('participant_count') - 1
+        )
+        return True
+
+    @property
+    def revenue_rollup(self):
+        """This debate's DebateRevenue row (see payments rollup_revenue), or None before its first paid join."""
+        try:
+            return self.revenue
+        except ObjectDoesNotExist:
+            return None
+
+    def platform_commission_due(self):
+        """Total platform share earned from paid participants, as of the last revenue rollup."""
+        rollup = self.revenue_rollup
+        return rollup.platform_commission if rollup else Decimal('0.00')
 
     # --- Reintroducing 'commission_due' as a method for Admin compatibility ---
     # This method is required by the Django Admin configuration (in debates/admin.py).
     def commission_due(self):
         """
-        Provides a summary of the revenue split for the Django Admin interface.
-        Note: Actual earnings/commissions are tracked in the separate Transaction model.
+        Provides a summary of the revenue split for the Django Admin interface,
+        read from the DebateRevenue rollup of the Transaction ledger.
         """
-        # Calculate the number of participants who joined (excluding the creator, as they don't pay)
-        paid_participants_count = self.participants.exclude(id=self.creator.id).count() 
-        
-        if paid_participants_count == 0:
+        rollup = self.revenue_rollup
+        if rollup is None or rollup.paid_joins == 0:
             return "No paid participants yet"
 
-        platform_share = paid_participants_count * self.platform_commission_per_participant
-        creator_share = paid_participants_count * self.creator_earning_per_participant
-        
-        return f"Participants: {paid_participants_count} | Platform: ${platform_share:.2f} | Creator: ${creator_share:.2f}"
+        return (
+            f"Participants: {rollup.paid_joins} | Platform: ${rollup.platform_commission:.2f} | "
+            f"Creator: ${rollup.creator_earnings:.2f}"
+        )
     
     # Set a custom display name for the Admin
     commission_due.short_description = 'Revenue Summary'
@@ -58,5 +142,36 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves "latest N messages of debate X" and before/after cursors
+            models.Index(fields=['debate', '-timestamp', '-id'], name='message_debate_ts_id_idx'),
+        ]
+
     def __str__(self):
         return f"Message by {self.user.username} in {self.debate.title}"
+
+
+class Presence(models.Model):
+    """
+    One open WebSocket connection to a debate room. Written in batches by
+    debates.presence; a user is online in a room while they have at least one row.
+    """
+    debate = models.ForeignKey(Debate, on_delete=models.CASCADE, related_name='presences')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='presences')
+    # A multiplexed connection is present in several debates under one channel name
+    channel_name = models.CharField(max_length=255)
+    connected_at = models.DateTimeField(auto_now_add=True)
+    # Refreshed by the owning worker while the connection lives; stale rows are reaped
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['debate', 'channel_name'], name='presence_debate_channel_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['debate', 'user'], name='presence_debate_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} in {self.debate.title}"
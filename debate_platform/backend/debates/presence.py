@@ -0,0 +1,250 @@
+"""
+Coalesced presence for debate rooms.
+
+DebateConsumer reports connects and disconnects to the worker's PresenceTracker
+instead of broadcasting them. Every FLUSH_INTERVAL_MS the tracker writes the
+net changes to the Presence table in one batch and sends each changed room a
+single 'debate.presence' event: the users who came online, the users who went
+offline (their last connection closed) and the current channel of every user
+whose connections changed, for the consumers' signaling registries.
+
+A connect followed by a disconnect within one interval cancels out without
+touching the database or the group, and the number of room deliveries grows
+with the number of changed rooms per interval rather than with connects times
+room size. The current roster is served by roster() to newly connected
+clients and to the REST snapshot endpoint.
+
+Every TOUCH_INTERVAL_S the tracker refreshes last_seen on the rows of the
+connections this worker still holds. Rows of connections whose worker died
+stop being refreshed; reap_stale() (run by `manage.py reap_connections`)
+removes them from the channel layer groups and the roster after STALE_AFTER_S.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Presence
+from .wire import encode_frame
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FLUSH_INTERVAL_MS': 300,
+    'TOUCH_INTERVAL_S': 60,
+    'STALE_AFTER_S': 180,
+}
+
+# Process-wide counters of reaped connections (see also debates.throttling.stats)
+reap_stats = Counter()
+
+
+def roster(debate_id):
+    """
+    Online users of a room, in order of arrival, as
+    [{'user_id', 'username', 'channel_name'}] with each user's latest connection.
+    """
+    users = {}
+    rows = (
+        Presence.objects.filter(debate_id=debate_id)
+        .order_by('connected_at', 'id')
+        .values_list('user_id', 'user__username', 'channel_name')
+    )
+    for user_id, username, channel_name in rows:
+        if user_id in users:
+            users[user_id]['channel_name'] = channel_name
+        else:
+            users[user_id] = {'user_id': user_id, 'username': username, 'channel_name': channel_name}
+    return list(users.values())
+
+
+class PresenceTracker:
+    def __init__(self, flush_interval_ms, touch_interval_s, stale_after_s):
+        self.flush_interval = flush_interval_ms / 1000
+        self.touch_interval = touch_interval_s
+        self.stale_after = stale_after_s
+        # debate_id -> {'joined': {channel: user_id}, 'left': {channel: user_id}}
+        self.pending = {}
+        # (debate_id, channel) of the connections this worker holds, for the last_seen refresh
+        self.local = set()
+        self.stats = {'marked': 0, 'cancelled': 0, 'flushes': 0, 'failed_flushes': 0, 'room_events': 0, 'touches': 0}
+        self._timer = None
+        self._toucher = None
+        self._flush_lock = asyncio.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'PRESENCE', {})}
+        return cls(config['FLUSH_INTERVAL_MS'], config['TOUCH_INTERVAL_S'], config['STALE_AFTER_S'])
+
+    def mark_joined(self, debate_id, user_id, channel_name):
+        self._changes(debate_id)['joined'][channel_name] = user_id
+        self.local.add((int(debate_id), channel_name))
+        if self._toucher is None or self._toucher.done():
+            self._toucher = asyncio.ensure_future(self._touch_loop())
+
+    def mark_left(self, debate_id, user_id, channel_name):
+        self.local.discard((int(debate_id), channel_name))
+        changes = self._changes(debate_id)
+        if changes['joined'].pop(channel_name, None) is not None:
+            # Connected and disconnected within one interval: nothing to report
+            self.stats['cancelled'] += 1
+            return
+        changes['left'][channel_name] = user_id
+
+    def _changes(self, debate_id):
+        # Consumers hold the id as routed from the URL (a string)
+        debate_id = int(debate_id)
+        self.stats['marked'] += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_soon)
+        return self.pending.setdefault(debate_id, {'joined': {}, 'left': {}})
+
+    def _flush_soon(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._flush_lock:
+            pending, self.pending = self.pending, {}
+            pending = {debate_id: c for debate_id, c in pending.items() if c['joined'] or c['left']}
+            if not pending:
+                return
+            try:
+                diffs = await database_sync_to_async(self._apply)(pending)
+            except Exception:
+                logger.exception("Presence flush for %d rooms failed", len(pending))
+                self.stats['failed_flushes'] += 1
+                # Retry the batch with the next flush rather than lose it
+                self._requeue(pending)
+                return
+            self.stats['flushes'] += 1
+
+            channel_layer = get_channel_layer()
+            for debate_id, diff in diffs.items():
+                event = {
+                    'type': 'debate.presence',
+                    'debate_id': str(debate_id),
+                    'channels': diff['channels'],
+                    'left_ids': diff['left'],
+                }
+                if diff['joined'] or diff['left']:
+                    event['text'] = encode_frame({
+                        'type': 'presence',
+                        'joined': diff['joined'],
+                        'left': diff['left'],
+                    })
+                await channel_layer.group_send(f'debate_{debate_id}', event)
+                self.stats['room_events'] += 1
+
+    def _requeue(self, failed):
+        """Merges an unwritten batch back under the changes marked since it was taken."""
+        for debate_id, old in failed.items():
+            changes = self.pending.setdefault(debate_id, {'joined': {}, 'left': {}})
+            for channel, user_id in old['joined'].items():
+                if changes['left'].pop(channel, None) is not None:
+                    # Left again before the retry: the join cancels out
+                    self.stats['cancelled'] += 1
+                else:
+                    changes['joined'].setdefault(channel, user_id)
+            for channel, user_id in old['left'].items():
+                changes['left'].setdefault(channel, user_id)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_soon)
+
+    async def _touch_loop(self):
+        while self.local:
+            await asyncio.sleep(self.touch_interval)
+            channels = sorted({channel for _, channel in self.local})
+            try:
+                await database_sync_to_async(self._touch)(channels)
+            except Exception:
+                logger.exception("Presence last_seen refresh of %d channels failed", len(channels))
+
+    def _touch(self, channels, chunk=500):
+        now = timezone.now()
+        for start in range(0, len(channels), chunk):
+            Presence.objects.filter(channel_name__in=channels[start:start + chunk]).update(last_seen=now)
+        self.stats['touches'] += 1
+
+    async def reap_stale(self, stale_after_s=None, limit=5000):
+        """
+        Drops connections whose worker stopped refreshing them: discards their
+        channels from the room groups, then removes them from the roster with
+        the usual batched presence diffs. Returns the number reaped. Under the
+        sharded channel layer the discards are forwarded to each channel's
+        worker, so this can run in any process.
+        """
+        stale_after = self.stale_after if stale_after_s is None else stale_after_s
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        rows = await database_sync_to_async(lambda: list(
+            Presence.objects.filter(last_seen__lt=cutoff)
+            .order_by('last_seen')
+            .values_list('debate_id', 'user_id', 'channel_name')[:limit]
+        ))()
+        channel_layer = get_channel_layer()
+        for debate_id, user_id, channel_name in rows:
+            await channel_layer.group_discard(f'debate_{debate_id}', channel_name)
+            await channel_layer.group_discard(f'debate_{debate_id}_stage', channel_name)
+            self._changes(debate_id)['left'][channel_name] = user_id
+        await self.flush()
+        reap_stats['stale_presence'] += len(rows)
+        return len(rows)
+
+    @transaction.atomic
+    def _apply(self, pending):
+        """Writes the batch and returns the per-room roster diffs; all or nothing, so a failed batch can be retried."""
+        debate_ids = list(pending)
+        user_ids = {
+            user_id
+            for changes in pending.values()
+            for side in ('joined', 'left')
+            for user_id in changes[side].values()
+        }
+        affected = Presence.objects.filter(debate_id__in=debate_ids, user_id__in=user_ids)
+
+        before = set(affected.values_list('debate_id', 'user_id'))
+        # A multiplexed connection has one row per debate under the same channel name
+        gone = Q(pk__in=[])
+        for debate_id, changes in pending.items():
+            if changes['left']:
+                gone |= Q(debate_id=debate_id, channel_name__in=list(changes['left']))
+        Presence.objects.filter(gone).delete()
+        Presence.objects.bulk_create(
+            [
+                Presence(debate_id=debate_id, user_id=user_id, channel_name=channel)
+                for debate_id, changes in pending.items()
+                for channel, user_id in changes['joined'].items()
+            ],
+            ignore_conflicts=True,
+        )
+        after = {}
+        for debate_id, user_id, username, channel_name in (
+            affected.order_by('connected_at', 'id')
+            .values_list('debate_id', 'user_id', 'user__username', 'channel_name')
+        ):
+            after[(debate_id, user_id)] = (username, channel_name)
+
+        # 'channels' is a list of [user_id, channel_name] pairs; the channel layer's msgpack rejects int map keys
+        diffs = {debate_id: {'joined': [], 'left': [], 'channels': []} for debate_id in debate_ids}
+        for (debate_id, user_id), (username, channel_name) in after.items():
+            diffs[debate_id]['channels'].append([user_id, channel_name])
+            if (debate_id, user_id) not in before:
+                diffs[debate_id]['joined'].append({'user_id': user_id, 'username': username})
+        for debate_id, user_id in before - after.keys():
+            diffs[debate_id]['left'].append(user_id)
+        return diffs
+
+
+presence_tracker = PresenceTracker.from_settings()
@@ -0,0 +1,121 @@
+"""
+Per-room chat sequence numbers and a bounded replay store for session resume.
+
+Every chat line gets the next number of its room from a shared counter (an
+atomic incr in the ROOM_REPLAY cache, Redis in production) and carries it as
+"seq" in its frame. The encoded frame is also kept under its sequence number
+for TTL_SECONDS, and only the last SIZE numbers of a room are replayed.
+
+A client that reconnects with resume_from=<last seq it holds> gets the missing
+frames in one 'replay' frame instead of the full history. If they are no longer
+all available it gets {'type': 'resync'} followed by the usual 'history' frame.
+
+Frames of different senders can reach a client in a different order than
+their numbers, and a replay may overlap with live frames, so clients should
+dedupe by seq.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SIZE': 500,
+    'TTL_SECONDS': 600,
+    'CACHE_ALIAS': 'default',
+}
+
+
+class RoomReplay:
+    def __init__(self, size, ttl_seconds, cache_alias):
+        self.size = size
+        self.ttl = ttl_seconds
+        self.cache_alias = cache_alias
+        self.stats = {'replays': 0, 'replayed_frames': 0, 'resyncs': 0, 'errors': 0}
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'ROOM_REPLAY', {})}
+        return cls(config['SIZE'], config['TTL_SECONDS'], config['CACHE_ALIAS'])
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def _seq_key(debate_id):
+        return f'debate:{debate_id}:seq'
+
+    @staticmethod
+    def _frame_key(debate_id, seq):
+        return f'debate:{debate_id}:frame:{seq}'
+
+    async def next_seq(self, debate_id):
+        """Allocates the room's next sequence number, or None if the store is unavailable."""
+        key = self._seq_key(debate_id)
+        try:
+            try:
+                return await self.cache.aincr(key)
+            except ValueError:
+                # First message of the room (or the counter was lost): start it, racing senders are fine
+                await self.cache.aadd(key, 0, timeout=None)
+                return await self.cache.aincr(key)
+        except Exception:
+            logger.exception("Could not allocate a sequence number for debate %s", debate_id)
+            self.stats['errors'] += 1
+            return None
+
+    async def remember(self, debate_id, seq, text):
+        try:
+            await self.cache.aset(self._frame_key(debate_id, seq), text, timeout=self.ttl)
+        except Exception:
+            logger.exception("Could not store frame %s of debate %s for replay", seq, debate_id)
+            self.stats['errors'] += 1
+
+    async def current(self, debate_id):
+        """The room's latest sequence number (0 before its first message, None if unavailable)."""
+        try:
+            return await self.cache.aget(self._seq_key(debate_id), 0)
+        except Exception:
+            self.stats['errors'] += 1
+            return None
+
+    async def since(self, debate_id, resume_from):
+        """
+        Encoded frames with seq > resume_from, oldest first, or None when the
+        client has to resync: too far behind, frames expired, or the counter
+        was reset.
+        """
+        current = await self.current(debate_id)
+        if current is None or resume_from > current or current - resume_from > self.size:
+            self.stats['resyncs'] += 1
+            return None
+        seqs = range(resume_from + 1, current + 1)
+        try:
+            found = await self.cache.aget_many([self._frame_key(debate_id, seq) for seq in seqs])
+        except Exception:
+            self.stats['errors'] += 1
+            self.stats['resyncs'] += 1
+            return None
+
+        frames = []
+        for seq in seqs:
+            text = found.get(self._frame_key(debate_id, seq))
+            if text is None:
+                break
+            frames.append(text)
+        # A missing tail after frames that are still stored can only be numbers whose
+        # senders haven't stored them yet (older frames expire and are evicted first);
+        # those arrive live. A gap, or nothing stored at all, means the range is gone.
+        missing = seqs[len(frames):]
+        if (missing and not frames) or any(self._frame_key(debate_id, seq) in found for seq in missing):
+            self.stats['resyncs'] += 1
+            return None
+        self.stats['replays'] += 1
+        self.stats['replayed_frames'] += len(frames)
+        return frames
+
+
+room_replay = RoomReplay.from_settings()
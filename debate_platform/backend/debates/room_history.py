@@ -0,0 +1,120 @@
+"""
+Per-worker ring buffer of the most recent chat events of each debate room.
+
+DebateConsumer pushes a room's backlog to the client right after accept().
+The first connection to a room in this worker loads the backlog from the
+Message table once; after that, the consumers of the room keep it current
+from the chat events they receive, so a reconnect storm after a deploy costs
+at most one history query per room per worker.
+
+A room is evicted as soon as its last local member leaves: with nobody in the
+room, no consumer of this worker receives its chat events, so the ring would go
+stale. The next connection loads it again. Memory is bounded by the rooms that
+have members in this worker.
+"""
+import asyncio
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .models import Message
+from .wire import encode_frame
+
+DEFAULTS = {
+    'SIZE': 50,
+}
+
+
+class Room:
+    def __init__(self, size):
+        # (event id, encoded chat frame) pairs, oldest first
+        self.events = deque(maxlen=size)
+        # Ids of the events in the ring; every local member records each event, so dedupe
+        self.event_ids = set()
+        self.members = 0
+
+    def append(self, event_id, text):
+        if event_id in self.event_ids:
+            return
+        if len(self.events) == self.events.maxlen:
+            self.event_ids.discard(self.events[0][0])
+        self.events.append((event_id, text))
+        if event_id is not None:
+            self.event_ids.add(event_id)
+
+
+class RoomHistory:
+    def __init__(self, size):
+        self.size = size
+        self.rooms = {}
+        self._loading = {}
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'ROOM_HISTORY', {})}
+        return cls(config['SIZE'])
+
+    async def join(self, debate_id):
+        """Registers a local member and returns the room's recent encoded chat frames, oldest first."""
+        room = self.rooms.get(debate_id)
+        if room is None:
+            room = await self._load(debate_id)
+        else:
+            self.stats['hits'] += 1
+        room.members += 1
+        return [text for _, text in room.events]
+
+    def leave(self, debate_id):
+        room = self.rooms.get(debate_id)
+        if room is None:
+            return
+        room.members -= 1
+        if room.members <= 0:
+            del self.rooms[debate_id]
+            self.stats['evictions'] += 1
+
+    def record(self, debate_id, event_id, text):
+        """Appends an encoded chat frame; frames for rooms not warm in this worker are ignored."""
+        room = self.rooms.get(debate_id)
+        if room is not None:
+            room.append(event_id, text)
+
+    async def _load(self, debate_id):
+        # Concurrent first connections to the same room share a single query
+        pending = self._loading.get(debate_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(debate_id))
+            self._loading[debate_id] = pending
+            pending.add_done_callback(lambda _: self._loading.pop(debate_id, None))
+        frames = await pending
+
+        room = self.rooms.get(debate_id)
+        if room is None:
+            room = Room(self.size)
+            for text in frames:
+                room.append(None, text)
+            self.rooms[debate_id] = room
+            self.stats['loads'] += 1
+        return room
+
+    @database_sync_to_async
+    def _fetch(self, debate_id):
+        messages = (
+            Message.objects.filter(debate_id=debate_id)
+            .select_related('user')
+            .order_by('-timestamp', '-id')[:self.size]
+        )
+        return [
+            encode_frame({
+                'type': 'chat_message',
+                'message': message.content,
+                'sender': message.user.username,
+                'timestamp': str(message.timestamp),
+            })
+            for message in reversed(messages)
+        ]
+
+
+room_history = RoomHistory.from_settings()
@@ -6,6 +6,8 @@ from . import consumers
 websocket_urlpatterns = [
     # Use re_path for robustness, ensuring it matches the 'debate' endpoint
     re_path(r'ws/debate/(?P<debate_id>\w+)/$', consumers.DebateConsumer.as_asgi()),
+    # One connection for many debates: subscribe/unsubscribe by debate_id, frames tagged with it
+    re_path(r'ws/debates/$', consumers.MultiplexDebateConsumer.as_asgi()),
     # Make sure you are using 'debate/' (singular) if that's what the frontend sends.
     # If the frontend sends 'debates/' (plural), change this to:
     # re_path(r'ws/debates/(?P<debate_id>\w+)/$', consumers.DebateConsumer.as_asgi()),
@@ -1,17 +1,25 @@
 from rest_framework import serializers
-from .models import Debate
+from .models import Debate, Message
 
 class DebateSerializer(serializers.ModelSerializer):
     creator_username = serializers.ReadOnlyField(source='creator.username')
-    participant_count = serializers.IntegerField(source='participants.count', read_only=True)
     # This field will be visible to Admin only (via context)
-    commission = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, source='commission_due') 
+    commission = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True, source='platform_commission_due') 
 
     class Meta:
         model = Debate
         fields = [
             'id', 'title', 'description', 'creator', 'creator_username',
             'participants', 'participant_count', 'max_participants', 
-            'subscription_fee', 'created_at', 'commission'
+            'subscription_fee', 'room_mode', 'chat_batching', 'speakers', 'created_at', 'commission'
         ]
-        read_only_fields = ['creator', 'participants']
\ No newline at end of file
+        read_only_fields = ['creator', 'participants', 'participant_count', 'speakers']
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    sender = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = Message
+        fields = ['id', 'debate', 'user', 'sender', 'content', 'timestamp']
+        read_only_fields = fields
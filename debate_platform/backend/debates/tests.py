@@ -1,3 +1,945 @@
-from django.test import TestCase
+import asyncio
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import IntegrityError, OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from backend.asgi import application
+from backend.channel_layers import HashRing, ShardedChannelLayer
+from payments.models import EarningBalance, Transaction, UserCredit
+from zag_debate_platform.middleware import get_user_from_token, token_cache, user_cache
+from .chat_batcher import ChatBatcher, chat_batcher
+from .chat_buffer import MessageWriteBuffer
+from .enrollment import (
+    ALREADY_JOINED, DEBATE_FULL, INSUFFICIENT_CREDITS, JOINED, NO_CREDIT_ACCOUNT, UNKNOWN_USER,
+)
+from .models import Debate, Message, Presence
+from .presence import PresenceTracker, presence_tracker
+from .replay import RoomReplay, room_replay
+from .room_history import RoomHistory
+from .wire import decode_frame, encode_frame, encode_frame_list, to_msgpack
+from .consumers import DebateRoom, DebateSocketConsumer
+from .throttling import CLOSE_FLOODING, CLOSE_TOO_SLOW, Outbox, RateLimiter, TokenBucket, stats as throttle_stats
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class DebateTestCase(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(username='creator', password='x')
+        self.debate = Debate.objects.create(title='Topic', description='...', creator=self.creator, max_participants=3)
+
+    def user_with_credits(self, username, balance=100):
+        user = User.objects.create_user(username=username, password='x')
+        UserCredit.objects.create(user=user, balance=balance)
+        return user
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def assertCounterMatches(self):
+        self.debate.refresh_from_db()
+        self.assertEqual(self.debate.participant_count, self.debate.participants.count())
+
+
+class BulkJoinTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+
+    def bulk_join(self, user_ids, as_user=None):
+        return self.client_for(as_user or self.staff).post(
+            f'/api/debates/{self.debate.id}/join/bulk/', {'user_ids': user_ids}, format='json',
+        )
+
+    def test_only_staff_may_enroll_others(self):
+        payer = self.user_with_credits('payer')
+
+        response = self.bulk_join([payer.id], as_user=self.creator)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(UserCredit.objects.get(user=payer).balance, 100)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_user_ids_must_be_integers(self):
+        for user_ids in ([True], ['1'], 'abc'):
+            self.assertEqual(self.bulk_join(user_ids).status_code, 400)
+
+    def test_outcomes_per_user(self):
+        first, second = self.user_with_credits('first'), self.user_with_credits('second')
+        poor = self.user_with_credits('poor', balance=5)
+        no_account = User.objects.create_user(username='no_account', password='x')
+        member = self.user_with_credits('member')
+        self.client_for(member).post(f'/api/debates/{self.debate.id}/join/')
+        # One seat left after the member, the creator and `first`
+        late = self.user_with_credits('late')
+
+        response = self.bulk_join([self.creator.id, first.id, poor.id, no_account.id, member.id, 999999, late.id])
+
+        self.assertEqual(response.status_code, 200)
+        results = {int(user_id): outcome for user_id, outcome in response.data['results'].items()}
+        self.assertEqual(results, {
+            self.creator.id: JOINED,
+            first.id: JOINED,
+            poor.id: INSUFFICIENT_CREDITS,
+            no_account.id: NO_CREDIT_ACCOUNT,
+            member.id: ALREADY_JOINED,
+            999999: UNKNOWN_USER,
+            late.id: DEBATE_FULL,
+        })
+        self.assertEqual(second.debates.count(), 0)
+        self.assertCounterMatches()
+        self.assertEqual(self.debate.participant_count, 3)
+
+    def test_charges_and_ledger_rows(self):
+        payers = [self.user_with_credits(f'payer{index}') for index in range(2)]
+
+        self.bulk_join([self.creator.id] + [payer.id for payer in payers])
+
+        for payer in payers:
+            self.assertEqual(UserCredit.objects.get(user=payer).balance, 90)
+            debit = Transaction.objects.get(user=payer)
+            self.assertEqual((debit.transaction_type, debit.amount, debit.debate_id), ('DEB', Decimal('-10.00'), self.debate.id))
+        earnings = Transaction.objects.filter(user=self.creator, transaction_type='EAR')
+        self.assertEqual(sorted(earnings.values_list('amount', flat=True)), [Decimal('7.50')] * 2)
+        # The creator joins for free
+        self.assertFalse(Transaction.objects.filter(user=self.creator, transaction_type='DEB').exists())
+        self.assertEqual(EarningBalance.objects.get(user=self.creator).balance, Decimal('15.00'))
+        self.assertCounterMatches()
+
+    def test_nobody_is_charged_when_the_debate_is_full(self):
+        self.debate.max_participants = 0
+        self.debate.save()
+        payer = self.user_with_credits('payer')
+
+        response = self.bulk_join([payer.id])
+
+        self.assertEqual(response.data['results'], {payer.id: DEBATE_FULL})
+        self.assertEqual(UserCredit.objects.get(user=payer).balance, 100)
+        self.assertFalse(Transaction.objects.exists())
+
+
+class JoinTests(DebateTestCase):
+    def join(self, user):
+        return self.client_for(user).post(f'/api/debates/{self.debate.id}/join/')
+
+    def test_paid_join_debits_the_fee_and_pays_the_creator(self):
+        payer = self.user_with_credits('payer')
+
+        response = self.join(payer)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserCredit.objects.get(user=payer).balance, 90)
+        ledger = sorted(Transaction.objects.values_list('user_id', 'transaction_type', 'amount', 'debate_id'))
+        self.assertEqual(ledger, sorted([
+            (payer.id, 'DEB', Decimal('-10.00'), self.debate.id),
+            (self.creator.id, 'EAR', Decimal('7.50'), self.debate.id),
+        ]))
+        self.assertEqual(EarningBalance.objects.get(user=self.creator).balance, Decimal('7.50'))
+        self.assertTrue(self.debate.participants.filter(id=payer.id).exists())
+        self.assertCounterMatches()
+
+    def test_joining_twice_charges_once(self):
+        payer = self.user_with_credits('payer')
+
+        self.join(payer)
+        response = self.join(payer)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserCredit.objects.get(user=payer).balance, 90)
+        self.assertEqual(Transaction.objects.filter(user=payer).count(), 1)
+        self.assertCounterMatches()
+
+    def test_insufficient_credits_hands_the_seat_back(self):
+        poor = self.user_with_credits('poor', balance=5)
+
+        response = self.join(poor)
+
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(UserCredit.objects.get(user=poor).balance, 5)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertCounterMatches()
+        self.assertEqual(self.debate.participant_count, 0)
+
+    def test_full_debate_rejects_without_charging(self):
+        for index in range(self.debate.max_participants):
+            self.assertEqual(self.join(self.user_with_credits(f'payer{index}')).status_code, 200)
+        late = self.user_with_credits('late')
+
+        response = self.join(late)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(UserCredit.objects.get(user=late).balance, 100)
+        self.assertFalse(Transaction.objects.filter(user=late).exists())
+        self.assertCounterMatches()
+        self.assertEqual(self.debate.participant_count, self.debate.max_participants)
+
+    def test_creator_joins_free_once(self):
+        self.assertEqual(self.join(self.creator).status_code, 200)
+        self.assertEqual(self.join(self.creator).status_code, 400)
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertCounterMatches()
+        self.assertEqual(self.debate.participant_count, 1)
+
+    def test_creator_cannot_join_a_full_debate(self):
+        self.debate.max_participants = 0
+        self.debate.save()
+
+        self.assertEqual(self.join(self.creator).status_code, 409)
+        self.assertCounterMatches()
+
+
+class CreatorEarningTests(DebateTestCase):
+    def earnings(self):
+        return self.client_for(self.creator).get('/api/debates/earnings/')
+
+    def withdraw(self):
+        return self.client_for(self.creator).post('/api/debates/earnings/')
+
+    def test_joins_accrue_withdrawable_earnings(self):
+        for index in range(2):
+            self.client_for(self.user_with_credits(f'payer{index}')).post(f'/api/debates/{self.debate.id}/join/')
+
+        self.assertEqual(self.earnings().data['available_earnings'], Decimal('15.00'))
+
+    def test_withdrawal_converts_earnings_to_credits_once(self):
+        UserCredit.objects.create(user=self.creator, balance=0)
+        for index in range(2):
+            self.client_for(self.user_with_credits(f'payer{index}')).post(f'/api/debates/{self.debate.id}/join/')
+
+        response = self.withdraw()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['credits_added'], 15)
+        self.assertEqual(UserCredit.objects.get(user=self.creator).balance, 15)
+        self.assertEqual(EarningBalance.objects.get(user=self.creator).balance, 0)
+        withdrawal = Transaction.objects.get(user=self.creator, transaction_type='WDR')
+        self.assertEqual(withdrawal.amount, Decimal('-15.00'))
+        # The balance row still mirrors the creator's EAR and WDR rows
+        self.assertEqual(
+            sum(Transaction.objects.filter(user=self.creator).values_list('amount', flat=True)),
+            EarningBalance.objects.get(user=self.creator).balance,
+        )
+
+        self.assertEqual(self.withdraw().status_code, 400)
+        self.assertEqual(UserCredit.objects.get(user=self.creator).balance, 15)
+        self.assertEqual(Transaction.objects.filter(transaction_type='WDR').count(), 1)
+
+    def test_nothing_to_withdraw(self):
+        UserCredit.objects.create(user=self.creator, balance=0)
+
+        self.assertEqual(self.earnings().data['available_earnings'], 0)
+        self.assertEqual(self.withdraw().status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+
+
+class MessageWriteBufferTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = MessageWriteBuffer(flush_interval_ms=250, max_batch=10, max_pending=100)
+        self.bulk_create = Message.objects.bulk_create
+
+    def queue(self, *contents):
+        for content in contents:
+            self.buffer.pending.append(Message(debate=self.debate, user=self.creator, content=content))
+
+    def reject_poison(self, messages, **kwargs):
+        if any(message.content == 'poison' for message in messages):
+            raise IntegrityError("rejected")
+        return self.bulk_create(messages, **kwargs)
+
+    def test_a_rejected_row_does_not_hold_back_its_batch(self):
+        self.queue('first', 'poison', 'last')
+
+        with mock.patch.object(Message.objects, 'bulk_create', side_effect=self.reject_poison):
+            self.buffer.flush_sync()
+
+        self.assertEqual(list(Message.objects.order_by('id').values_list('content', flat=True)), ['first', 'last'])
+        self.assertEqual(self.buffer.stats['rejected'], 1)
+        self.assertEqual(self.buffer.stats['flushed'], 2)
+        self.assertFalse(self.buffer.pending)
+
+    def test_failed_flush_is_retried_without_another_message(self):
+        self.buffer = MessageWriteBuffer(flush_interval_ms=10, max_batch=10, max_pending=100)
+        self.queue('first', 'last')
+        write = self.buffer.write
+        calls = []
+
+        def fail_once(batch):
+            calls.append(len(batch))
+            return (0, batch) if len(calls) == 1 else write(batch)
+
+        async def flush():
+            with mock.patch.object(self.buffer, 'write', side_effect=fail_once):
+                await self.buffer.flush()
+                self.assertIsNotNone(self.buffer._timer)
+                # The retry runs on the buffer's own timer (2 x 10ms after one failure)
+                await asyncio.sleep(0.1)
+
+        async_to_sync(flush)()
+
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(list(Message.objects.order_by('id').values_list('content', flat=True)), ['first', 'last'])
+        self.assertEqual((self.buffer.stats['failed_flushes'], self.buffer.failures), (1, 0))
+        self.assertFalse(self.buffer.pending)
+
+    def test_rows_are_kept_while_the_database_is_down(self):
+        self.queue('first', 'last')
+
+        with mock.patch.object(Message.objects, 'bulk_create', side_effect=OperationalError("down")):
+            saved, unsaved = self.buffer.write(list(self.buffer.pending))
+
+        self.assertEqual((saved, [message.content for message in unsaved]), (0, ['first', 'last']))
+        self.assertEqual(self.buffer.stats['rejected'], 0)
+
+
+class MessageListTests(DebateTestCase):
+    def messages(self, user, debate_id=None):
+        return self.client_for(user).get(f'/api/debates/{debate_id or self.debate.id}/messages/')
+
+    def test_unknown_debate_is_not_found(self):
+        self.assertEqual(self.messages(self.creator, debate_id=999999).status_code, 404)
+
+    def test_pages_back_towards_newer_messages_with_equal_timestamps(self):
+        for index in range(7):
+            Message.objects.create(debate=self.debate, user=self.creator, content=f'm{index}')
+        Message.objects.update(timestamp=timezone.now())
+        newest_first = list(Message.objects.order_by('-id').values_list('content', flat=True))
+        client = self.client_for(self.creator)
+
+        # Walk to the oldest page, then follow `previous` back up
+        url, last = f'/api/debates/{self.debate.id}/messages/?page_size=3', None
+        while url:
+            last = client.get(url).data
+            url = last['next']
+        pages = [[message['content'] for message in last['results']]]
+        url = last['previous']
+        while url:
+            page = client.get(url).data
+            pages.insert(0, [message['content'] for message in page['results']])
+            self.assertIsNotNone(page['next'])
+            url = page['previous']
+
+        # Every page stays newest-first, and together they cover each message exactly once
+        self.assertEqual([content for page in pages for content in page], newest_first)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+    def test_only_members_and_staff_can_read(self):
+        Message.objects.create(debate=self.debate, user=self.creator, content='hello')
+        member = self.user_with_credits('member')
+        self.client_for(member).post(f'/api/debates/{self.debate.id}/join/')
+        outsider = User.objects.create_user(username='outsider', password='x')
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+
+        self.assertEqual(self.messages(outsider).status_code, 403)
+        for reader in (self.creator, member, staff):
+            response = self.messages(reader)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([message['content'] for message in response.data['results']], ['hello'])
+
+
+class RoomReplayTests(TestCase):
+    def setUp(self):
+        self.replay = RoomReplay(size=5, ttl_seconds=60, cache_alias='realtime')
+        self.replay.cache.clear()
+
+    def chat(self, count):
+        async def chat():
+            for _ in range(count):
+                seq = await self.replay.next_seq(1)
+                await self.replay.remember(1, seq, encode_frame({'seq': seq}))
+        async_to_sync(chat)()
+
+    def since(self, resume_from):
+        return async_to_sync(self.replay.since)(1, resume_from)
+
+    def test_client_within_the_window_gets_only_the_missed_frames(self):
+        self.chat(4)
+
+        self.assertEqual(self.since(2), ['{"seq":3}', '{"seq":4}'])
+        self.assertEqual(self.since(4), [])
+        self.assertEqual((self.replay.stats['replays'], self.replay.stats['resyncs']), (2, 0))
+
+    def test_client_beyond_the_window_or_past_a_lost_frame_must_resync(self):
+        self.chat(8)
+
+        # Further behind than SIZE numbers
+        self.assertIsNone(self.since(1))
+        # Within SIZE, but a frame in the middle of the range is gone
+        self.replay.cache.delete(self.replay._frame_key(1, 6))
+        self.assertIsNone(self.since(4))
+        self.assertEqual(self.replay.stats['resyncs'], 2)
+
+    def test_resume_point_ahead_of_the_counter_means_a_reset(self):
+        self.chat(3)
+
+        self.assertIsNone(self.since(10))
+        self.assertEqual(self.replay.stats['resyncs'], 1)
+
+
+class RoomHistoryTests(DebateTestCase):
+    def test_room_is_reloaded_after_its_last_member_leaves(self):
+        history = RoomHistory(size=10)
+        Message.objects.create(debate=self.debate, user=self.creator, content='before')
+        self.assertEqual(len(async_to_sync(history.join)(self.debate.id)), 1)
+
+        history.leave(self.debate.id)
+        # Sent while nobody in this worker was in the room to record it
+        Message.objects.create(debate=self.debate, user=self.creator, content='while empty')
+
+        self.assertNotIn(self.debate.id, history.rooms)
+        self.assertEqual(len(async_to_sync(history.join)(self.debate.id)), 2)
+        self.assertEqual(history.stats['loads'], 2)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class PresenceTrackerTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create_user(username='viewer', password='x')
+
+    def test_join_and_leave_within_one_window_cancel_out(self):
+        tracker = PresenceTracker(flush_interval_ms=60000, touch_interval_s=60, stale_after_s=180)
+
+        async def window():
+            layer = get_channel_layer()
+            listener = await layer.new_channel()
+            await layer.group_add(f'debate_{self.debate.id}', listener)
+            tracker.mark_joined(str(self.debate.id), self.viewer.id, 'brief')
+            tracker.mark_left(str(self.debate.id), self.viewer.id, 'brief')
+            tracker.mark_joined(str(self.debate.id), self.creator.id, 'stays')
+            await tracker.flush()
+            tracker._toucher.cancel()
+            return await layer.receive(listener)
+
+        event = async_to_sync(window)()
+
+        self.assertEqual(list(Presence.objects.values_list('user_id', 'channel_name')), [(self.creator.id, 'stays')])
+        self.assertEqual(tracker.stats['cancelled'], 1)
+        # One room event, announcing only the connection that stayed
+        self.assertEqual(decode_frame(event['text'], None), {
+            'type': 'presence', 'joined': [{'user_id': self.creator.id, 'username': 'creator'}], 'left': [],
+        })
+
+    def test_failed_flush_is_retried_after_the_database_recovers(self):
+        tracker = PresenceTracker(flush_interval_ms=10, touch_interval_s=60, stale_after_s=180)
+        apply = tracker._apply
+        calls = []
+
+        def fail_once(pending):
+            calls.append(pending)
+            if len(calls) == 1:
+                raise OperationalError("down")
+            return apply(pending)
+
+        async def flush():
+            with mock.patch.object(tracker, '_apply', side_effect=fail_once):
+                tracker.mark_joined(str(self.debate.id), self.viewer.id, 'viewer-channel')
+                await tracker.flush()
+                # The requeued batch goes out on the tracker's own timer
+                await asyncio.sleep(0.1)
+            tracker._toucher.cancel()
+
+        async_to_sync(flush)()
+
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(Presence.objects.filter(user=self.viewer, channel_name='viewer-channel').exists())
+        self.assertEqual((tracker.stats['failed_flushes'], tracker.stats['flushes']), (1, 1))
+        self.assertEqual(tracker.pending, {})
+
+    def test_reap_stale_drops_only_connections_past_the_ttl(self):
+        Presence.objects.create(debate=self.debate, user=self.viewer, channel_name='gone')
+        Presence.objects.create(debate=self.debate, user=self.creator, channel_name='live')
+        Presence.objects.filter(channel_name='gone').update(last_seen=timezone.now() - timedelta(hours=1))
+        tracker = PresenceTracker(flush_interval_ms=60000, touch_interval_s=60, stale_after_s=180)
+
+        async def reap():
+            layer = get_channel_layer()
+            await layer.group_add(f'debate_{self.debate.id}', 'gone')
+            reaped = await tracker.reap_stale(stale_after_s=60)
+            return reaped, layer.groups.get(f'debate_{self.debate.id}', {})
+
+        reaped, members = async_to_sync(reap)()
+
+        self.assertEqual(reaped, 1)
+        self.assertEqual(list(Presence.objects.values_list('channel_name', flat=True)), ['live'])
+        self.assertNotIn('gone', members)
+
+    def test_failed_flush_is_merged_back_under_newer_changes(self):
+        tracker = PresenceTracker(flush_interval_ms=60000, touch_interval_s=60, stale_after_s=180)
+        tracker.pending = {1: {'joined': {'first': 10, 'second': 20}, 'left': {'gone': 30}}}
+
+        def fail(pending):
+            # Marked while the batch was being written: 'first' disconnected, 'third' connected
+            tracker.pending = {1: {'joined': {'third': 40}, 'left': {'first': 10}}}
+            raise OperationalError("down")
+
+        async def flush():
+            with mock.patch.object(tracker, '_apply', side_effect=fail):
+                await tracker.flush()
+            self.assertIsNotNone(tracker._timer)
+            tracker._timer.cancel()
+
+        async_to_sync(flush)()
+
+        self.assertEqual(tracker.pending, {1: {'joined': {'second': 20, 'third': 40}, 'left': {'gone': 30}}})
+        self.assertEqual(tracker.stats['failed_flushes'], 1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingLayer:
+    def __init__(self):
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+class ChatBatcherTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('debates.chat_batcher.time', mock.Mock(monotonic=self.clock))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.layer = RecordingLayer()
+
+    def batcher(self, **config):
+        # A 10 ms rate window makes every message in the same instant add 100/s, so rooms are busy at once
+        config = {'min_interval_ms': 10, 'max_interval_ms': 50, 'target_batch': 8, 'max_batch': 100,
+                  'immediate_below_rate': 5, 'rate_window_s': 0.01, **config}
+        return ChatBatcher(**config)
+
+    def add(self, batcher, count, wait=0):
+        async def add():
+            for n in range(count):
+                await batcher.add(self.layer, 'debate_1', '1', f'e{n}', encode_frame({'type': 'chat_message', 'n': n}))
+            await asyncio.sleep(wait)
+        async_to_sync(add)()
+
+    def test_full_batch_is_sent_without_waiting(self):
+        batcher = self.batcher(max_batch=3)
+
+        self.add(batcher, 3)
+
+        [(group, event)] = self.layer.sent
+        self.assertEqual((group, event['type']), ('debate_1', 'debate.messages'))
+        self.assertEqual([item[0] for item in event['items']], ['e0', 'e1', 'e2'])
+        self.assertEqual([frame['n'] for frame in decode_frame(event['text'])['messages']], [0, 1, 2])
+        self.assertIsNone(batcher.rooms['1'].timer)
+
+    def test_partial_batch_is_sent_when_the_interval_elapses(self):
+        batcher = self.batcher()
+
+        self.add(batcher, 2, wait=0.1)
+
+        [(_, event)] = self.layer.sent
+        self.assertEqual([item[0] for item in event['items']], ['e0', 'e1'])
+        self.assertEqual(batcher.stats['batches'], 1)
+
+    def test_quiet_room_sends_each_line_at_once(self):
+        batcher = self.batcher(rate_window_s=1.0)
+
+        async def chat():
+            for n in range(3):
+                self.clock.now += 10
+                await batcher.add(self.layer, 'debate_1', '1', f'e{n}', encode_frame({'type': 'chat_message'}))
+        async_to_sync(chat)()
+
+        self.assertEqual([event['type'] for _, event in self.layer.sent], ['debate.message'] * 3)
+        self.assertEqual(batcher.stats['immediate'], 3)
+
+    def test_rooms_without_chat_batching_bypass_the_batcher(self):
+        consumer = mock.Mock(channel_layer=self.layer, channel_name='viewer', user=mock.Mock(id=1))
+        room = DebateRoom(consumer, 1)
+
+        async def send(chat_batching):
+            room.chat_batching = chat_batching
+            await room.broadcast_chat('hi', 'viewer', event_id='e1')
+
+        with mock.patch.object(room_replay, 'next_seq', mock.AsyncMock(return_value=None)), \
+                mock.patch.object(chat_batcher, 'add', mock.AsyncMock()) as add:
+            async_to_sync(send)(False)
+            self.assertFalse(add.called)
+            async_to_sync(send)(True)
+            self.assertTrue(add.called)
+
+        [(group, event)] = self.layer.sent
+        self.assertEqual((group, event['type'], event['id']), ('debate_1', 'debate.message', 'e1'))
+
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('debates.throttling.time.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_allows_a_burst_then_refills_at_its_rate(self):
+        bucket = TokenBucket(rate=2, burst=3)
+
+        self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+        self.clock.now += 0.5  # One token back at 2 per second
+        self.assertEqual([bucket.consume() for _ in range(2)], [True, False])
+        self.clock.now += 60  # Refills only up to the burst
+        self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+
+    @override_settings(WS_RATE_LIMITS={'subscribe': (0.001, 3)})
+    def test_unsubscribe_draws_from_the_subscribe_bucket(self):
+        limiter = RateLimiter()
+        throttled = throttle_stats['throttled.unsubscribe']
+
+        allowed = [limiter.allow(command) for command in ('subscribe', 'unsubscribe', 'subscribe', 'unsubscribe')]
+
+        self.assertEqual(allowed, [True, True, True, False])
+        self.assertEqual(throttle_stats['throttled.unsubscribe'], throttled + 1)
+        # Unlimited commands don't touch any bucket
+        self.assertTrue(all(limiter.allow('pong') for _ in range(10)))
+
+    @override_settings(WS_FLOOD_LIMIT=(1, 2))
+    def test_flood_budget_runs_out_after_repeated_throttling(self):
+        limiter = RateLimiter()
+
+        self.assertEqual([limiter.is_flooding() for _ in range(3)], [False, False, True])
+        self.clock.now += 1
+        self.assertFalse(limiter.is_flooding())
+
+
+class OutboxTests(TestCase):
+    def run_outbox(self, frames, maxsize=2):
+        """Queues ``frames`` ((text, droppable) pairs) behind a stalled socket; returns put results and the queue."""
+        async def run():
+            stalled = asyncio.Event()
+            outbox = Outbox(lambda frame: stalled.wait(), maxsize=maxsize)
+            # The writer takes the first frame and then blocks on the socket
+            outbox.put('in flight')
+            await asyncio.sleep(0)
+            results = [outbox.put(text, droppable=droppable) for text, droppable in frames]
+            queued = [text for text, _ in outbox.frames]
+            outbox.close()
+            return results, queued
+        return async_to_sync(run)()
+
+    def test_oldest_chat_frame_is_dropped_first(self):
+        results, queued = self.run_outbox([('chat 1', True), ('signal', False), ('chat 2', True)])
+
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(queued, ['signal', 'chat 2'])
+
+    def test_client_a_whole_outbox_behind_is_reported(self):
+        results, queued = self.run_outbox([(f'signal {index}', False) for index in range(4)])
+
+        # Control frames are never dropped; the second overflow (maxsize 2) asks for a close
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(len(queued), 4)
+
+    def test_slow_client_is_closed_with_4009(self):
+        consumer = DebateSocketConsumer()
+        consumer.outbox = mock.Mock(put=mock.Mock(return_value=False))
+        consumer.close = mock.AsyncMock()
+
+        async_to_sync(consumer.queue_frame)('frame')
+
+        consumer.close.assert_awaited_once_with(code=CLOSE_TOO_SLOW)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_LAYERS,
+    WS_RATE_LIMITS={'bogus': (0.001, 1)}, WS_FLOOD_LIMIT=(0.001, 1),
+)
+class FloodingTests(TestCase):
+    def test_flooding_client_is_closed_with_4008(self):
+        token = str(AccessToken.for_user(User.objects.create_user(username='flooder', password='x')))
+
+        async def flood():
+            communicator = WebsocketCommunicator(application, f'/ws/debates/?token={token}')
+            await communicator.connect()
+            frames = []
+            for _ in range(3):
+                await communicator.send_json_to({'command': 'bogus'})
+            frames.append(await communicator.receive_json_from())
+            frames.append(await communicator.receive_json_from())
+            closed = await communicator.receive_output()
+            await communicator.wait()
+            return frames, closed
+
+        frames, closed = async_to_sync(flood)()
+
+        # The first command is handled (and refused for lacking a debate_id), the second throttled
+        self.assertEqual([frame['type'] for frame in frames], ['error', 'error'])
+        self.assertEqual(frames[1]['detail'], 'rate_limited')
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': CLOSE_FLOODING})
+
+
+class WireTests(TestCase):
+    frame = {'type': 'chat_message', 'message': 'Ça va? 討論 🎤', 'sender': 'zoë', 'seq': 7}
+
+    def test_json_frames_round_trip(self):
+        self.assertEqual(decode_frame(encode_frame(self.frame)), self.frame)
+
+    def test_msgpack_frames_round_trip(self):
+        packed = to_msgpack(encode_frame(self.frame))
+
+        self.assertIsInstance(packed, bytes)
+        self.assertEqual(decode_frame(bytes_data=packed), self.frame)
+
+    def test_frame_list_round_trips_in_both_encodings(self):
+        encoded = encode_frame_list('history', 'messages', [encode_frame(self.frame), encode_frame({'type': 'ping'})], seq=7)
+        expected = {'type': 'history', 'seq': 7, 'messages': [self.frame, {'type': 'ping'}]}
+
+        self.assertEqual(decode_frame(encoded), expected)
+        self.assertEqual(decode_frame(bytes_data=to_msgpack(encoded)), expected)
+
+    def test_cached_msgpack_frames_are_immutable_and_keyed_by_content(self):
+        encoded = encode_frame(self.frame)
+        first = to_msgpack(encoded)
+
+        # Every binary recipient gets the same immutable bytes; decoding yields a fresh object
+        self.assertIs(to_msgpack(encoded), first)
+        decode_frame(bytes_data=first)['message'] = 'changed'
+        self.assertEqual(decode_frame(bytes_data=to_msgpack(encoded)), self.frame)
+        # A frame that differs in any field is transcoded on its own, never served from another's entry
+        edited = encode_frame({**self.frame, 'message': 'Ça va? 討論 🎤!'})
+        self.assertEqual(decode_frame(bytes_data=to_msgpack(edited))['message'], 'Ça va? 討論 🎤!')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, WS_MAX_SUBSCRIPTIONS=2)
+class MultiplexConsumerTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Debate.objects.create(title='Second', description='...', creator=self.creator)
+        self.third = Debate.objects.create(title='Third', description='...', creator=self.creator)
+        self.token = str(AccessToken.for_user(self.creator))
+
+    def session(self, commands):
+        """Sends ``commands`` over one multiplexed connection and returns every frame received."""
+        async def run():
+            communicator = WebsocketCommunicator(application, f'/ws/debates/?token={self.token}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frames = []
+            for command in commands:
+                await communicator.send_json_to(command)
+                while True:
+                    frame = await communicator.receive_json_from()
+                    frames.append(frame)
+                    if frame['type'] in ('subscribed', 'error'):
+                        break
+            await communicator.disconnect()
+            # Don't leave the worker's presence timers behind on this event loop
+            await presence_tracker.flush()
+            presence_tracker._toucher.cancel()
+            return frames
+        return async_to_sync(run)()
+
+    def test_frames_of_each_subscription_are_tagged_with_its_debate(self):
+        frames = self.session([
+            {'command': 'subscribe', 'debate_id': self.debate.id},
+            {'command': 'subscribe', 'debate_id': self.other.id},
+        ])
+
+        by_debate = {}
+        for frame in frames:
+            by_debate.setdefault(frame['debate_id'], []).append(frame['type'])
+        self.assertEqual(by_debate, {
+            self.debate.id: ['history', 'presence_snapshot', 'subscribed'],
+            self.other.id: ['history', 'presence_snapshot', 'subscribed'],
+        })
+
+    def test_subscriptions_beyond_the_limit_are_refused(self):
+        frames = self.session([
+            {'command': 'subscribe', 'debate_id': debate.id} for debate in (self.debate, self.other, self.third)
+        ])
+
+        self.assertEqual(frames[-1], {'debate_id': self.third.id, 'type': 'error', 'detail': 'Too many subscriptions.'})
+        self.assertEqual(sum(frame['type'] == 'subscribed' for frame in frames), 2)
+
+    def test_unknown_room_command_gets_an_error_frame(self):
+        frames = self.session([
+            {'command': 'subscribe', 'debate_id': self.debate.id},
+            {'command': 'dance', 'debate_id': self.debate.id},
+        ])
+
+        self.assertEqual(frames[-1], {
+            'debate_id': self.debate.id, 'type': 'error', 'detail': 'unknown_command', 'command': 'dance',
+        })
+
+
+class ShardedChannelLayerTests(TestCase):
+    def test_discard_from_another_process_reaches_the_channels_worker(self):
+        network = InMemoryChannelLayer()
+        worker = ShardedChannelLayer(inner=network, shards=['w0'], worker_id='w0')
+        # The reaper's layer, in a process of its own
+        reaper = ShardedChannelLayer(inner=network, shards=['w0'], worker_id='reaper')
+
+        async def reap():
+            channel = await worker.new_channel()
+            await worker.group_add('debate_1', channel)
+            await reaper.group_discard('debate_1', channel)
+            await asyncio.sleep(0.05)
+            await worker.close()
+
+        async_to_sync(reap)()
+
+        self.assertNotIn('debate_1', worker.local_groups)
+
+    def test_adding_a_shard_moves_only_its_share_of_keys(self):
+        keys = [str(debate_id) for debate_id in range(2000)]
+        before = HashRing(['w0', 'w1', 'w2'])
+        after = HashRing(['w0', 'w1', 'w2', 'w3'])
+
+        moved = [key for key in keys if before.owner(key) != after.owner(key)]
+
+        # Every moved key goes to the new shard, and roughly a quarter of them move
+        self.assertEqual({after.owner(key) for key in moved}, {'w3'})
+        self.assertLess(len(moved), len(keys) * 0.35)
+        self.assertGreater(len(moved), len(keys) * 0.15)
+
+    def test_group_send_reaches_members_on_the_other_shard(self):
+        network = InMemoryChannelLayer()
+        w0 = ShardedChannelLayer(inner=network, shards=['w0', 'w1'], worker_id='w0')
+        w1 = ShardedChannelLayer(inner=network, shards=['w0', 'w1'], worker_id='w1')
+        group = next(f'debate_{n}' for n in range(100) if w0.owner_of(f'debate_{n}') == 'w1')
+
+        async def chat():
+            here, there = await w0.new_channel(), await w1.new_channel()
+            await w1.group_add(group, there)
+            await w0.group_add(group, here)  # registers w0 with the owner
+            await asyncio.sleep(0.05)
+            await w0.group_send(group, {'type': 'from.w0'})
+            await w1.group_send(group, {'type': 'from.w1'})
+            received = [
+                sorted([(await layer.receive(channel))['type'] for _ in range(2)])
+                for layer, channel in ((w0, here), (w1, there))
+            ]
+            # The non-owner's last member leaving unregisters it from the owner
+            await w0.group_discard(group, here)
+            await asyncio.sleep(0.05)
+            await w0.close()
+            await w1.close()
+            return received
+
+        # Local members are served before the network hop, so only the set of messages is fixed
+        self.assertEqual(async_to_sync(chat)(), [['from.w0', 'from.w1'], ['from.w0', 'from.w1']])
+        self.assertEqual(w1.remote_workers[group], {})
+
+    def test_cancelled_receive_drops_the_channel(self):
+        layer = ShardedChannelLayer(inner=InMemoryChannelLayer(), shards=['w0'], worker_id='w0')
+
+        async def cancel():
+            channel = await layer.new_channel()
+            receiving = asyncio.ensure_future(layer.receive(channel))
+            await asyncio.sleep(0)
+            receiving.cancel()
+            # Arrives between the cancellation and the consumer going away
+            await layer.send(channel, {'type': 'late'})
+            await asyncio.gather(receiving, return_exceptions=True)
+            await layer.close()
+            return channel
+
+        self.assertNotIn(async_to_sync(cancel)(), layer.queues)
+
+    def test_unread_messages_and_channels_expire(self):
+        layer = ShardedChannelLayer(inner=InMemoryChannelLayer(), shards=['w0'], worker_id='w0', expiry=60)
+        later = time.monotonic() + 61
+
+        async def expire():
+            reader, idle = await layer.new_channel(), await layer.new_channel()
+            await layer.group_add('debate_1', idle)
+            await layer.send(reader, {'type': 'stale'})
+            with mock.patch('backend.channel_layers.time.monotonic', return_value=later):
+                await layer.send(reader, {'type': 'fresh'})
+                received = await layer.receive(reader)
+                await layer._expire_channels()
+            await layer.close()
+            return received, reader, idle
+
+        received, reader, idle = async_to_sync(expire)()
+
+        self.assertEqual(received, {'type': 'fresh'})
+        self.assertIn(reader, layer.queues)
+        self.assertNotIn(idle, layer.queues)
+        self.assertNotIn('debate_1', layer.local_groups)
+
+
+class DebateListPaginationTests(DebateTestCase):
+    def setUp(self):
+        super().setUp()
+        for index in range(6):
+            Debate.objects.create(title=f'Debate {index}', description='...', creator=self.creator)
+        # Identical timestamps leave the order to the id tie-break
+        Debate.objects.update(created_at=timezone.now())
+        self.client = self.client_for(self.creator)
+
+    def test_walks_rows_with_equal_timestamps_without_gaps_or_duplicates(self):
+        seen = []
+        url = '/api/debates/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.data), ['next', 'results'])
+            seen += [debate['id'] for debate in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(seen, list(Debate.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_malformed_cursor_is_not_a_server_error(self):
+        for cursor in ('not-base64!', 'e30=', 'WyJub3QgYSBkYXRlIiwgMV0=', 'WyIyMDI0LTEzLTQ1VDAwOjAwIiwgMV0='):
+            response = self.client.get('/api/debates/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class WebSocketAuthTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='x')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def connect(self, token):
+        async def connect():
+            communicator = WebsocketCommunicator(application, f'/ws/debates/?token={token}')
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+        return async_to_sync(connect)()
+
+    def test_the_websocket_stack_authenticates_by_token(self):
+        self.assertTrue(self.connect(self.token))
+        self.assertFalse(self.connect('not-a-token'))
+
+    def test_second_connect_with_the_same_token_makes_no_user_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(get_user_from_token)(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(get_user_from_token)(self.token), self.user)
+
+    def test_saving_the_user_invalidates_the_cached_entry(self):
+        async_to_sync(get_user_from_token)(self.token)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIs(user_cache.get(str(self.user.id)), user_cache.MISSING)
+        with self.assertNumQueries(1):
+            self.assertFalse(async_to_sync(get_user_from_token)(self.token).is_authenticated)
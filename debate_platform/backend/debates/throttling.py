@@ -0,0 +1,125 @@
+"""
+Per-connection flow control for DebateConsumer.
+
+Inbound: one token bucket per command type (WS_RATE_LIMITS); commands listed
+in SHARED_BUCKETS draw from another command's bucket, so a client can't churn
+subscriptions by alternating subscribe and unsubscribe. Commands over the
+limit are dropped; a connection that keeps hitting the limit drains its
+flood bucket and is closed with CLOSE_FLOODING.
+
+Outbound: every connection owns a bounded Outbox. When a client reads slower
+than the room produces, the oldest droppable frames (chat) are discarded;
+control frames (signaling, presence, errors) are never dropped. A client that
+falls a whole outbox behind is closed with CLOSE_TOO_SLOW.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+
+# Application close codes (4000-4999 are free for applications)
+CLOSE_FLOODING = 4008
+CLOSE_TOO_SLOW = 4009
+CLOSE_HEARTBEAT_TIMEOUT = 4010 # Sent by DebateSocketConsumer's heartbeat, not by this module
+
+DEFAULT_RATE_LIMITS = {
+    # command: (tokens per second, burst)
+    'send_chat': (5, 10),
+    'video_signal': (50, 200),
+    'subscribe': (2, 20),
+}
+# command -> the command whose bucket it draws from
+SHARED_BUCKETS = {
+    'unsubscribe': 'subscribe',
+}
+DEFAULT_FLOOD_LIMIT = (1, 20) # Throttled commands tolerated: per second, burst
+DEFAULT_OUTBOX_SIZE = 256
+
+# Process-wide counters
+stats = Counter()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class RateLimiter:
+    """Token buckets for one connection."""
+    def __init__(self):
+        limits = {**DEFAULT_RATE_LIMITS, **getattr(settings, 'WS_RATE_LIMITS', {})}
+        self.buckets = {command: TokenBucket(*limit) for command, limit in limits.items()}
+        self.flood = TokenBucket(*getattr(settings, 'WS_FLOOD_LIMIT', DEFAULT_FLOOD_LIMIT))
+
+    def allow(self, command):
+        bucket = self.buckets.get(SHARED_BUCKETS.get(command, command))
+        if bucket is None or bucket.consume():
+            return True
+        stats[f'throttled.{command}'] += 1
+        return False
+
+    def is_flooding(self):
+        """Call after a throttled command; True once the flood budget is spent."""
+        return not self.flood.consume()
+
+
+class Outbox:
+    """
+    Bounded queue of encoded frames drained by a single writer task.
+    ``send`` is the coroutine that actually writes a frame to the socket.
+    """
+    def __init__(self, send, maxsize=None):
+        self._send = send
+        self.maxsize = maxsize or getattr(settings, 'WS_OUTBOX_SIZE', DEFAULT_OUTBOX_SIZE)
+        self.frames = deque()
+        self.overflow_since_drain = 0
+        self._ready = asyncio.Event()
+        self._task = asyncio.ensure_future(self._drain())
+
+    def put(self, frame, droppable=False):
+        """Queues a frame. Returns False once the client has fallen a whole outbox behind."""
+        if len(self.frames) >= self.maxsize:
+            self.overflow_since_drain += 1
+            # Make room by dropping the oldest chat frame. If there is none, a new chat
+            # frame is dropped itself, while control frames overshoot the bound until
+            # the caller closes the connection.
+            if self._remove_oldest_droppable():
+                stats['dropped_frames'] += 1
+            elif droppable:
+                stats['dropped_frames'] += 1
+                return self.overflow_since_drain < self.maxsize
+        self.frames.append((frame, droppable))
+        self._ready.set()
+        return self.overflow_since_drain < self.maxsize
+
+    def _remove_oldest_droppable(self):
+        for index, (_, droppable) in enumerate(self.frames):
+            if droppable:
+                del self.frames[index]
+                return True
+        return False
+
+    async def _drain(self):
+        while True:
+            await self._ready.wait()
+            while self.frames:
+                frame, _ = self.frames.popleft()
+                await self._send(frame)
+            self.overflow_since_drain = 0
+            self._ready.clear()
+
+    def close(self):
+        self._task.cancel()
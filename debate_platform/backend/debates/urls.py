@@ -3,6 +3,12 @@ from .views import (
     DebateListCreateView, 
     DebateRetrieveUpdateDestroyView, 
     DebateJoinView, 
+    DebateLeaveView,
+    DebateBulkJoinView,
+    DebateMessageListView,
+    MessageExportView,
+    DebatePresenceView,
+    DebateShardView,
     CreatorEarningView
 )
 
@@ -10,8 +16,14 @@ urlpatterns = [
     # Basic CRUD for Debates
     path('', DebateListCreateView.as_view(), name='debate-list-create'),
     path('<int:id>/', DebateRetrieveUpdateDestroyView.as_view(), name='debate-detail'),
+    path('<int:debate_id>/messages/', DebateMessageListView.as_view(), name='debate-messages'),
+    path('messages/export/', MessageExportView.as_view(), name='message-export'),
+    path('<int:debate_id>/presence/', DebatePresenceView.as_view(), name='debate-presence'),
+    path('<int:debate_id>/shard/', DebateShardView.as_view(), name='debate-shard'),
     
     # Core Business Logic Endpoints
     path('<int:debate_id>/join/', DebateJoinView.as_view(), name='debate-join'),
+    path('<int:debate_id>/join/bulk/', DebateBulkJoinView.as_view(), name='debate-bulk-join'),
+    path('<int:debate_id>/leave/', DebateLeaveView.as_view(), name='debate-leave'),
     path('earnings/', CreatorEarningView.as_view(), name='creator-earnings'),
 ]
\ No newline at end of file
@@ -1,16 +1,26 @@
 from rest_framework import generics, status
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from decimal import Decimal
 from django.db import transaction
+from django.db.models import F
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from .models import Debate
-from .serializers import DebateSerializer
-from payments.models import UserCredit, Transaction
+from .models import Debate, Message
+from .serializers import DebateSerializer, MessageSerializer
+from .admission import has_free_seat, reserve_seat, release_seat
+from .enrollment import DEBATE_FEE, CREATOR_COMMISSION_RATE, enroll_users
+from .presence import roster
+from backend.channel_layers import debate_shard
+from backend.exports import StreamingExportView
+from backend.pagination import KeysetPagination
+from payments.models import UserCredit, EarningBalance, Transaction
 
 # --- Constants ---
-DEBATE_FEE = 10 # Cost to join a debate in credits
-CREATOR_COMMISSION_RATE = 0.75 # 75% commission rate
+# DEBATE_FEE and CREATOR_COMMISSION_RATE live in enrollment.py, shared with bulk enrollment
+MAX_BULK_ENROLLMENT = 1000
 
 # --- Permissions ---
 class IsCreatorOrReadOnly(IsAuthenticated):
@@ -27,9 +37,10 @@ class IsCreatorOrReadOnly(IsAuthenticated):
 
 class DebateListCreateView(generics.ListCreateAPIView):
     """List all debates or create a new one."""
-    queryset = Debate.objects.all().order_by('-created_at')
+    queryset = Debate.objects.with_stats().order_by('-created_at', '-id')
     serializer_class = DebateSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def perform_create(self, serializer):
         # Automatically set the creator to the current authenticated user
@@ -37,13 +48,76 @@ class DebateListCreateView(generics.ListCreateAPIView):
 
 class DebateRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     """Retrieve, Update, or Delete a specific debate."""
-    queryset = Debate.objects.all()
+    queryset = Debate.objects.with_stats()
     serializer_class = DebateSerializer
     # Only the creator can update/delete
     permission_classes = [IsCreatorOrReadOnly] 
     lookup_field = 'id'
 
 
+class MessagePagination(KeysetPagination):
+    timestamp_field = 'timestamp'
+    cursor_query_param = 'before'
+    reverse_cursor_query_param = 'after'
+
+class DebateMessageListView(generics.ListAPIView):
+    """
+    Chat history of a debate, newest first. Follow `next` (?before=) for older
+    messages and `previous` (?after=) for messages newer than the first one shown.
+    """
+    serializer_class = MessageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = MessagePagination
+
+    def get_queryset(self):
+        # 404 for unknown debates; only members (and staff) may read the chat
+        debate = get_object_or_404(Debate, pk=self.kwargs['debate_id'])
+        user = self.request.user
+        if not (user.is_staff or debate.creator_id == user.id or debate.participants.filter(id=user.id).exists()):
+            raise PermissionDenied("Only participants of this debate can read its messages.")
+        return Message.objects.filter(debate_id=debate.id).select_related('user')
+
+
+class MessageExportView(StreamingExportView):
+    """Streams chat messages as CSV or JSON Lines for moderation (see backend.exports for the filters)."""
+    queryset = Message.objects.all()
+    columns = {
+        'id': 'id',
+        'timestamp': 'timestamp',
+        'debate_id': 'debate_id',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'content': 'content',
+    }
+    filename = 'messages'
+
+
+class DebatePresenceView(APIView):
+    """
+    Snapshot of who is connected to a debate room right now. Live changes
+    reach WebSocket clients as batched 'presence' diffs.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, debate_id):
+        if not Debate.objects.filter(pk=debate_id).exists():
+            return Response({"detail": "Debate not found."}, status=status.HTTP_404_NOT_FOUND)
+        users = [{'user_id': user['user_id'], 'username': user['username']} for user in roster(debate_id)]
+        return Response({'debate': debate_id, 'count': len(users), 'users': users})
+
+
+class DebateShardView(APIView):
+    """
+    The ASGI worker that owns a debate when the channel layer is sharded, so
+    clients (or the load balancer) can open the room's socket on that worker.
+    "worker" is null when every worker can serve every room.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, debate_id):
+        return Response({'debate': debate_id, 'worker': debate_shard(debate_id)})
+
+
 # --- 2. Core Payment & Commission Logic Views ---
 
 class DebateJoinView(APIView):
@@ -67,13 +141,22 @@ class DebateJoinView(APIView):
             return Response({"detail": "You have already joined this debate."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Ensure the creator is not trying to pay to join their own debate
-        if debate.creator == request.user:
-            debate.participants.add(request.user)
-            return Response({"detail": "Creator joined successfully (no fee applied)."}, status=status.HTTP_200_OK)
+        if debate.creator_id == request.user.id:
+            return self.join_as_creator(debate, request.user)
 
+        # Fast rejection from the row we already loaded: no lock, no extra query
+        if not has_free_seat(debate) or not reserve_seat(debate.id):
+            return Response({"detail": "This debate is full."}, status=status.HTTP_409_CONFLICT)
+
+        # The seat is ours from here on; hand it back unless the join commits
+        admitted = False
         try:
             with transaction.atomic():
                 user_credit = UserCredit.objects.select_for_update().get(user=request.user)
+
+                # Re-check under the credit lock so a double-submit can't join (and pay) twice
+                if debate.participants.filter(id=request.user.id).exists():
+                    return Response({"detail": "You have already joined this debate."}, status=status.HTTP_400_BAD_REQUEST)
                 
                 if user_credit.balance < DEBATE_FEE:
                     return Response({"detail": f"Insufficient credits. Requires {DEBATE_FEE}."}, status=status.HTTP_402_PAYMENT_REQUIRED)
@@ -91,7 +174,7 @@ class DebateJoinView(APIView):
                 )
                 
                 # Calculate commission (75% for creator, 25% for platform)
-                creator_earning = DEBATE_FEE * CREATOR_COMMISSION_RATE
+                creator_earning = Decimal(str(DEBATE_FEE * CREATOR_COMMISSION_RATE))
                 platform_fee = DEBATE_FEE - creator_earning
 
                 # 3. LOG: Creator Earning Accrual (EAR) - Positive amount for income accrual
@@ -101,72 +184,116 @@ class DebateJoinView(APIView):
                     amount=creator_earning, 
                     debate_id=debate.id 
                 )
+                # Keep the creator's withdrawable balance in step with the EAR row
+                EarningBalance.objects.get_or_create(user=debate.creator)
+                EarningBalance.objects.filter(user=debate.creator).update(balance=F('balance') + creator_earning)
 
                 # 4. LOG: Platform Fee Income (SUB/CRD is income, use a new type or existing CRD/SUB)
                 # Note: For simplicity, we can just track the net EAR/DEB, but for full audit, 
                 # we'd log the platform cut separately. We'll skip logging platform cut directly 
                 # and rely on reports (Income = SUB + CRD + (DEB - EAR)).
                 
-                # 5. ADD: User to Debate Participants
+                # 5. ADD: User to Debate Participants (the seat was already counted by reserve_seat)
                 debate.participants.add(request.user)
 
+            admitted = True
             return Response({"detail": "Joined debate successfully. Credits debited."}, status=status.HTTP_200_OK)
 
         except UserCredit.DoesNotExist:
             # Should not happen if UserCredit is created on user signup
             return Response({"detail": "User credit account not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        finally:
+            if not admitted:
+                release_seat(debate.id)
+
+    def join_as_creator(self, debate, user):
+        """
+        The creator joins for free. Membership is checked under the debate row
+        lock before a seat is taken, so a double submit can't take two seats.
+        """
+        with transaction.atomic():
+            Debate.objects.select_for_update().filter(pk=debate.pk).values_list('pk', flat=True).get()
+            if debate.participants.filter(id=user.id).exists():
+                return Response({"detail": "You have already joined this debate."}, status=status.HTTP_400_BAD_REQUEST)
+            if not reserve_seat(debate.id):
+                return Response({"detail": "This debate is full."}, status=status.HTTP_409_CONFLICT)
+            debate.participants.add(user)
+        return Response({"detail": "Creator joined successfully (no fee applied)."}, status=status.HTTP_200_OK)
+
+
+class DebateBulkJoinView(APIView):
+    """
+    Lets staff enroll a list of users in one request, e.g. a class or a team.
+    Body: {"user_ids": [...]}. Each enrolled user is charged like a regular
+    join; the response reports the outcome per user. Staff only, since it
+    debits other people's credits (and pays the creator for each).
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, debate_id):
+        try:
+            debate = Debate.objects.get(id=debate_id, status__in=['OPEN', 'ACTIVE'])
+        except Debate.DoesNotExist:
+            return Response({"detail": "Debate not found or not available."}, status=status.HTTP_404_NOT_FOUND)
+
+        user_ids = request.data.get('user_ids')
+        if not isinstance(user_ids, list) or not all(type(user_id) is int for user_id in user_ids):
+            return Response({"detail": "user_ids must be a list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(user_ids) > MAX_BULK_ENROLLMENT:
+            return Response({"detail": f"At most {MAX_BULK_ENROLLMENT} users per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = enroll_users(debate, user_ids)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class DebateLeaveView(APIView):
+    """
+    Removes the authenticated user from a debate's participants.
+    Fees already paid are not refunded.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, debate_id):
+        try:
+            debate = Debate.objects.get(id=debate_id)
+        except Debate.DoesNotExist:
+            return Response({"detail": "Debate not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            if not debate.remove_participant(request.user):
+                return Response({"detail": "You are not a participant of this debate."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"detail": "Left debate successfully."}, status=status.HTTP_200_OK)
+
 
 class CreatorEarningView(APIView):
     """
-    Allows a creator to convert their accrued EARNINGS (from Transaction table) 
-    into CREDITS (in UserCredit balance).
+    Allows a creator to convert their accrued EARNINGS into CREDITS (in UserCredit balance).
+    The available amount is read from the creator's EarningBalance row, which
+    mirrors the sum of their 'EAR' and 'WDR' Transaction rows.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        """Calculate the total accrued earnings available for withdrawal."""
-        # Sum of all positive 'EAR' transactions that haven't been 'WDR' offset
-        accrued_earnings = Transaction.objects.filter(
-            user=request.user, 
-            transaction_type__in=['EAR']
-        ).aggregate(
-            total_earned=models.Sum('amount')
-        )['total_earned'] or 0
-        
-        # Sum of all negative 'WDR' transactions (withdrawals)
-        withdrawn_amount = Transaction.objects.filter(
-            user=request.user,
-            transaction_type='WDR'
-        ).aggregate(
-            total_withdrawn=models.Sum('amount')
-        )['total_withdrawn'] or 0
-
-        current_balance = accrued_earnings + withdrawn_amount
+        """Return the accrued earnings available for withdrawal."""
+        current_balance = EarningBalance.objects.filter(
+            user=request.user
+        ).values_list('balance', flat=True).first() or 0
         return Response({"available_earnings": round(current_balance, 2)}, status=status.HTTP_200_OK)
 
     def post(self, request):
         """Execute the conversion from earnings to credits."""
-        
-        # Get the available balance using the GET logic
-        accrued_earnings = Transaction.objects.filter(
-            user=request.user, 
-            transaction_type='EAR'
-        ).aggregate(total_earned=models.Sum('amount'))['total_earned'] or 0
-        
-        withdrawn_amount = Transaction.objects.filter(
-            user=request.user,
-            transaction_type='WDR'
-        ).aggregate(total_withdrawn=models.Sum('amount'))['total_withdrawn'] or 0
-        
-        amount_to_withdraw = accrued_earnings + withdrawn_amount
-        amount_to_withdraw = round(amount_to_withdraw, 2)
-        
-        if amount_to_withdraw <= 0.01:
-            return Response({"detail": "No eligible earnings to withdraw."}, status=status.HTTP_400_BAD_REQUEST)
-
         try:
             with transaction.atomic():
+                # Lock the earnings row first so the balance read and the WDR write can't race
+                EarningBalance.objects.get_or_create(user=request.user)
+                earnings = EarningBalance.objects.select_for_update().get(user=request.user)
+
+                amount_to_withdraw = round(earnings.balance, 2)
+                if amount_to_withdraw <= Decimal('0.01'):
+                    return Response({"detail": "No eligible earnings to withdraw."}, status=status.HTTP_400_BAD_REQUEST)
+
                 user_credit = UserCredit.objects.select_for_update().get(user=request.user)
                 
                 # 1. CREDIT: Add equivalent credits to UserCredit balance
@@ -175,7 +302,11 @@ class CreatorEarningView(APIView):
                 user_credit.balance += credits_to_add
                 user_credit.save()
 
-                # 2. LOG: Withdrawal Transaction (WDR)
+                # 2. DEBIT: Zero out the withdrawn earnings
+                earnings.balance -= amount_to_withdraw
+                earnings.save()
+
+                # 3. LOG: Withdrawal Transaction (WDR)
                 # This transaction acts as a negative offset to zero out the accrued earnings balance
                 Transaction.objects.create(
                     user=request.user,
@@ -191,4 +322,4 @@ class CreatorEarningView(APIView):
             }, status=status.HTTP_200_OK)
 
         except UserCredit.DoesNotExist:
-            return Response({"detail": "User credit account not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({"detail": "User credit account not found."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,73 @@
+"""
+Wire encoding of the frames DebateConsumer sends to clients.
+
+Group events carry the final frame text, encoded once by the sender, and
+every recipient forwards it unchanged; a chat line in a 100-person room is
+serialized once instead of 100 times.
+
+Clients may negotiate MessagePack through Sec-WebSocket-Protocol
+(SUBPROTOCOL_MSGPACK); JSON stays the default. Events keep carrying JSON
+text, and to_msgpack() transcodes each distinct frame once per worker, so
+binary clients don't multiply the encoding work either.
+"""
+import json
+from functools import lru_cache
+
+import msgpack
+
+SUBPROTOCOL_JSON = 'debate.json'
+SUBPROTOCOL_MSGPACK = 'debate.msgpack'
+SUBPROTOCOLS = (SUBPROTOCOL_JSON, SUBPROTOCOL_MSGPACK)
+
+
+def encode_frame(payload):
+    """Encodes one client frame as compact JSON text."""
+    return json.dumps(payload, separators=(',', ':'))
+
+
+def encode_frame_list(frame_type, key, encoded_frames, **extra):
+    """Wraps already-encoded frames in an envelope without decoding them again."""
+    fields = ''.join(f',{json.dumps(name)}:{json.dumps(value)}' for name, value in extra.items())
+    return f'{{"type":{json.dumps(frame_type)}{fields},{json.dumps(key)}:[{",".join(encoded_frames)}]}}'
+
+
+def tag_frame(encoded_frame, debate_id):
+    """Adds a leading "debate_id" key to an encoded frame object without decoding it."""
+    return f'{{"debate_id":{json.dumps(debate_id)},{encoded_frame[1:]}'
+
+
+def choose_subprotocol(offered):
+    """Picks the client's most preferred subprotocol we support, or None for plain JSON."""
+    for subprotocol in offered:
+        if subprotocol in SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+@lru_cache(maxsize=1024)
+def to_msgpack(encoded_frame):
+    """MessagePack form of an encoded JSON frame, shared by every binary recipient in the worker."""
+    return msgpack.packb(json.loads(encoded_frame), use_bin_type=True)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """Decodes a client frame (JSON text or MessagePack bytes); returns None if it isn't an object."""
+    try:
+        if bytes_data is not None:
+            data = msgpack.unpackb(bytes_data, raw=False)
+            # Relayed fields are re-encoded as JSON text, so binary values are refused up front
+            if not _json_compatible(data):
+                return None
+        else:
+            data = json.loads(text_data)
+    except (TypeError, ValueError, msgpack.UnpackException):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _json_compatible(value):
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _json_compatible(item) for key, item in value.items())
+    if isinstance(value, list):
+        return all(_json_compatible(item) for item in value)
+    return value is None or isinstance(value, (str, int, float, bool))
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     MembershipPlan, UserSubscription, 
-    CreditPackage, UserCredit, Transaction
+    CreditPackage, UserCredit, EarningBalance, Transaction,
+    LedgerCheckpoint, LedgerSnapshot, DailyRevenue, DebateRevenue, StripeEvent
 )
 
 @admin.register(MembershipPlan)
@@ -23,8 +24,41 @@ class UserCreditAdmin(admin.ModelAdmin):
     list_display = ('user', 'balance')
     search_fields = ('user__username',)
 
+@admin.register(EarningBalance)
+class EarningBalanceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'balance')
+    search_fields = ('user__username',)
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'transaction_type', 'amount', 'timestamp')
     list_filter = ('transaction_type', 'timestamp')
-    search_fields = ('user__username',)
\ No newline at end of file
+    search_fields = ('user__username',)
+
+@admin.register(LedgerCheckpoint)
+class LedgerCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'watermark', 'updated_at')
+
+@admin.register(LedgerSnapshot)
+class LedgerSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('user', 'transaction_type', 'total', 'row_count', 'watermark')
+    list_filter = ('transaction_type',)
+    search_fields = ('user__username',)
+
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ('date', 'platform_income', 'subscriptions', 'credit_sales', 'debate_fees', 'creator_earnings', 'paid_joins')
+    date_hierarchy = 'date'
+
+@admin.register(DebateRevenue)
+class DebateRevenueAdmin(admin.ModelAdmin):
+    list_display = ('debate', 'paid_joins', 'fees_collected', 'creator_earnings', 'platform_commission')
+    list_select_related = ('debate',)
+    search_fields = ('debate__title',)
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'payload', 'received_at', 'processed_at')
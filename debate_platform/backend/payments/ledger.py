@@ -0,0 +1,34 @@
+from decimal import Decimal
+from django.db.models import Q, Sum
+from .models import LedgerSnapshot, Transaction
+
+
+def ledger_totals(user, transaction_types):
+    """
+    Returns {transaction_type: total amount} for ``user``.
+
+    Each total is the LedgerSnapshot row plus the Transaction rows written
+    after that snapshot's watermark, so the cost depends on the tail since the
+    last snapshot_ledger run rather than on the user's whole history.
+    """
+    snapshots = {
+        snapshot.transaction_type: snapshot
+        for snapshot in LedgerSnapshot.objects.filter(user=user, transaction_type__in=transaction_types)
+    }
+    totals = {}
+    tail_filter = Q()
+    for transaction_type in transaction_types:
+        snapshot = snapshots.get(transaction_type)
+        totals[transaction_type] = snapshot.total if snapshot else Decimal('0.00')
+        watermark = snapshot.watermark if snapshot else 0
+        tail_filter |= Q(transaction_type=transaction_type, id__gt=watermark)
+
+    tail = (
+        Transaction.objects.filter(user=user).filter(tail_filter)
+        .values('transaction_type')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in tail:
+        totals[row['transaction_type']] += row['total']
+    return totals
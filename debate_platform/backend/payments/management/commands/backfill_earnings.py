@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from payments.models import EarningBalance, Transaction
+
+
+class Command(BaseCommand):
+    help = "Rebuilds every creator's EarningBalance from their 'EAR' and 'WDR' Transaction rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        totals = (
+            Transaction.objects
+            .filter(transaction_type__in=['EAR', 'WDR'], user__isnull=False)
+            .values('user')
+            .annotate(total=Sum('amount'))
+            .order_by('user')
+        )
+        balances = [EarningBalance(user_id=row['user'], balance=row['total']) for row in totals]
+
+        with transaction.atomic():
+            # Upsert in one pass; rows for users without any earnings history are left alone
+            EarningBalance.objects.bulk_create(
+                balances,
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['balance'],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt earnings balances for {len(balances)} user(s)."))
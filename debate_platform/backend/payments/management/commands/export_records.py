@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from backend.exports import OUTPUT_TYPES, encode_rows, filter_export, iter_rows
+from debates.views import MessageExportView
+from payments.views import TransactionExportView
+
+EXPORTS = {
+    'transactions': TransactionExportView,
+    'messages': MessageExportView,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams Transaction or Message rows as CSV or JSON Lines in keyset order, "
+        "with the same columns and filters as the export endpoints."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(EXPORTS))
+        parser.add_argument('--output', choices=sorted(OUTPUT_TYPES), default='csv')
+        parser.add_argument('--since', help="ISO date or datetime (inclusive).")
+        parser.add_argument('--until', help="ISO date (inclusive) or datetime (exclusive).")
+        parser.add_argument('--debate', type=int)
+        parser.add_argument('--type', help="Comma-separated transaction types, e.g. DEB,EAR.")
+        parser.add_argument('--file', help="Write here instead of stdout.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options['table']]
+        try:
+            queryset = filter_export(
+                export.queryset.all(), since=options['since'], until=options['until'],
+                debate=options['debate'], types=options['type'], type_field=export.type_field,
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        rows = iter_rows(queryset, list(export.columns.values()), chunk_size=options['chunk_size'])
+        lines = encode_rows(rows, list(export.columns), options['output'])
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,35 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from payments.stripe_events import drain
+
+
+class Command(BaseCommand):
+    help = "Applies queued Stripe webhook events (credits, subscriptions) with a pool of workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help="Threads draining the queue; several processes may run this command too.")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Events leased per claim (default: STRIPE_EVENTS['BATCH_SIZE']).")
+        parser.add_argument('--every', type=int, default=0,
+                            help="Keep running and poll every N seconds instead of draining once.")
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                results = list(pool.map(self.work, [options['batch_size']] * options['workers']))
+                processed = sum(done for done, _ in results)
+                failed = sum(failures for _, failures in results)
+                self.stdout.write(f"Applied {processed} Stripe event(s), {failed} failed and scheduled for retry.")
+                if not options['every']:
+                    return
+                time.sleep(options['every'])
+
+    def work(self, batch_size):
+        try:
+            return drain(batch_size)
+        finally:
+            # Each pool thread has its own connection
+            close_old_connections()
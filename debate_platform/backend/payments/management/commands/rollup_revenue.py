@@ -0,0 +1,129 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from debates.models import Debate
+from payments.models import DailyRevenue, DebateRevenue, LedgerCheckpoint, Transaction
+
+CHECKPOINT_NAME = 'revenue_rollup'
+ZERO = Decimal('0.00')
+
+
+def type_sum(transaction_type):
+    return Sum('amount', filter=Q(transaction_type=transaction_type), default=ZERO)
+
+
+class Command(BaseCommand):
+    help = (
+        "Folds Transaction rows written since the last run into the DailyRevenue and DebateRevenue rollups. "
+        "After deploying the rollup tables, run it once over the existing ledger (repeat until it reports "
+        "up to date, or raise --max-rows): until then debate commission and the revenue report read zero "
+        "for earlier transactions. Then schedule it, e.g. every minute."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type=int, default=500000,
+                            help="Upper bound on ledger rows folded in a single run.")
+        parser.add_argument('--lag-seconds', type=int, default=60,
+                            help="Skip rows newer than this, so ids of still-open transactions aren't jumped over.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            LedgerCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+            checkpoint = LedgerCheckpoint.objects.select_for_update().get(name=CHECKPOINT_NAME)
+            low = checkpoint.watermark
+
+            cutoff = timezone.now() - timedelta(seconds=options['lag_seconds'])
+            high = Transaction.objects.filter(
+                id__gt=low, id__lte=low + options['max_rows'], timestamp__lte=cutoff
+            ).aggregate(high=Max('id'))['high']
+            if high is None:
+                self.stdout.write("Revenue rollups are up to date.")
+                return
+
+            tail = Transaction.objects.filter(id__gt=low, id__lte=high)
+            days = self.fold_days(tail)
+            debates = self.fold_debates(tail)
+
+            checkpoint.watermark = high
+            checkpoint.save()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded ledger rows {low + 1}..{high} into {days} day(s) and {debates} debate(s)."
+        ))
+
+    def fold_days(self, tail):
+        rows = (
+            tail.annotate(day=TruncDate('timestamp')).values('day')
+            .annotate(
+                subscriptions=type_sum('SUB'), credit_sales=type_sum('CRD'),
+                # DEB rows are negative (the payer's expense)
+                debate_fees=type_sum('DEB'), creator_earnings=type_sum('EAR'),
+                paid_joins=Count('id', filter=Q(transaction_type='DEB')),
+            )
+            .order_by()
+        )
+        deltas = {row['day']: row for row in rows}
+        existing = {
+            rollup.date: rollup
+            for rollup in DailyRevenue.objects.select_for_update().filter(date__in=deltas)
+        }
+        to_update, to_create = [], []
+        for day, row in deltas.items():
+            rollup = existing.get(day)
+            if rollup is None:
+                rollup = DailyRevenue(date=day)
+                to_create.append(rollup)
+            else:
+                to_update.append(rollup)
+            rollup.subscriptions += row['subscriptions']
+            rollup.credit_sales += row['credit_sales']
+            rollup.debate_fees -= row['debate_fees']
+            rollup.creator_earnings += row['creator_earnings']
+            rollup.paid_joins += row['paid_joins']
+
+        DailyRevenue.objects.bulk_create(to_create, batch_size=1000)
+        DailyRevenue.objects.bulk_update(
+            to_update, ['subscriptions', 'credit_sales', 'debate_fees', 'creator_earnings', 'paid_joins'],
+            batch_size=1000,
+        )
+        return len(deltas)
+
+    def fold_debates(self, tail):
+        rows = (
+            tail.filter(debate_id__isnull=False, transaction_type__in=['DEB', 'EAR'])
+            .values('debate_id')
+            .annotate(
+                fees=type_sum('DEB'), earnings=type_sum('EAR'),
+                paid_joins=Count('id', filter=Q(transaction_type='DEB')),
+            )
+            .order_by()
+        )
+        deltas = {row['debate_id']: row for row in rows}
+        # Rows of deleted debates still count towards the daily totals, but have no debate to roll up into
+        live = set(Debate.objects.filter(id__in=deltas).values_list('id', flat=True))
+        existing = {
+            rollup.debate_id: rollup
+            for rollup in DebateRevenue.objects.select_for_update().filter(debate_id__in=live)
+        }
+        to_update, to_create = [], []
+        for debate_id in live:
+            row = deltas[debate_id]
+            rollup = existing.get(debate_id)
+            if rollup is None:
+                rollup = DebateRevenue(debate_id=debate_id)
+                to_create.append(rollup)
+            else:
+                to_update.append(rollup)
+            rollup.fees_collected -= row['fees']
+            rollup.creator_earnings += row['earnings']
+            rollup.paid_joins += row['paid_joins']
+
+        DebateRevenue.objects.bulk_create(to_create, batch_size=1000)
+        DebateRevenue.objects.bulk_update(
+            to_update, ['fees_collected', 'creator_earnings', 'paid_joins'], batch_size=1000,
+        )
+        return len(live)
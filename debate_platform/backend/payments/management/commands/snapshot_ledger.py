@@ -0,0 +1,71 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from payments.models import LedgerCheckpoint, LedgerSnapshot, Transaction
+
+CHECKPOINT_NAME = 'ledger_snapshot'
+
+
+class Command(BaseCommand):
+    help = "Folds Transaction rows written since the last run into the per-user LedgerSnapshot totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type=int, default=500000,
+                            help="Upper bound on ledger rows folded in a single run.")
+        parser.add_argument('--lag-seconds', type=int, default=60,
+                            help="Skip rows newer than this, so ids of still-open transactions aren't jumped over.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            LedgerCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+            checkpoint = LedgerCheckpoint.objects.select_for_update().get(name=CHECKPOINT_NAME)
+            low = checkpoint.watermark
+
+            cutoff = timezone.now() - timedelta(seconds=options['lag_seconds'])
+            high = Transaction.objects.filter(
+                id__gt=low, id__lte=low + options['max_rows'], timestamp__lte=cutoff
+            ).aggregate(high=Max('id'))['high']
+            if high is None:
+                self.stdout.write("Ledger snapshot is up to date.")
+                return
+
+            tail = (
+                Transaction.objects
+                .filter(id__gt=low, id__lte=high, user__isnull=False)
+                .values('user', 'transaction_type')
+                .annotate(total=Sum('amount'), rows=Count('id'))
+                .order_by()
+            )
+            deltas = {(row['user'], row['transaction_type']): row for row in tail}
+
+            existing = {
+                (snapshot.user_id, snapshot.transaction_type): snapshot
+                for snapshot in LedgerSnapshot.objects.select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in deltas}
+                )
+            }
+            to_update, to_create = [], []
+            for key, row in deltas.items():
+                snapshot = existing.get(key)
+                if snapshot is None:
+                    to_create.append(LedgerSnapshot(
+                        user_id=key[0], transaction_type=key[1],
+                        total=row['total'], row_count=row['rows'], watermark=high,
+                    ))
+                else:
+                    snapshot.total += row['total']
+                    snapshot.row_count += row['rows']
+                    snapshot.watermark = high
+                    to_update.append(snapshot)
+
+            LedgerSnapshot.objects.bulk_create(to_create, batch_size=1000)
+            LedgerSnapshot.objects.bulk_update(to_update, ['total', 'row_count', 'watermark'], batch_size=1000)
+
+            checkpoint.watermark = high
+            checkpoint.save()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded ledger rows {low + 1}..{high} into {len(deltas)} snapshot(s)."
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('debates', '0012_presence_last_seen'),
+        ('payments', '0004_ledger_indexes_and_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('subscriptions', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credit_sales', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('debate_fees', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('creator_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('paid_joins', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DebateRevenue',
+            fields=[
+                ('debate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='revenue', serialize=False, to='debates.debate')),
+                ('paid_joins', models.BigIntegerField(default=0)),
+                ('fees_collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('creator_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+    ]
@@ -44,6 +44,17 @@ class UserCredit(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.balance} Credits"
 
+class EarningBalance(models.Model):
+    """
+    Running balance of a creator's withdrawable earnings, i.e. the sum of their
+    'EAR' and 'WDR' Transaction rows, kept so reads and withdrawals touch one row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='earnings')
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - ${self.balance} Earnings"
+
 # --- 3. Transactions & Earnings (for Admin/Reporting) ---
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
@@ -60,6 +71,126 @@ class Transaction(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     # Optional link to a debate for context
     debate_id = models.IntegerField(null=True, blank=True) 
+    # Free-form reference (e.g. withdrawal note or payment provider id)
+    external_ref = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of a user's history on (timestamp, id)
+            models.Index(fields=['user', '-timestamp', '-id'], name='txn_user_timestamp_id_idx'),
+            # Per-user/per-type and per-debate reports
+            models.Index(fields=['user', 'transaction_type', 'timestamp'], name='txn_user_type_timestamp_idx'),
+            models.Index(fields=['debate_id', 'transaction_type'], name='txn_debate_type_idx'),
+        ]
 
     def __str__(self):
         return f"[{self.get_transaction_type_display()}] {self.user.username if self.user else 'Deleted User'}: {self.amount}"
+
+
+# --- 4. Ledger Aggregates ---
+class LedgerCheckpoint(models.Model):
+    """
+    Highest Transaction id already folded into a derived table. One row per
+    consumer of the ledger (e.g. 'ledger_snapshot').
+    """
+    name = models.CharField(max_length=50, unique=True)
+    watermark = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.watermark}"
+
+class LedgerSnapshot(models.Model):
+    """
+    Per-user, per-type running total of Transaction.amount for every row with
+    id <= watermark. A full ledger sum is this total plus the rows after the
+    watermark (see payments.ledger.ledger_totals).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ledger_snapshots')
+    transaction_type = models.CharField(max_length=3, choices=Transaction.TRANSACTION_TYPES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    row_count = models.BigIntegerField(default=0)
+    watermark = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'transaction_type'], name='unique_ledger_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} [{self.transaction_type}] {self.total} @ {self.watermark}"
+
+class DailyRevenue(models.Model):
+    """
+    Platform revenue of one (UTC) day, folded from the ledger by the
+    rollup_revenue command up to LedgerCheckpoint 'revenue_rollup'.
+    Fee and earning totals are positive amounts.
+    """
+    date = models.DateField(unique=True)
+    subscriptions = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credit_sales = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    debate_fees = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    creator_earnings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    paid_joins = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+
+    @property
+    def platform_income(self):
+        # Income = SUB + CRD + (debate fees - creator share)
+        return self.subscriptions + self.credit_sales + self.debate_fees - self.creator_earnings
+
+    def __str__(self):
+        return f"{self.date}: ${self.platform_income}"
+
+class DebateRevenue(models.Model):
+    """Ledger totals of one debate's paid joins, folded by rollup_revenue alongside DailyRevenue."""
+    debate = models.OneToOneField('debates.Debate', on_delete=models.CASCADE, primary_key=True, related_name='revenue')
+    paid_joins = models.BigIntegerField(default=0)
+    fees_collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    creator_earnings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    @property
+    def platform_commission(self):
+        return self.fees_collected - self.creator_earnings
+
+    def __str__(self):
+        return f"Debate {self.debate_id}: {self.paid_joins} paid joins, ${self.platform_commission}"
+
+
+# --- 5. Payment Provider Events ---
+class StripeEvent(models.Model):
+    """
+    One verified Stripe webhook delivery, stored before any work is done. The
+    unique event id makes Stripe's retries no-ops; payments.stripe_events
+    applies PENDING events in batches (see the process_stripe_events command).
+    """
+    PENDING = 'PENDING'
+    PROCESSED = 'PROCESSED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    ]
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # Claimed by a worker (or backing off after a failure) until then
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Serves the workers' "oldest pending events" claim query
+            models.Index(fields=['status', 'id'], name='stripe_event_status_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id} [{self.event_type}] {self.status}"
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import MembershipPlan, CreditPackage, UserCredit
+from .models import MembershipPlan, CreditPackage, UserCredit, Transaction, DailyRevenue
 
 class MembershipPlanSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,4 +15,16 @@ class UserCreditSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source='user.username')
     class Meta:
         model = UserCredit
-        fields = ['username', 'balance']
\ No newline at end of file
+        fields = ['username', 'balance']
+
+class TransactionSerializer(serializers.ModelSerializer):
+    transaction_type_display = serializers.CharField(source='get_transaction_type_display', read_only=True)
+    class Meta:
+        model = Transaction
+        fields = ['id', 'transaction_type', 'transaction_type_display', 'amount', 'timestamp', 'debate_id']
+
+class DailyRevenueSerializer(serializers.ModelSerializer):
+    platform_income = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    class Meta:
+        model = DailyRevenue
+        fields = ['date', 'platform_income', 'subscriptions', 'credit_sales', 'debate_fees', 'creator_earnings', 'paid_joins']
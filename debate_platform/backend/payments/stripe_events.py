@@ -0,0 +1,190 @@
+"""
+Applies stored Stripe webhook events (StripeEvent) outside the request cycle.
+
+Workers claim the oldest PENDING events in batches by leasing them
+(``locked_until`` plus the claiming worker's ``claim_token``), then apply each
+one in its own transaction. That transaction starts by flipping the event to
+PROCESSED only if it is still PENDING, so the credits or subscription change
+and the status change commit together: a redelivered, re-claimed or
+concurrently claimed event is applied at most once. A failing event rolls
+back, and is retried with exponential backoff up to MAX_ATTEMPTS times before
+it is marked FAILED; one that can never apply (InvalidEvent) is marked FAILED
+straight away.
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CreditPackage, MembershipPlan, StripeEvent, Transaction, UserCredit, UserSubscription
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'LEASE_SECONDS': 300,
+    'MAX_ATTEMPTS': 8,
+    'RETRY_BASE_SECONDS': 30,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'STRIPE_EVENTS', {})}
+
+
+class InvalidEvent(Exception):
+    """The event contradicts our records; retrying won't help, so it is marked FAILED for review."""
+
+
+def to_cents(price):
+    # Stripe amounts are integers in the currency's smallest unit
+    return int(price * 100)
+
+
+# --- Handlers: one per event type, called inside the event's transaction ---
+
+def checkout_session_completed(session):
+    """
+    Grants the credit package or activates the plan named in the Checkout
+    Session metadata, once the session is paid for the listed price. Sessions
+    paid by a delayed method complete unpaid and are granted on
+    checkout.session.async_payment_succeeded instead.
+    """
+    metadata = session.get('metadata') or {}
+    user_id = metadata.get('user_id')
+    if not user_id:
+        logger.warning("Checkout session %s has no user_id metadata; ignored.", session.get('id'))
+        return
+    reference = session.get('id', '')
+    if session.get('payment_status') != 'paid':
+        logger.info("Checkout session %s is %s; nothing granted yet.", reference, session.get('payment_status'))
+        return
+
+    if metadata.get('credit_package_id'):
+        package = CreditPackage.objects.get(id=metadata['credit_package_id'])
+        check_amount(session, package.price)
+        credit, _ = UserCredit.objects.select_for_update().get_or_create(user_id=user_id)
+        credit.balance += package.credit_amount
+        credit.save()
+        Transaction.objects.create(
+            user_id=user_id, transaction_type='CRD', amount=package.price, external_ref=reference,
+        )
+    elif metadata.get('plan_id'):
+        plan = MembershipPlan.objects.get(id=metadata['plan_id'])
+        check_amount(session, plan.price)
+        now = timezone.now()
+        subscription, _ = UserSubscription.objects.select_for_update().get_or_create(user_id=user_id)
+        subscription.plan = plan
+        subscription.start_date = now
+        subscription.end_date = now + timedelta(days=plan.duration_days)
+        subscription.is_active = True
+        subscription.save()
+        Transaction.objects.create(
+            user_id=user_id, transaction_type='SUB', amount=plan.price, external_ref=reference,
+        )
+
+
+def check_amount(session, price):
+    if session.get('amount_total') != to_cents(price):
+        raise InvalidEvent(
+            f"Checkout session {session.get('id')} charged {session.get('amount_total')}, "
+            f"expected {to_cents(price)}"
+        )
+
+
+def customer_subscription_deleted(stripe_subscription):
+    metadata = stripe_subscription.get('metadata') or {}
+    user_id = metadata.get('user_id')
+    if user_id:
+        UserSubscription.objects.filter(user_id=user_id).update(is_active=False, end_date=timezone.now())
+
+
+HANDLERS = {
+    'checkout.session.completed': checkout_session_completed,
+    'checkout.session.async_payment_succeeded': checkout_session_completed,
+    'customer.subscription.deleted': customer_subscription_deleted,
+}
+
+
+# --- Queue ---
+
+def claim_batch(batch_size=None, lease_seconds=None, exclude=()):
+    """Leases up to ``batch_size`` of the oldest due PENDING events to the caller; returns their ids."""
+    options = config()
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = (
+        StripeEvent.objects
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now), status=StripeEvent.PENDING)
+        .exclude(id__in=exclude)
+        .order_by('id')
+        .values('id')[:batch_size or options['BATCH_SIZE']]
+    )
+    # One UPDATE claims the batch (no read-then-write transaction to deadlock on); two workers
+    # racing for the same rows is harmless since process_event applies an event only once
+    StripeEvent.objects.filter(id__in=due).update(
+        locked_until=now + timedelta(seconds=lease_seconds or options['LEASE_SECONDS']), claim_token=token,
+    )
+    return list(
+        StripeEvent.objects.filter(claim_token=token, status=StripeEvent.PENDING)
+        .order_by('id').values_list('id', flat=True)
+    )
+
+
+def process_event(event_id):
+    """Applies one stored event. Returns False if it failed (and was scheduled for a retry or given up)."""
+    try:
+        with transaction.atomic():
+            claimed = StripeEvent.objects.filter(id=event_id, status=StripeEvent.PENDING).update(
+                status=StripeEvent.PROCESSED, processed_at=timezone.now(), locked_until=None, last_error='',
+            )
+            if not claimed:
+                # Another worker already applied it
+                return True
+            event = StripeEvent.objects.only('event_type', 'payload').get(id=event_id)
+            handler = HANDLERS.get(event.event_type)
+            if handler is not None:
+                handler(event.payload['data']['object'])
+    except InvalidEvent as exc:
+        logger.error("Stripe event %s rejected: %s", event_id, exc)
+        record_failure(event_id, exc, retry=False)
+        return False
+    except Exception as exc:
+        logger.exception("Stripe event %s failed", event_id)
+        record_failure(event_id, exc)
+        return False
+    return True
+
+
+def record_failure(event_id, exc, retry=True):
+    options = config()
+    event = StripeEvent.objects.get(id=event_id)
+    event.attempts += 1
+    event.last_error = f"{type(exc).__name__}: {exc}"
+    if not retry or event.attempts >= options['MAX_ATTEMPTS']:
+        event.status = StripeEvent.FAILED
+        event.locked_until = None
+    else:
+        delay = options['RETRY_BASE_SECONDS'] * 2 ** (event.attempts - 1)
+        event.locked_until = timezone.now() + timedelta(seconds=delay)
+    event.save(update_fields=['attempts', 'last_error', 'status', 'locked_until'])
+
+
+def drain(batch_size=None):
+    """Claims and applies batches until nothing is due. Returns (processed, failed)."""
+    processed = 0
+    # Events that failed in this pass wait for the next one, even when their backoff is already over
+    failed = set()
+    while True:
+        ids = claim_batch(batch_size, exclude=failed)
+        if not ids:
+            return processed, len(failed)
+        for event_id in ids:
+            if process_event(event_id):
+                processed += 1
+            else:
+                failed.add(event_id)
@@ -1,3 +1,355 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from backend import exports
+from backend.exports import export_response
+from debates.models import Debate
+from .ledger import ledger_totals
+from .models import (
+    CreditPackage, DailyRevenue, DebateRevenue, LedgerSnapshot, MembershipPlan, StripeEvent, Transaction,
+    UserCredit, UserSubscription,
+)
+from .stripe_events import drain
+
+WEBHOOK_SECRET = 'whsec_test'
+
+
+def signed_delivery(event, secret=WEBHOOK_SECRET):
+    """A webhook body and Stripe-Signature header signed like Stripe does, without the network."""
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
+
+
+def stripe_event(event_id, event_type, obj):
+    return {'id': event_id, 'object': 'event', 'type': event_type, 'data': {'object': obj}}
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        self.package = CreditPackage.objects.create(name='Small Pack', credit_amount=50, price=Decimal('4.99'))
+        self.plan = MembershipPlan.objects.create(name='Monthly', plan_type='M', price=Decimal('9.99'), duration_days=30)
+
+    def deliver(self, event, secret=WEBHOOK_SECRET):
+        payload, signature = signed_delivery(event, secret)
+        return self.client.post(
+            reverse('stripe-webhook'), data=payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def credit_checkout(self, event_id='evt_1', event_type='checkout.session.completed', **session):
+        return stripe_event(event_id, event_type, {
+            'id': 'cs_1', 'payment_status': 'paid', 'amount_total': 499,
+            'metadata': {'user_id': str(self.user.id), 'credit_package_id': str(self.package.id)},
+            **session,
+        })
+
+    def test_view_only_stores_the_event(self):
+        response = self.deliver(self.credit_checkout())
+
+        self.assertEqual(response.status_code, 200)
+        event = StripeEvent.objects.get(event_id='evt_1')
+        self.assertEqual(event.status, StripeEvent.PENDING)
+        self.assertEqual(event.event_type, 'checkout.session.completed')
+        self.assertFalse(UserCredit.objects.filter(user=self.user).exists())
+
+    def test_redelivery_is_acknowledged_once(self):
+        self.deliver(self.credit_checkout())
+        response = self.deliver(self.credit_checkout())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_bad_signature_is_rejected(self):
+        response = self.deliver(self.credit_checkout(), secret='whsec_other')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_credit_purchase_is_granted_exactly_once(self):
+        self.deliver(self.credit_checkout())
+        self.assertEqual(drain(), (1, 0))
+        # A second pass, or the same event id arriving again, changes nothing
+        self.deliver(self.credit_checkout())
+        self.assertEqual(drain(), (0, 0))
+
+        self.assertEqual(UserCredit.objects.get(user=self.user).balance, 50)
+        ledger = Transaction.objects.get(user=self.user)
+        self.assertEqual((ledger.transaction_type, ledger.amount, ledger.external_ref), ('CRD', Decimal('4.99'), 'cs_1'))
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.PROCESSED)
+
+    def test_subscription_checkout_and_cancellation(self):
+        self.deliver(stripe_event('evt_sub', 'checkout.session.completed', {
+            'id': 'cs_2', 'payment_status': 'paid', 'amount_total': 999,
+            'metadata': {'user_id': str(self.user.id), 'plan_id': str(self.plan.id)},
+        }))
+        drain()
+        subscription = UserSubscription.objects.get(user=self.user)
+        self.assertTrue(subscription.is_active)
+        self.assertEqual(subscription.plan, self.plan)
+
+        self.deliver(stripe_event('evt_del', 'customer.subscription.deleted', {
+            'id': 'sub_1', 'metadata': {'user_id': str(self.user.id)},
+        }))
+        drain()
+        self.assertFalse(UserSubscription.objects.get(user=self.user).is_active)
+
+    def test_unpaid_session_is_granted_when_the_payment_succeeds(self):
+        self.deliver(self.credit_checkout(payment_status='unpaid'))
+        self.assertEqual(drain(), (1, 0))
+        self.assertFalse(UserCredit.objects.filter(user=self.user).exists())
+
+        self.deliver(self.credit_checkout('evt_2', 'checkout.session.async_payment_succeeded'))
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(UserCredit.objects.get(user=self.user).balance, 50)
+
+    def test_amount_other_than_the_price_is_rejected_without_retries(self):
+        self.deliver(self.credit_checkout(amount_total=1))
+
+        self.assertEqual(drain(), (0, 1))
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (StripeEvent.FAILED, 1))
+        self.assertIn('expected 499', event.last_error)
+        self.assertFalse(UserCredit.objects.filter(user=self.user).exists())
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_unhandled_event_types_are_marked_processed(self):
+        self.deliver(stripe_event('evt_other', 'invoice.created', {'id': 'in_1'}))
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(StripeEvent.objects.get().status, StripeEvent.PROCESSED)
+
+    @override_settings(STRIPE_EVENTS={'MAX_ATTEMPTS': 2, 'RETRY_BASE_SECONDS': 0})
+    def test_failures_roll_back_and_retry_until_given_up(self):
+        self.deliver(self.credit_checkout())
+        with mock.patch.dict('payments.stripe_events.HANDLERS', {'checkout.session.completed': self.fail_after_write}):
+            self.assertEqual(drain(), (0, 1))
+            event = StripeEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), (StripeEvent.PENDING, 1))
+            self.assertIn('RuntimeError', event.last_error)
+
+            self.assertEqual(drain(), (0, 1))
+        event = StripeEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), (StripeEvent.FAILED, 2))
+        # The partial write was rolled back with the status change both times
+        self.assertFalse(Transaction.objects.exists())
+
+    def fail_after_write(self, session):
+        Transaction.objects.create(user=self.user, transaction_type='CRD', amount=Decimal('1.00'))
+        raise RuntimeError("downstream unavailable")
+
+
+class TransactionExportTests(TestCase):
+    def test_csv_cells_that_look_like_formulas_are_escaped(self):
+        user = User.objects.create_user(username='=cmd|calc', password='x')
+        Transaction.objects.create(
+            user=user, transaction_type='DEB', amount=Decimal('-10.00'), external_ref='=HYPERLINK("http://x")',
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='staff', password='x', is_staff=True))
+
+        response = client.get(reverse('transaction-export'), {'output': 'csv'})
+
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn("'=cmd|calc", body)
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', body)
+        # Numbers keep their sign
+        self.assertIn(',-10.00,', body)
+
+    def test_async_export_sends_the_first_page_before_reading_the_next(self):
+        user = User.objects.create_user(username='payer', password='x')
+        for amount in ('1.00', '2.00', '3.00', '4.00', '5.00'):
+            Transaction.objects.create(user=user, transaction_type='CRD', amount=Decimal(amount))
+        columns = {'id': 'id', 'amount': 'amount'}
+        response = export_response(Transaction.objects.all(), columns, 'csv', 'ledger', asynchronous=True, page_size=2)
+
+        async def download():
+            chunks = response.__aiter__()
+            with mock.patch('backend.exports._page', wraps=exports._page) as page:
+                head = [await chunks.__anext__(), await chunks.__anext__()]
+                pages_before_first_rows = page.call_count
+                rest = [chunk async for chunk in chunks]
+            return head, pages_before_first_rows, rest, page.call_count
+
+        (header, first), pages_before_first_rows, rest, pages = async_to_sync(download)()
+
+        self.assertEqual(header, b'id,amount\r\n')
+        self.assertEqual(first.decode().splitlines()[1], f'{Transaction.objects.order_by("pk")[1].pk},2.00')
+        self.assertEqual((pages_before_first_rows, pages), (1, 3))
+        sync_body = b''.join(export_response(Transaction.objects.all(), columns, 'csv', 'ledger').streaming_content)
+        self.assertEqual(b''.join([header, first, *rest]), sync_body)
+
+    def test_export_view_streams_asynchronously_under_asgi(self):
+        Transaction.objects.create(transaction_type='SUB', amount=Decimal('9.99'))
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        token = str(AccessToken.for_user(staff))
+
+        async def download():
+            response = await AsyncClient().get(
+                reverse('transaction-export'), {'output': 'jsonl'}, headers={'Authorization': f'Bearer {token}'},
+            )
+            return response, b''.join([chunk async for chunk in response])
+
+        response, body = async_to_sync(download)()
+
+        self.assertTrue(response.is_async)
+        self.assertEqual(json.loads(body)['amount'], '9.99')
+
+
+class LedgerSnapshotTests(TestCase):
+    TYPES = ['SUB', 'CRD', 'DEB', 'EAR', 'WDR']
+
+    def setUp(self):
+        self.active = User.objects.create_user(username='active', password='x')
+        self.quiet = User.objects.create_user(username='quiet', password='x')
+
+    def record(self, user, transaction_type, amount):
+        Transaction.objects.create(user=user, transaction_type=transaction_type, amount=Decimal(amount))
+
+    def snapshot(self):
+        call_command('snapshot_ledger', '--lag-seconds', '0', stdout=StringIO())
+
+    def assertMatchesFullSum(self, user):
+        expected = {
+            transaction_type: Transaction.objects.filter(user=user, transaction_type=transaction_type)
+            .aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+            for transaction_type in self.TYPES
+        }
+        self.assertEqual(ledger_totals(user, self.TYPES), expected)
+
+    def test_snapshot_plus_tail_equals_the_full_ledger(self):
+        for user in (self.active, self.quiet):
+            self.record(user, 'CRD', '4.99')
+            self.record(user, 'DEB', '-10.00')
+        self.snapshot()
+        self.assertEqual(LedgerSnapshot.objects.count(), 4)
+
+        # After the watermark: more of a snapshotted type, and a type without a snapshot row
+        self.record(self.active, 'DEB', '-10.00')
+        self.record(self.active, 'SUB', '9.99')
+
+        # `quiet` has no rows after the watermark, `active` has a tail
+        for user in (self.active, self.quiet):
+            self.assertMatchesFullSum(user)
+        self.assertEqual(ledger_totals(self.active, ['DEB', 'SUB']), {'DEB': Decimal('-20.00'), 'SUB': Decimal('9.99')})
+
+        self.snapshot()
+        for user in (self.active, self.quiet):
+            self.assertMatchesFullSum(user)
+        self.assertEqual(LedgerSnapshot.objects.get(user=self.active, transaction_type='DEB').row_count, 2)
+
+
+class RevenueRollupTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(username='creator', password='x')
+        self.payer = User.objects.create_user(username='payer', password='x')
+        self.debate = Debate.objects.create(title='Topic', description='...', creator=self.creator)
+
+    def record(self, transaction_type, amount, user=None, debate=None, age_seconds=300):
+        row = Transaction.objects.create(
+            user=user or self.payer, transaction_type=transaction_type, amount=Decimal(amount),
+            debate_id=debate.id if debate else None,
+        )
+        # auto_now_add can't be overridden on create
+        Transaction.objects.filter(pk=row.pk).update(timestamp=timezone.now() - timedelta(seconds=age_seconds))
+        return row
+
+    def paid_join(self, age_seconds=300):
+        self.record('DEB', '-10.00', debate=self.debate, age_seconds=age_seconds)
+        self.record('EAR', '7.50', user=self.creator, debate=self.debate, age_seconds=age_seconds)
+
+    def rollup(self):
+        out = StringIO()
+        call_command('rollup_revenue', stdout=out)
+        return out.getvalue()
+
+    def ledger_sum(self, transaction_type, **filters):
+        return Transaction.objects.filter(transaction_type=transaction_type, **filters).aggregate(
+            total=Sum('amount', default=Decimal('0.00'))
+        )['total']
+
+    def assertRollupsMatchLedger(self):
+        totals = DailyRevenue.objects.aggregate(
+            subscriptions=Sum('subscriptions'), credit_sales=Sum('credit_sales'),
+            debate_fees=Sum('debate_fees'), creator_earnings=Sum('creator_earnings'), paid_joins=Sum('paid_joins'),
+        )
+        self.assertEqual(totals, {
+            'subscriptions': self.ledger_sum('SUB'),
+            'credit_sales': self.ledger_sum('CRD'),
+            'debate_fees': -self.ledger_sum('DEB'),
+            'creator_earnings': self.ledger_sum('EAR'),
+            'paid_joins': Transaction.objects.filter(transaction_type='DEB').count(),
+        })
+        revenue = DebateRevenue.objects.get(debate=self.debate)
+        self.assertEqual(revenue.fees_collected, -self.ledger_sum('DEB', debate_id=self.debate.id))
+        self.assertEqual(revenue.creator_earnings, self.ledger_sum('EAR', debate_id=self.debate.id))
+
+    def test_rollups_match_the_raw_ledger(self):
+        self.record('SUB', '9.99')
+        self.record('CRD', '4.99')
+        self.record('CRD', '19.99', age_seconds=2 * 86400)  # another day
+        self.paid_join()
+        self.paid_join()
+
+        self.rollup()
+
+        self.assertRollupsMatchLedger()
+        self.assertEqual(DebateRevenue.objects.get(debate=self.debate).paid_joins, 2)
+
+    def test_second_run_without_new_rows_changes_nothing(self):
+        self.record('CRD', '4.99')
+        self.paid_join()
+        self.rollup()
+        daily = list(DailyRevenue.objects.values())
+        debate = list(DebateRevenue.objects.values())
+
+        self.assertIn("up to date", self.rollup())
+
+        self.assertEqual(list(DailyRevenue.objects.values()), daily)
+        self.assertEqual(list(DebateRevenue.objects.values()), debate)
+
+    def test_rows_inside_the_lag_wait_for_the_next_run(self):
+        self.paid_join()
+        self.paid_join(age_seconds=0)
+
+        self.rollup()
+        self.assertEqual(DebateRevenue.objects.get(debate=self.debate).paid_joins, 1)
+
+        Transaction.objects.update(timestamp=timezone.now() - timedelta(seconds=300))
+        self.rollup()
+        self.assertEqual(DebateRevenue.objects.get(debate=self.debate).paid_joins, 2)
+        self.assertRollupsMatchLedger()
+
+    def test_commission_due_is_fees_minus_creator_earnings(self):
+        self.assertEqual(self.debate.platform_commission_due(), Decimal('0.00'))
+        self.paid_join()
+        self.paid_join()
+        # Other debates' rows don't count towards this one
+        other = Debate.objects.create(title='Other', description='...', creator=self.creator)
+        self.record('DEB', '-25.00', debate=other)
+
+        self.rollup()
+
+        debate = Debate.objects.get(pk=self.debate.pk)
+        fees = -self.ledger_sum('DEB', debate_id=self.debate.id)
+        earnings = self.ledger_sum('EAR', debate_id=self.debate.id)
+        self.assertEqual(debate.platform_commission_due(), fees - earnings)
+        self.assertEqual(debate.platform_commission_due(), Decimal('5.00'))
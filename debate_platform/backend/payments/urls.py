@@ -3,6 +3,10 @@ from .views import (
     PlanListView, 
     CreditPackageListView, 
     UserCreditView, 
+    TransactionHistoryView,
+    TransactionExportView,
+    LedgerSummaryView,
+    RevenueReportView,
     SubscribeView, # Assuming this exists in your payments/views.py
     BuyCreditsView, # Assuming this exists in your payments/views.py
     # Add other views as they are implemented
@@ -15,6 +19,10 @@ urlpatterns = [
     
     # User Credit Balance
     path('balance/', UserCreditView.as_view(), name='user-credit-balance'),
+    path('transactions/', TransactionHistoryView.as_view(), name='transaction-history'),
+    path('transactions/export/', TransactionExportView.as_view(), name='transaction-export'),
+    path('summary/', LedgerSummaryView.as_view(), name='ledger-summary'),
+    path('revenue/', RevenueReportView.as_view(), name='revenue-report'),
 
     # Purchase/Subscription Actions
     path('subscribe/', SubscribeView.as_view(), name='subscribe'),
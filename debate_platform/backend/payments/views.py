@@ -1,7 +1,18 @@
-from rest_framework import generics, permissions
-from .models import MembershipPlan, CreditPackage, UserCredit
-from .serializers import MembershipPlanSerializer, CreditPackageSerializer, UserCreditSerializer
+from rest_framework import generics, permissions, status
+from datetime import date
+from decimal import Decimal
+from .models import MembershipPlan, CreditPackage, UserCredit, Transaction, DailyRevenue, LedgerCheckpoint
+from .serializers import (
+    MembershipPlanSerializer, CreditPackageSerializer, UserCreditSerializer, TransactionSerializer,
+    DailyRevenueSerializer,
+)
 from rest_framework.views import APIView
+from rest_framework.response import Response
+from backend.exports import StreamingExportView
+from backend.pagination import KeysetPagination
+from .ledger import ledger_totals
+
+MAX_REVENUE_DAYS = 366
 
 
 class PlanListView(generics.ListAPIView):
@@ -26,6 +37,68 @@ class UserCreditView(generics.RetrieveAPIView):
         credit, created = UserCredit.objects.get_or_create(user=self.request.user)
         return credit 
 
+class LedgerSummaryView(APIView):
+    """Per-type totals of the authenticated user's ledger, served from snapshots plus the recent tail."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        types = [code for code, _ in Transaction.TRANSACTION_TYPES]
+        totals = ledger_totals(request.user, types)
+        return Response({code: str(total) for code, total in totals.items()})
+
+class TransactionPagination(KeysetPagination):
+    timestamp_field = 'timestamp'
+
+class TransactionHistoryView(generics.ListAPIView):
+    """Newest-first, cursor-paginated history of the authenticated user's transactions."""
+    serializer_class = TransactionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TransactionPagination
+
+    def get_queryset(self):
+        return Transaction.objects.filter(user=self.request.user)
+
+class TransactionExportView(StreamingExportView):
+    """Streams the ledger as CSV or JSON Lines for finance (see backend.exports for the filters)."""
+    queryset = Transaction.objects.all()
+    columns = {
+        'id': 'id',
+        'timestamp': 'timestamp',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'transaction_type': 'transaction_type',
+        'amount': 'amount',
+        'debate_id': 'debate_id',
+        'external_ref': 'external_ref',
+    }
+    filename = 'transactions'
+    type_field = 'transaction_type'
+
+class RevenueReportView(APIView):
+    """
+    Daily platform revenue for staff, read from the DailyRevenue rollup.
+    Optional ?since=YYYY-MM-DD and ?until=YYYY-MM-DD bound the range; rows
+    newer than the 'revenue_rollup' watermark aren't included yet.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        days = DailyRevenue.objects.all()
+        for param, lookup in (('since', 'date__gte'), ('until', 'date__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    days = days.filter(**{lookup: date.fromisoformat(value)})
+                except ValueError:
+                    return Response({"detail": f"Invalid {param} date."}, status=status.HTTP_400_BAD_REQUEST)
+        days = list(days[:MAX_REVENUE_DAYS])
+        checkpoint = LedgerCheckpoint.objects.filter(name='revenue_rollup').values_list('watermark', flat=True).first()
+        return Response({
+            'watermark': checkpoint or 0,
+            'platform_income': str(sum((day.platform_income for day in days), Decimal('0.00'))),
+            'days': DailyRevenueSerializer(days, many=True).data,
+        })
+
 
 
 # payments/views.py (Append to existing content)
@@ -116,20 +189,22 @@ class BuyCreditsView(APIView):
 
 
 
-# Insert this function into your payments/views.py file
+# --- Stripe Webhook ---
 
+import json
 import stripe
-import os # For accessing environment variables/settings
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
-from django.db import transaction # For database safety
-
-# --- Configuration (Set this in your settings.py or environment variables) ---
-STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
-# ---------------------------------------------------------------------------
+from .models import StripeEvent
 
 @csrf_exempt # CRITICAL: Disables Django's built-in CSRF protection for this endpoint only
 def stripe_webhook_view(request):
+    """
+    Verifies and stores a Stripe event, then acknowledges it. The work itself
+    happens in payments.stripe_events (process_stripe_events), so the response
+    is fast and a redelivered event id is simply acknowledged again.
+    """
     if request.method != 'POST':
         return HttpResponse(status=405) # Method Not Allowed
 
@@ -139,36 +214,17 @@ def stripe_webhook_view(request):
     try:
         # **STEP 1: SECURITY - VERIFY THE SIGNATURE**
         event = stripe.Webhook.construct_event(
-            payload, sig_header, STRIPE_WEBHOOK_SECRET
+            payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
         return HttpResponse('Invalid payload', status=400)
     except stripe.error.SignatureVerificationError as e:
         return HttpResponse('Invalid signature', status=400)
 
-    # **STEP 2: LOGIC - HANDLE THE EVENT**
-    data = event['data']['object']
-
-    if event['type'] == 'checkout.session.completed':
-        session = data
-        
-        # Use a transaction for safety
-        with transaction.atomic():
-            # Get the user_id you passed into the Checkout Session metadata
-            user_id = session.get('metadata', {}).get('user_id') 
-            
-            if user_id:
-                # Find your user and update their status/credits (using the logic from the previous answer)
-                # user = CustomUser.objects.get(id=user_id) 
-                # user.is_premium = True 
-                # user.save()
-                pass # Placeholder for your detailed update logic
-            
-            # TODO: Add logic for granting credits here
-
-    elif event['type'] == 'customer.subscription.deleted':
-        # TODO: Add logic here to set user.is_premium = False
-        pass
+    # **STEP 2: PERSIST - QUEUE THE EVENT (ONCE PER EVENT ID)**
+    StripeEvent.objects.bulk_create([
+        StripeEvent(event_id=event['id'], event_type=event['type'], payload=json.loads(payload))
+    ], ignore_conflicts=True)
 
     # **STEP 3: SUCCESS**
-    return HttpResponse(status=200)
\ No newline at end of file
+    return HttpResponse(status=200)
@@ -1,26 +1,65 @@
 # backend/zag_debate_platform/middleware.py
 
+import time
 from channels.auth import AuthMiddlewareStack
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from channels.db import database_sync_to_async
 # Ensure you have djangorestframework-simplejwt installed:
 from rest_framework_simplejwt.tokens import AccessToken 
 from accounts.models import User # Adjust this import path if needed for your custom User model
 from urllib.parse import parse_qs
+from backend.cache import TTLCache
+
+# Process-local caches so a reconnect wave doesn't re-verify every token and re-read every user
+_cache_settings = getattr(settings, 'WS_AUTH_CACHE', {})
+token_cache = TTLCache(maxsize=_cache_settings.get('MAX_ENTRIES', 10000), ttl=_cache_settings.get('TOKEN_TTL', 300))
+user_cache = TTLCache(maxsize=_cache_settings.get('MAX_ENTRIES', 10000), ttl=_cache_settings.get('USER_TTL', 60))
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Deactivation (is_active=False) or deletion must take effect on the next connect.
+    # QuerySet.update() sends no signal: a user deactivated that way can still connect for
+    # up to USER_TTL seconds unless user_cache.invalidate(str(pk)) is called afterwards.
+    user_cache.invalidate(str(instance.pk))
+
+def decode_token(token_key):
+    """
+    Validates the JWT and returns (user_id, exp), caching the result until the
+    token expires (at most TOKEN_TTL seconds).
+    """
+    claims = token_cache.get(token_key)
+    if claims is TTLCache.MISSING:
+        access_token = AccessToken(token_key)
+        claims = (access_token.payload.get('user_id'), access_token.payload.get('exp'))
+        remaining = claims[1] - time.time() if claims[1] else token_cache.ttl
+        token_cache.set(token_key, claims, ttl=min(token_cache.ttl, max(remaining, 0)))
+    return claims
 
 @database_sync_to_async
-def get_user_from_token(token_key):
+def load_user(user_id):
+    return User.objects.get(id=user_id)
+
+async def get_user_from_token(token_key):
     """
     Attempts to retrieve a user based on a JWT token.
     """
     try:
         # 1. Validate the token and decode the payload
-        access_token = AccessToken(token_key)
-        user_id = access_token.payload.get('user_id')
+        user_id, expires_at = decode_token(token_key)
+        if not user_id or (expires_at and expires_at <= time.time()):
+            return AnonymousUser()
         
-        # 2. Retrieve the user from the database
-        if user_id:
-            return User.objects.get(id=user_id)
+        # 2. Retrieve the user from the cache, or the database on a miss
+        # simplejwt stores the id claim as a string; key the cache the same way
+        user = user_cache.get(str(user_id))
+        if user is TTLCache.MISSING:
+            user = await load_user(user_id)
+            user_cache.set(str(user_id), user)
+        if user.is_active:
+            return user
     except Exception as e:
         # Token is invalid, expired, or user not found
         # print(f"Token resolution error: {e}") # Uncomment for debugging
@@ -48,9 +87,10 @@ class TokenAuthMiddleware:
             # Default to AnonymousUser if no token is present
             scope['user'] = AnonymousUser()
 
-        # Pass the scope down to the next middleware (AuthMiddlewareStack or the Consumer)
+        # Pass the scope down to the consumer
         return await self.inner(scope, receive, send)
 
-# The final stack we export to asgi.py
+# The final stack we export to asgi.py. The session stack runs first so its lazy user
+# can't overwrite (or be resolved onto) the token user that TokenAuthMiddleware sets.
 def TokenAuthMiddlewareStack(inner):
-    return TokenAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+    return AuthMiddlewareStack(TokenAuthMiddleware(inner))
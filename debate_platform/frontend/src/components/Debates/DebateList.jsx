@@ -23,7 +23,8 @@ const DebateList = () => {
             try {
                 // Adjust 'debates/' to your actual API endpoint for listing debates
                 const response = await axiosInstance.get('debates/'); 
-                setDebates(response.data); 
+                // The list endpoint is cursor-paginated: { next, results }
+                setDebates(response.data.results ?? response.data); 
                 setError(null);
             } catch (err) {
                 console.error("Failed to fetch debates:", err);